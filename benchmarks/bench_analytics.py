@@ -0,0 +1,84 @@
+"""
+Offline timing analytics over a synthetic history: three months of daily half-hour sessions for a class of
+students, each 8000 judged notes, summarized in process and in a process pool. A per-row Python loop computing
+only the per-limb mean and std is timed over a sample of sessions as the baseline.
+
+    python -m benchmarks.bench_analytics
+"""
+import os
+import tempfile
+import time
+import numpy as np
+from metronome.game.analytics import find_sessions, summarize_sessions
+from metronome.game.recorder import SessionRecorder, SessionLog, JUDGEMENT_HIT, JUDGEMENT_EXPIRED
+
+
+def write_session(session_dir, student, rng, num_notes=8000, bpm=100):
+    """
+    A session recorded in one go: targets on eighths, hits with a gaussian error that drifts with the tempo
+    """
+    recorder = SessionRecorder(session_dir, header={'exercise': 'synthetic', 'student': student,
+                                                   'patterns': ['a', 'b', 'c'], 'bpm': bpm}).start()
+    beats = np.arange(num_notes) * 0.5
+    channels = rng.integers(0, 4, num_notes).astype(np.int8)
+    recorder.record_targets(0, beats, channels, np.repeat(np.arange(3), -(-num_notes // 3))[:num_notes])
+    bpms = bpm + 5 * (np.arange(num_notes) // 500)
+    for at_beat, at_bpm in zip(beats[::500], bpms[::500]):
+        recorder.record_tempo(at_beat * 60.0 / at_bpm, at_beat, at_bpm)
+    times = beats * 60.0 / bpms
+    errors = rng.normal(0.002 * (bpms - bpm), 0.03, num_notes)
+    kinds = np.where(rng.random(num_notes) < 0.05, JUDGEMENT_EXPIRED, JUDGEMENT_HIT)
+    errors[kinds == JUDGEMENT_EXPIRED] = np.nan
+    recorder.record_judgement(times, beats + np.nan_to_num(errors), channels, np.arange(num_notes), errors, kinds)
+    recorder.close()
+
+
+def python_summary(session_dirs):
+    """
+    Per-limb mean and std of the error, row by row
+    """
+    sums = {}
+    for session_dir in session_dirs:
+        judgements = SessionLog(session_dir)['judgements']
+        for kind, channel, error in zip(judgements['kind'].tolist(), judgements['channel'].tolist(),
+                                        judgements['error'].tolist()):
+            if kind != JUDGEMENT_HIT:
+                continue
+            count, total, squares = sums.get(channel, (0, 0.0, 0.0))
+            sums[channel] = (count + 1, total + error, squares + error * error)
+    return {channel: (total / count, (squares / count - (total / count) ** 2) ** 0.5)
+            for channel, (count, total, squares) in sums.items()}
+
+
+def run(num_students=20, num_days=90):
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        for student_idx in range(num_students):
+            for day in range(num_days):
+                write_session(os.path.join(tmp_dir, f"student_{student_idx}", f"day_{day:03d}"),
+                              f"student_{student_idx}", rng)
+        print(f"wrote {num_students * num_days} sessions in {time.perf_counter() - start:.1f} s")
+        start = time.perf_counter()
+        session_dirs = find_sessions(tmp_dir)
+        print(f"{'find_sessions':<28} {(time.perf_counter() - start) * 1e3:>9.1f} ms")
+        num_notes = sum(len(SessionLog(session_dir)) for session_dir in session_dirs[:10]) / 10 * len(session_dirs)
+        sample = session_dirs[:50]
+        start = time.perf_counter()
+        python_summary(sample)
+        elapsed = (time.perf_counter() - start) / len(sample) * len(session_dirs)
+        print(f"{'python loop (extrapolated)':<28} {elapsed * 1e3:>9.1f} ms, {num_notes / elapsed / 1e6:.1f} M notes/s")
+        for processes in (0, None):
+            start = time.perf_counter()
+            students = summarize_sessions(session_dirs, processes=processes)
+            elapsed = time.perf_counter() - start
+            label = 'in process' if processes == 0 else f"pool of {os.cpu_count()}"
+            print(f"{label:<28} {elapsed * 1e3:>9.1f} ms, {num_notes / elapsed / 1e6:.1f} M notes/s, "
+                  f"{len(students)} students")
+        report = students['student_0'].report()
+        print(f"student_0: {report['sessions']} sessions, std {report['consistency']['std_ms']:.1f} ms, "
+              f"trend {report['tempo']['slope_ms_per_bpm']:+.2f} ms/BPM")
+
+
+if __name__ == '__main__':
+    run()
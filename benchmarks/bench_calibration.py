@@ -0,0 +1,49 @@
+"""
+Accuracy of the calibration fit on simulated passes: a player with known per-channel latencies and 8 ms of timing
+jitter taps 64 stimuli, with a growing share of taps replaced by wild ones (early, late, doubled). Reports the
+worst error of the fitted offsets against the true latencies, for the outlier-rejecting fit and for a plain mean
+of the nearest-stimulus delays, and how long a fit takes.
+
+    python -m benchmarks.bench_calibration
+"""
+import time
+import numpy as np
+from metronome.game.calibration import fit_channel_offsets
+
+
+def simulate_pass(rng, latencies, outlier_rate, num_stimuli=64, period=0.5, jitter=0.008):
+    num_channels = len(latencies)
+    stimulus_times = np.arange(num_stimuli) * period
+    channels = np.arange(num_stimuli) * num_channels // num_stimuli
+    hit_times = stimulus_times + np.asarray(latencies)[channels] + rng.normal(0.0, jitter, num_stimuli)
+    wild = rng.random(num_stimuli) < outlier_rate
+    hit_times[wild] = stimulus_times[wild] + rng.uniform(-0.2, 0.24, np.count_nonzero(wild))
+    return stimulus_times, hit_times, channels
+
+
+def plain_mean(stimulus_times, hit_times, hit_channels, num_channels):
+    nearest = np.abs(hit_times[:, None] - stimulus_times[None, :]).argmin(axis=1)
+    delays = hit_times - stimulus_times[nearest]
+    return np.array([delays[hit_channels == channel].mean() for channel in range(num_channels)])
+
+
+def run(num_passes=200):
+    rng = np.random.default_rng(0)
+    latencies = [0.025, 0.040, 0.055, 0.070]
+    print(f"{'outliers':>8} {'fit max err ms':>15} {'mean max err ms':>16} {'fit us':>7}")
+    for outlier_rate in (0.0, 0.05, 0.1, 0.2, 0.3):
+        fit_errors, mean_errors, elapsed = [], [], 0.0
+        for _ in range(num_passes):
+            stimulus_times, hit_times, channels = simulate_pass(rng, latencies, outlier_rate)
+            start = time.perf_counter()
+            offsets, _ = fit_channel_offsets(stimulus_times, hit_times, channels, num_channels=len(latencies))
+            elapsed += time.perf_counter() - start
+            fit_errors.append(np.nanmax(np.abs(offsets - latencies)))
+            mean_errors.append(np.max(np.abs(plain_mean(stimulus_times, hit_times, channels, len(latencies))
+                                             - latencies)))
+        print(f"{outlier_rate:>8.0%} {np.mean(fit_errors) * 1e3:>15.2f} {np.mean(mean_errors) * 1e3:>16.2f} "
+              f"{elapsed / num_passes * 1e6:>7.0f}")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,47 @@
+"""
+Headless simulation speed of the game engine: every exercise in the library played through by a bot
+at 60 updates per simulated second, reported as a multiple of real time, with the number of garbage collector passes
+(all generations) it triggered.
+
+    python -m benchmarks.bench_engine
+"""
+import gc
+import time
+from metronome.exercise.exercise import ExerciseFactory
+from metronome.exercise.timeline import Timeline
+from metronome.game.bot import BotPlayer
+from metronome.game.clock import ManualClock
+from metronome.game.engine import GameEngine
+
+
+def bench(exercise, bpm=100, num_loops=1, frame_time=1.0 / 60.0, timing_error=0.01):
+    clock = ManualClock()
+    engine = GameEngine(timeline=Timeline.compile(exercise), bpm=bpm, beats_on_screen=8, hit_window=0.1, clock=clock)
+    BotPlayer(timing_error=timing_error, seed=0).attach(engine)
+    collections = sum(stat['collections'] for stat in gc.get_stats())
+    start = time.perf_counter()
+    num_frames = 0
+    while engine.completed_loops < num_loops:
+        clock.advance(frame_time)
+        engine.update()
+        num_frames += 1
+    elapsed = time.perf_counter() - start
+    collections = sum(stat['collections'] for stat in gc.get_stats()) - collections
+    return clock.now(), elapsed, num_frames, collections, engine
+
+
+def run():
+    factory = ExerciseFactory()
+    print(f"{'exercise':<40} {'sim s':>8} {'wall ms':>8} {'us/frame':>9} {'x real':>8} {'score':>6} {'misses':>6} {'gc':>5}")
+    total_sim, total_wall = 0.0, 0.0
+    for name in factory.list_names():
+        sim_time, elapsed, num_frames, collections, engine = bench(factory.by_name(name))
+        total_sim += sim_time
+        total_wall += elapsed
+        print(f"{name[:40]:<40} {sim_time:>8.1f} {elapsed * 1e3:>8.1f} {elapsed / num_frames * 1e6:>9.1f} "
+              f"{sim_time / elapsed:>7.0f}x {engine.score:>6} {engine.misses:>6} {collections:>5}")
+    print(f"{'all exercises':<40} {total_sim:>8.1f} {total_wall * 1e3:>8.1f} {'':>9} {total_sim / total_wall:>7.0f}x")
+
+
+if __name__ == '__main__':
+    run()
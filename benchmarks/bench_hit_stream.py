@@ -0,0 +1,58 @@
+"""
+Load test of the reader thread, hit ring buffer and judge path against the pty Arduino simulator.
+The consumer drains once per 60 Hz frame and judges every hit through EntityStore.judge, like
+GameEngine.check_inputs, with target beats in seconds so that the simulator's hit times can be judged as they are.
+
+    python -m benchmarks.bench_hit_stream
+"""
+import time
+import numpy as np
+from metronome.arduino.arduino_threaded import ArduinoController
+from metronome.arduino.simulator import ArduinoSimulator, generated_hits
+from metronome.game.entities import EntityStore
+
+
+def bench(rate, binary, duration=2.0, frame_time=1 / 60.0):
+    capabilities = ['bin1', 'sync'] if binary else ['sync']
+    simulator = ArduinoSimulator(capabilities=capabilities, jitter=0.0002, seed=0)
+    controller = ArduinoController(port=simulator.start(), read_timeout=0.02, hit_buffer_size=8192,
+                                   stale_after=0.25, sync_interval=0.25)
+    controller.connect()
+    simulator.send_ready()
+    time.sleep(0.6)
+    hits = list(generated_hits(rate=rate, duration=duration))
+    start = time.perf_counter() + 0.1
+    store = EntityStore(capacity=len(hits))
+    store.spawn_targets(beats=np.array([start + hit.offset for hit in hits]), channels=[hit.channel for hit in hits])
+    simulator.play(hits, start_delay=0.1)
+    received, judged, drain_cost, frames = 0, 0, 0.0, 0
+    while simulator.play_thread.is_alive() or received < len(hits):
+        time.sleep(frame_time)
+        frame_start = time.perf_counter()
+        batch = controller.drain_hits()
+        for hit in batch:
+            if store.judge(hit.channel, hit.time, window=0.01) >= 0:
+                judged += 1
+        drain_cost += time.perf_counter() - frame_start
+        received += len(batch)
+        frames += 1
+        if time.perf_counter() > start + duration + 1.0:
+            break
+    stats = controller.hit_stats()
+    controller.disconnect()
+    simulator.stop()
+    return {'received': received, 'judged': judged, 'dropped': stats['dropped'], 'stale': stats['stale'],
+            'frame_ms': drain_cost / frames * 1000.0, 'per_hit_us': drain_cost / max(received, 1) * 1e6}
+
+
+def run():
+    for binary in (False, True):
+        for rate in (1000, 5000, 10000):
+            result = bench(rate, binary)
+            print(f"{'binary' if binary else 'text':>6} {rate:>6} hits/s: received={result['received']} "
+                  f"judged={result['judged']} dropped={result['dropped']} stale={result['stale']} "
+                  f"drain+judge={result['frame_ms']:.3f} ms/frame ({result['per_hit_us']:.2f} us/hit)")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of the per-hit judging cost of EntityStore.judge, the path the engine runs.
+Compares a linear scan over every live target, a scan of every channel's targets within the window (how the store
+judged before it kept per-channel indices), and the per-channel bisect, as the notes around the hit get denser.
+
+    python -m benchmarks.bench_judge
+"""
+import random
+import time
+import numpy as np
+from metronome.game.entities import EntityStore
+
+
+def make_store(num_targets, num_channels=4, notes_per_beat=8.0):
+    store = EntityStore(capacity=num_targets, num_channels=num_channels)
+    store.spawn_targets(beats=np.arange(num_targets) / notes_per_beat, channels=np.arange(num_targets) % num_channels)
+    return store
+
+
+def linear_judge(store, channel, beat, window):
+    targets = store.targets
+    for idx, (target_beat, target_channel, hit) in enumerate(zip(targets['beat'].tolist(),
+                                                                 targets['channel'].tolist(),
+                                                                 targets['hit'].tolist())):
+        if target_channel == channel and not hit and abs(target_beat - beat) < window:
+            targets.columns['hit'][targets.head + idx] = True
+            return targets.head + idx
+    return -1
+
+
+def window_judge(store, channel, beat, window):
+    targets = store.targets
+    start, stop = targets.search(beat - window, side='right'), targets.search(beat + window)
+    if start >= stop:
+        return -1
+    candidates = ((targets.columns['channel'][start:stop] == channel)
+                  & ~targets.columns['hit'][start:stop]).nonzero()[0]
+    if len(candidates) == 0:
+        return -1
+    idx = start + int(candidates[np.argmin(np.abs(targets.beat[start:stop][candidates] - beat))])
+    targets.columns['hit'][idx] = True
+    return idx
+
+
+def bench(judge, num_targets, hits, window):
+    store = make_store(num_targets)
+    start = time.perf_counter()
+    for channel, beat in hits:
+        judge(store, channel, beat, window)
+    return (time.perf_counter() - start) / len(hits) * 1e6
+
+
+def run(window=0.1):
+    rng = random.Random(0)
+    print(f"{'live targets':>12} {'notes/window':>13} {'linear us/hit':>14} {'window us/hit':>14} "
+          f"{'channel us/hit':>15}")
+    for num_targets, notes_per_beat in ((100, 8.0), (1000, 8.0), (4000, 80.0), (16000, 800.0)):
+        end_beat = num_targets / notes_per_beat
+        hits = [(rng.randrange(4), rng.uniform(0.0, end_beat)) for _ in range(max(2000, 200000 // num_targets))]
+        timings = [bench(judge, num_targets, hits, window) for judge in (linear_judge, window_judge)]
+        timings.append(bench(lambda store, channel, beat, window: store.judge(channel, beat, window),
+                             num_targets, hits, window))
+        print(f"{num_targets:>12} {2 * window * notes_per_beat:>13.0f} {timings[0]:>14.2f} {timings[1]:>14.2f} "
+              f"{timings[2]:>15.2f}")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,123 @@
+"""
+Cost of getting at the exercise library, on a generated library of thousands of exercises:
+parsing the TSV (what every ExerciseFactory() used to do), a cold load that parses and writes the cache,
+a new process loading the memory-mapped cache, a factory in a process that already loaded it,
+and entering a game (by_name plus its Timeline).
+Then the streaming parser: time and peak memory to list names and to parse every exercise, against the old
+read-everything-then-split parse. Then the catalog on a larger library: building its indexes, name lookups and filtered listings.
+
+    python -m benchmarks.bench_library
+"""
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from metronome.exercise.exercise import Exercise, ExerciseFactory
+from metronome.exercise.library import ExerciseLibrary, loaded_libraries
+from metronome.exercise.parser import ExerciseParser
+
+
+def generate_library(fpath, num_exercises, source_fpath='./data/exercises.tsv'):
+    """
+    Write a library of num_exercises by cycling through the blocks of the bundled one under new names
+    """
+    with open(source_fpath, 'r') as fp:
+        blocks = ['!!!' + block for block in fp.read().split('!!!')[1:]]
+    with open(fpath, 'w') as fp:
+        for idx in range(num_exercises):
+            block = blocks[idx % len(blocks)]
+            name_end = block.index('\t', 4)
+            fp.write(f"!!!\tGenerated {idx} {block[4:name_end]}{block[name_end:].rstrip()}\n")
+    return fpath
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1e3, result
+
+
+def run():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print(f"{'exercises':>9} {'MB':>6} {'parse ms':>9} {'cold ms':>9} {'new proc ms':>12} {'factory ms':>11} "
+              f"{'enter game ms':>14}")
+        for num_exercises in (100, 1000, 5000):
+            fpath = generate_library(os.path.join(tmp_dir, f'library_{num_exercises}.tsv'), num_exercises)
+            size_mb = os.path.getsize(fpath) / 1e6
+            parse_ms, _ = timed(lambda: ExerciseLibrary.from_tsv(fpath))
+            cold_ms, _ = timed(lambda: ExerciseFactory(csv_fpath=fpath))
+
+            def new_process():
+                loaded_libraries.clear()
+                return ExerciseFactory(csv_fpath=fpath)
+
+            new_process_ms, _ = timed(new_process, repeat=5)
+            factory_ms, factory = timed(lambda: ExerciseFactory(csv_fpath=fpath), repeat=100)
+            name = factory.list_names()[num_exercises // 2]
+            enter_ms, _ = timed(lambda: (ExerciseFactory(csv_fpath=fpath).by_name(name),
+                                         ExerciseFactory(csv_fpath=fpath).timeline(name)), repeat=100)
+            print(f"{num_exercises:>9} {size_mb:>6.1f} {parse_ms:>9.1f} {cold_ms:>9.1f} {new_process_ms:>12.2f} "
+                  f"{factory_ms:>11.3f} {enter_ms:>14.3f}")
+        run_parser(tmp_dir)
+        run_catalog(tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def traced(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed * 1e3, peak / 1e6
+
+
+def read_and_split(fpath):
+    """
+    How the library used to be parsed, every exercise held at once
+    """
+    with open(fpath, 'r') as fp:
+        exercise_lines = '\n'.join(fp.readlines())
+    return [Exercise.from_tsv(group) for group in exercise_lines.split('!!!')[1:]]
+
+
+def run_parser(tmp_dir):
+    print(f"\n{'exercises':>9} {'MB':>6} {'names ms':>9} {'names MB':>9} {'stream ms':>10} {'stream MB':>10} "
+          f"{'split ms':>9} {'split MB':>9}")
+    for num_exercises in (1000, 5000):
+        fpath = os.path.join(tmp_dir, f'library_{num_exercises}.tsv')
+        names_ms, names_mb = traced(lambda: sum(1 for _ in ExerciseParser(fpath).names()))
+        stream_ms, stream_mb = traced(lambda: sum(1 for _ in ExerciseParser(fpath).exercises()))
+        split_ms, split_mb = traced(lambda: read_and_split(fpath))
+        print(f"{num_exercises:>9} {os.path.getsize(fpath) / 1e6:>6.1f} {names_ms:>9.1f} {names_mb:>9.2f} "
+              f"{stream_ms:>10.1f} {stream_mb:>10.2f} {split_ms:>9.1f} {split_mb:>9.1f}")
+
+
+def run_catalog(tmp_dir, num_exercises=20000):
+    fpath = generate_library(os.path.join(tmp_dir, f'library_{num_exercises}.tsv'), num_exercises)
+    factory = ExerciseFactory(csv_fpath=fpath)
+    catalog = factory.library.catalog
+    build_ms, _ = timed(catalog.build)
+    name = factory.list_names()[-1]
+    queries = {'by_name (last)': lambda: factory.by_name(name) and None,
+               'index_of': lambda: catalog.index_of(name),
+               'skills=double_bass': lambda: catalog.select(skills=['double_bass']),
+               'tags=triplets, limbs=left_hand': lambda: catalog.select(tags=['triplets'], limbs=['left_hand']),
+               'skills=singles,speed, subdiv<=4': lambda: catalog.select(skills=['singles', 'speed'], max_subdivision=4),
+               'notes_per_bar 12-16': lambda: catalog.select(min_notes_per_bar=12, max_notes_per_bar=16),
+               'list_names(skills=paradiddles)': lambda: factory.list_names(skills=['paradiddles'])}
+    print(f"\ncatalog of {num_exercises} exercises built in {build_ms:.0f} ms")
+    print(f"{'query':>34} {'results':>8} {'ms':>8}")
+    for label, query in queries.items():
+        query_ms, result = timed(query, repeat=200)
+        count = 1 if result is None or isinstance(result, int) else len(result)
+        print(f"{label:>34} {count:>8} {query_ms:>8.3f}")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,69 @@
+"""
+Overhead of the frame profiler: the cost of one timed phase, disabled and enabled, and the frame time of
+GameUI.update_and_draw with a bot playing, with the profiler disabled (the default), enabled, and enabled with the
+overlay on screen. Runs headless on SDL's dummy video driver.
+
+    python -m benchmarks.bench_profiler
+"""
+import os
+import time
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+from config import Config
+from metronome.game.bot import BotPlayer
+from metronome.game.clock import ManualClock
+from metronome.game.profiler import FrameProfiler
+from metronome.ui.scrolling import GameUI
+
+
+class IdleInput:
+    running = True
+
+    def drain_hits(self):
+        return []
+
+
+def bench_phase(profiler, num_calls=200000):
+    phase = profiler.phase
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        with phase('update'):
+            pass
+    return (time.perf_counter() - start) / num_calls * 1e9
+
+
+def bench_frames(window, profiler, overlay, exercise_name='Hand-To-Hand (Simplified)', num_frames=1200, repeat=5):
+    show_overlay, Config.PROFILE_OVERLAY = Config.PROFILE_OVERLAY, overlay
+    try:
+        game = GameUI(window=window, hit_collector=IdleInput(), exercise_name=exercise_name, bpm=120,
+                      beats_on_screen=8, profiler=profiler)
+    finally:
+        Config.PROFILE_OVERLAY = show_overlay
+    clock = ManualClock()
+    game.engine.clock = clock
+    BotPlayer(timing_error=0.01, seed=0).attach(game.engine)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(num_frames):
+            clock.advance(1.0 / 60.0)
+            game.update_and_draw()
+        best = min(best, (time.perf_counter() - start) / num_frames * 1e6)
+    return best
+
+
+def run():
+    print(f"{'one phase, disabled':<28} {bench_phase(FrameProfiler(enabled=False)):>8.0f} ns")
+    print(f"{'one phase, enabled':<28} {bench_phase(FrameProfiler()):>8.0f} ns")
+    pygame.init()
+    pygame.mixer.init()
+    window = pygame.display.set_mode((1800, 1000))
+    for label, profiler, overlay in (('disabled', None, False), ('enabled', FrameProfiler(), False),
+                                     ('enabled with overlay', FrameProfiler(), True)):
+        print(f"{'frame, ' + label:<28} {bench_frames(window, profiler, overlay):>8.1f} us")
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    run()
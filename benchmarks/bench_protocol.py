@@ -0,0 +1,31 @@
+"""
+Per-hit decode cost and wire size of the text protocol versus binary hit frames.
+
+    python -m benchmarks.bench_protocol
+"""
+import time
+from metronome.arduino.arduino_threaded import ArduinoController
+from metronome.arduino.protocol import FrameDecoder, encode_hit_frame
+
+
+def run(num_hits=100000):
+    text = b''.join(f"h{idx % 4}a{(idx * 7) % 1000 / 10.0}\n".encode() for idx in range(num_hits))
+    frames = b''.join(encode_hit_frame(channel=idx % 4, amplitude=(idx * 7) % 1000 / 10.0, device_time=idx * 125)
+                      for idx in range(num_hits))
+    # What the text protocol would need to carry the same device timestamp as a binary frame
+    stamped_size = sum(len(f"h{idx % 4}a{(idx * 7) % 1000 / 10.0}t{idx * 125 + 10 ** 8}\n") for idx in range(num_hits))
+    start = time.perf_counter()
+    hits = [ArduinoController.parse_hit_msg(line.decode().strip(), 0.0) for line in text.split(b'\n') if line]
+    text_us = (time.perf_counter() - start) / num_hits * 1e6
+    assert len(hits) == num_hits
+    start = time.perf_counter()
+    batch = FrameDecoder().feed(frames, 0.0)
+    binary_us = (time.perf_counter() - start) / num_hits * 1e6
+    assert len(batch) == num_hits
+    print(f"  text: {len(text) / num_hits:.1f} bytes/hit ({stamped_size / num_hits:.1f} with a timestamp), "
+          f"{text_us:.3f} us/hit decode")
+    print(f"binary: {len(frames) / num_hits:.1f} bytes/hit, {binary_us:.3f} us/hit decode")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,75 @@
+"""
+Cost of recording a session: an hour of play simulated by a bot at 60 updates per simulated second, with and without
+a SessionRecorder, reported as engine time per frame, time per queue put on the game thread and size of the log.
+The log is then opened as a SessionLog and a whole column is read back.
+
+    python -m benchmarks.bench_recorder
+"""
+import os
+import tempfile
+import time
+import numpy as np
+from metronome.exercise.exercise import ExerciseFactory
+from metronome.exercise.timeline import Timeline
+from metronome.game.bot import BotPlayer
+from metronome.game.clock import ManualClock
+from metronome.game.engine import GameEngine
+from metronome.game.recorder import SessionRecorder, SessionLog
+
+
+def bench(exercise, session_root=None, duration=3600.0, bpm=100, frame_time=1.0 / 60.0):
+    clock = ManualClock()
+    engine = GameEngine(timeline=Timeline.compile(exercise), bpm=bpm, bpm_step=0, beats_on_screen=8, hit_window=0.1,
+                        clock=clock)
+    BotPlayer(timing_error=0.01, miss_rate=0.05, seed=0).attach(engine)
+    recorder = None
+    if session_root is not None:
+        recorder = SessionRecorder.for_engine(engine, session_root, exercise.name)
+    num_frames = int(duration / frame_time)
+    start = time.perf_counter()
+    for _ in range(num_frames):
+        clock.advance(frame_time)
+        engine.update()
+    elapsed = time.perf_counter() - start
+    if recorder is not None:
+        recorder.close()
+    return elapsed, num_frames, engine, recorder
+
+
+def bench_put(recorder, num_calls=200000):
+    beats, channels = np.arange(8, dtype=np.float64), np.zeros(8, dtype=np.int8)
+    start = time.perf_counter()
+    for idx in range(num_calls):
+        recorder.record_judgement(float(idx), float(idx), 0, idx, 0.0, 0)
+    judgement = time.perf_counter() - start
+    start = time.perf_counter()
+    for idx in range(num_calls):
+        recorder.record_targets(idx * 8, beats, channels)
+    targets = time.perf_counter() - start
+    return judgement / num_calls, targets / num_calls
+
+
+def run():
+    exercise = ExerciseFactory().by_name('Hand-To-Hand')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        elapsed, num_frames, _, _ = bench(exercise)
+        print(f"{'no recorder':<24} {elapsed / num_frames * 1e6:>8.1f} us/frame")
+        elapsed, num_frames, engine, recorder = bench(exercise, session_root=tmp_dir)
+        stats = recorder.stats()
+        print(f"{'recorder':<24} {elapsed / num_frames * 1e6:>8.1f} us/frame, rows {stats['rows']}, "
+              f"{stats['bytes'] / 1e6:.2f} MB for {num_frames / 3600 / 60:.0f} h")
+        start = time.perf_counter()
+        log = SessionLog(recorder.session_dir)
+        errors = log['judgements']['error']
+        mean_error = float(np.nanmean(errors))
+        print(f"{'open and scan errors':<24} {(time.perf_counter() - start) * 1e3:>8.2f} ms, {len(log)} judgements, "
+              f"mean error {mean_error:+.4f} beats")
+        put_recorder = SessionRecorder(os.path.join(tmp_dir, 'puts')).start()
+        judgement, targets = bench_put(put_recorder)
+        put_recorder.close()
+        print(f"{'record_judgement':<24} {judgement * 1e9:>8.0f} ns/call")
+        print(f"{'record_targets':<24} {targets * 1e9:>8.0f} ns/call")
+
+
+if __name__ == '__main__':
+    run()
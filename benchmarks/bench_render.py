@@ -0,0 +1,97 @@
+"""
+Frame time of GameUI.update_and_draw with full redraws and flips versus dirty-rect compositing,
+on the full 1800x1000 window with a bot playing. Runs headless on SDL's dummy video driver unless told otherwise,
+which leaves out the cost of the display push itself, so run it on the target machine's real display as well:
+
+    python -m benchmarks.bench_render
+    SDL_VIDEODRIVER=x11 python -m benchmarks.bench_render
+
+The second table draws a dense screen of notes with one draw call per circle and label, as GameUI used to,
+against one blits call over the pre-rendered sprites.
+"""
+import os
+import random
+import time
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+from metronome.game.bot import BotPlayer
+from metronome.game.clock import ManualClock
+from metronome.ui.colors import *
+from metronome.ui.scrolling import GameUI, LANE_Y
+from metronome.ui.sprites import SpriteAtlas, TARGET_RADIUS
+from metronome.ui.text_cache import render_text
+
+
+class IdleInput:
+    running = True
+
+    def drain_hits(self):
+        return []
+
+
+def bench(window, full_flip, exercise_name, num_frames=1200, bpm=120):
+    game = GameUI(window=window, hit_collector=IdleInput(), exercise_name=exercise_name, bpm=bpm, beats_on_screen=8)
+    game.compositor.full_flip = full_flip
+    clock = ManualClock()
+    game.engine.clock = clock
+    BotPlayer(timing_error=0.01, seed=0).attach(game.engine)
+    frame_times = []
+    for _ in range(num_frames):
+        clock.advance(1.0 / 60.0)
+        start = time.perf_counter()
+        game.update_and_draw()
+        frame_times.append(time.perf_counter() - start)
+    game.close()
+    frame_times.sort()
+    return (sum(frame_times) / num_frames * 1e3, frame_times[int(num_frames * 0.95)] * 1e3,
+            game.compositor.stats()['mean_pushed_fraction'])
+
+
+def draw_per_object(window, notes):
+    for x, y, channel, hit in notes:
+        pygame.draw.circle(window, LIGHT_BLUE, (x, y), 12)
+        if hit is True:
+            pygame.draw.circle(window, BLACK, (x, y), 10)
+        else:
+            window.blit(render_text("R" if channel % 2 == 0 else "L", 24, BLACK), (x - 6, y - 7))
+
+
+def draw_batched(window, atlas, notes):
+    window.blits([(atlas.target(channel, hit), (x - TARGET_RADIUS, y - TARGET_RADIUS)) for x, y, channel, hit in notes])
+
+
+def bench_notes(window, num_notes, num_frames=200):
+    rng = random.Random(0)
+    width = window.get_width()
+    notes = [(rng.randrange(width), LANE_Y[idx % 4], idx % 4, rng.random() < 0.3) for idx in range(num_notes)]
+    atlas = SpriteAtlas()
+    timings = []
+    for draw in (lambda: draw_per_object(window, notes), lambda: draw_batched(window, atlas, notes)):
+        start = time.perf_counter()
+        for _ in range(num_frames):
+            draw()
+        timings.append((time.perf_counter() - start) / num_frames * 1e3)
+    return timings
+
+
+def run():
+    pygame.init()
+    pygame.mixer.init()
+    window = pygame.display.set_mode((1800, 1000))
+    print(f"video driver: {pygame.display.get_driver()}")
+    print(f"{'exercise':<28} {'mode':<6} {'mean ms':>8} {'p95 ms':>8} {'pushed':>7} {'max fps':>8}")
+    for exercise_name in ('Hand-To-Hand (Simplified)', 'Rudiments'):
+        for full_flip in (True, False):
+            mean_ms, p95_ms, pushed = bench(window, full_flip, exercise_name)
+            print(f"{exercise_name[:28]:<28} {'flip' if full_flip else 'dirty':<6} {mean_ms:>8.3f} {p95_ms:>8.3f} "
+                  f"{pushed:>6.0%} {1e3 / mean_ms:>8.0f}")
+    print(f"{'notes on screen':>15} {'per-object ms':>14} {'batched ms':>11} {'speedup':>8}")
+    for num_notes in (50, 200, 500, 1000):
+        per_object_ms, batched_ms = bench_notes(window, num_notes)
+        print(f"{num_notes:>15} {per_object_ms:>14.3f} {batched_ms:>11.3f} {per_object_ms / batched_ms:>7.1f}x")
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    run()
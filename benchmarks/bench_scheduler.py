@@ -0,0 +1,83 @@
+"""
+CPU use and beat timing of the main loop with a bot playing in real time:
+uncapped (update and draw as fast as possible, as run() used to), capped at 60 FPS with pygame.time.Clock
+(the usual quick fix, logic only advances once a frame), and the FrameScheduler (1 kHz logic, 120 FPS rendering).
+Click lateness is how long after a beat line's scheduled time the game noticed it and played the click.
+
+    python -m benchmarks.bench_scheduler
+"""
+import os
+import time
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+from metronome.game.bot import BotPlayer
+from metronome.game.scheduler import FrameScheduler
+
+
+class IdleInput:
+    running = True
+
+    def drain_hits(self):
+        return []
+
+
+def make_game(window):
+    # Imported here so that the dummy drivers are set before pygame initialises anything
+    from metronome.ui.scrolling import GameUI
+    game = GameUI(window=window, hit_collector=IdleInput(), exercise_name='Rudiments', bpm=120, beats_on_screen=8)
+    BotPlayer(timing_error=0.01, seed=0).attach(game.engine)
+    click_lateness = []
+    engine_update = game.engine.update
+
+    def timed_update(now=None):
+        clicks = engine_update(now=now)
+        now = game.engine.clock.now()
+        # The lines just clicked are the last len(clicks) before the click position, still live in the store
+        entities = game.engine.entities
+        beats = entities.lines.beat[entities.clicked - len(clicks):entities.clicked].tolist()
+        click_lateness.extend(now - game.engine.tempo.time_at(beat) for beat in beats)
+        return clicks
+
+    game.engine.update = timed_update
+    return game, click_lateness
+
+
+def bench(window, duration, mode):
+    game, click_lateness = make_game(window)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    frames = 0
+    if mode == 'scheduled':
+        scheduler = FrameScheduler(logic_rate=1000.0, target_fps=120.0)
+        scheduler.run(logic=lambda now: game.update(current_time=now) or time.perf_counter() - wall_start < duration,
+                      render=game.draw)
+        frames = scheduler.frames
+    else:
+        frame_clock = pygame.time.Clock()
+        while time.perf_counter() - wall_start < duration:
+            game.update_and_draw()
+            frames += 1
+            if mode == 'capped':
+                frame_clock.tick(60)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    game.close()
+    click_lateness.sort()
+    return {'cpu': cpu / wall, 'fps': frames / wall, 'clicks': len(click_lateness),
+            'late_p50_ms': click_lateness[len(click_lateness) // 2] * 1e3,
+            'late_max_ms': click_lateness[-1] * 1e3}
+
+
+def run(duration=15.0):
+    pygame.init()
+    pygame.mixer.init()
+    window = pygame.display.set_mode((1800, 1000))
+    print(f"{'loop':<10} {'cpu':>6} {'fps':>7} {'clicks':>7} {'late p50 ms':>12} {'late max ms':>12}")
+    for mode in ('uncapped', 'capped', 'scheduled'):
+        result = bench(window, duration, mode)
+        print(f"{mode:<10} {result['cpu']:>6.0%} {result['fps']:>7.0f} "
+              f"{result['clicks']:>7} {result['late_p50_ms']:>12.3f} {result['late_max_ms']:>12.3f}")
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    run()
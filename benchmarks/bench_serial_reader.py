@@ -0,0 +1,64 @@
+"""
+Compare CPU use and hit-timestamp jitter of the busy-wait and blocking serial readers.
+A child process plays the Arduino on a pseudo-terminal and writes hits on a fixed schedule.
+Each hit carries its sequence number in the amplitude field, so the receive latency of every hit is known.
+
+    python -m benchmarks.bench_serial_reader
+"""
+import os
+import sys
+import time
+import statistics
+import multiprocessing
+from metronome.arduino.arduino_threaded import ArduinoController
+
+
+def write_hits(master_fd, start_time, rate, duration):
+    interval = 1.0 / rate
+    for idx in range(int(duration * rate)):
+        send_time = start_time + idx * interval
+        while time.perf_counter() < send_time:
+            time.sleep(min(max(send_time - time.perf_counter() - 0.001, 0.0), 0.01))
+        os.write(master_fd, f"h{idx % 4}a{idx}\n".encode())
+
+
+def bench(reader_mode, rate=200.0, duration=3.0):
+    master_fd, slave_fd = os.openpty()
+    controller = ArduinoController(port=os.ttyname(slave_fd), reader_mode=reader_mode, name=f'bench-{reader_mode}')
+    controller.connect()
+    start_time = time.perf_counter() + 0.2
+    writer = multiprocessing.Process(target=write_hits, args=(master_fd, start_time, rate, duration))
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    writer.start()
+    writer.join()
+    time.sleep(0.1)
+    cpu_used = time.process_time() - cpu_start
+    wall_used = time.perf_counter() - wall_start
+    controller.disconnect()
+    os.close(master_fd)
+    os.close(slave_fd)
+    latencies = []
+    for hit in controller.drain_hits():
+        send_time = start_time + int(hit.amplitude) / rate
+        latencies.append((hit.time - send_time) * 1000.0)
+    return {'cpu_percent': 100.0 * cpu_used / wall_used,
+            'hits': len(latencies),
+            'latency_ms_mean': statistics.mean(latencies),
+            'jitter_ms_std': statistics.pstdev(latencies),
+            'latency_ms_max': max(latencies)}
+
+
+def run():
+    if not hasattr(os, 'openpty'):
+        print("Pseudo-terminals are not available on this platform")
+        sys.exit(1)
+    for reader_mode in ('busy', 'blocking'):
+        result = bench(reader_mode)
+        print(f"{reader_mode:>9}: cpu={result['cpu_percent']:.1f}% hits={result['hits']} "
+              f"latency={result['latency_ms_mean']:.3f}ms jitter(std)={result['jitter_ms_std']:.3f}ms "
+              f"max={result['latency_ms_max']:.3f}ms")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,53 @@
+"""
+Compiled tempo maps: an hour of an exercise looping under each ramp curve, compiled one loop at a time as the engine
+does. Reports the compile time per loop, the cost of beat_at and time_at over the whole map, and how far the segment
+start times, each derived from the one before, are from the same times summed in one go with math.fsum.
+
+    python -m benchmarks.bench_tempo
+"""
+import math
+import random
+import time
+from metronome.game.tempo import TempoMap, TempoRamp, RAMP_CURVES
+
+
+def compile_hour(ramp, bpm=60, loop_beats=48, pattern_beats=(16, 32), beats_per_bar=4):
+    tempo = TempoMap(bpm=bpm, start_time=0.0)
+    loop_beat, num_loops = 1.0, 0
+    start = time.perf_counter()
+    while tempo.times[-1] < 3600.0:
+        for beat, bpm in ramp.loop_segments(tempo.bpm_at_beat(loop_beat), loop_beats, pattern_beats):
+            tempo.append(loop_beat + beat, bpm)
+        loop_beat += loop_beats + ramp.rest_beats(tempo.bpms[-1], beats_per_bar)
+        num_loops += 1
+    return tempo, num_loops, time.perf_counter() - start
+
+
+def run():
+    rng = random.Random(0)
+    print(f"{'curve':<12} {'loops':>6} {'segments':>9} {'us/loop':>8} {'beat_at ns':>11} {'time_at ns':>11} "
+          f"{'max drift ns':>13}")
+    for curve in RAMP_CURVES:
+        # Ramps slow enough to stay under max_bpm for the hour
+        ramp = TempoRamp(curve=curve, step=0.5, ratio=1.005, rest_bars=2, max_bpm=1000)
+        tempo, num_loops, elapsed = compile_hour(ramp)
+        times = [rng.uniform(0.0, tempo.times[-1]) for _ in range(100000)]
+        beats = [rng.uniform(0.0, tempo.beats[-1]) for _ in range(100000)]
+        start = time.perf_counter()
+        for at_time in times:
+            tempo.beat_at(at_time)
+        beat_at_ns = (time.perf_counter() - start) / len(times) * 1e9
+        start = time.perf_counter()
+        for beat in beats:
+            tempo.time_at(beat)
+        time_at_ns = (time.perf_counter() - start) / len(beats) * 1e9
+        durations = [(later - earlier) * 60.0 / bpm for earlier, later, bpm
+                     in zip(tempo.beats, tempo.beats[1:], tempo.bpms)]
+        drift = max(abs(tempo.times[idx + 1] - math.fsum(durations[:idx + 1]))
+                    for idx in range(0, len(durations), max(len(durations) // 200, 1)))
+        print(f"{curve:<12} {num_loops:>6} {len(tempo.beats):>9} {elapsed / num_loops * 1e6:>8.1f} "
+              f"{beat_at_ns:>11.0f} {time_at_ns:>11.0f} {drift * 1e9:>13.3f}")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,51 @@
+"""
+Cost of the online skill model on a generated library of 20000 exercises: building the trainer, folding a judged
+note into the skills of the exercise being played, and asking for the weakest skill and the next exercise after
+every pattern, against a scan over every skill and every exercise of the weakest one.
+
+    python -m benchmarks.bench_trainer
+"""
+import os
+import random
+import tempfile
+from benchmarks.bench_library import generate_library, timed
+from metronome.exercise.exercise import ExerciseFactory
+from metronome.exercise.trainer import SkillTrainer
+
+
+def scan_next_exercise(trainer):
+    """
+    The same recommendation without the heaps
+    """
+    skill = min(trainer.skills.skills, key=lambda each_skill: each_skill.level)
+    exercise_idxs = trainer.catalog.skill_index[skill.name].tolist()
+    return min(exercise_idxs, key=lambda exercise_idx: (trainer.plays[exercise_idx], exercise_idx))
+
+
+def run(num_exercises=20000, num_sessions=2000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fpath = generate_library(os.path.join(tmp_dir, 'library.tsv'), num_exercises)
+        library = ExerciseFactory(csv_fpath=fpath).library
+        build_ms, trainer = timed(lambda: SkillTrainer(library))
+        print(f"trainer over {num_exercises} exercises and {len(trainer.skills.skills)} skills built in "
+              f"{build_ms:.0f} ms (catalog included)")
+        rng = random.Random(0)
+        names = library.exercise_names
+        observe_ms = next_ms = scan_ms = 0.0
+        for _ in range(num_sessions):
+            trainer.start_exercise(trainer.next_exercise() or names[rng.randrange(len(names))])
+            elapsed, _ = timed(lambda: trainer.observe(rng.random() < 0.9, error_ms=rng.gauss(0.0, 20.0)), repeat=50)
+            observe_ms += elapsed
+            elapsed, _ = timed(trainer.next_exercise)
+            next_ms += elapsed
+            elapsed, _ = timed(lambda: scan_next_exercise(trainer))
+            scan_ms += elapsed
+        print(f"{'observe (per judged note)':<28} {observe_ms / num_sessions * 1e3:>8.2f} us")
+        print(f"{'next_exercise':<28} {next_ms / num_sessions * 1e3:>8.2f} us")
+        print(f"{'scan every skill/exercise':<28} {scan_ms / num_sessions * 1e3:>8.2f} us")
+        print(f"exercises played: {sum(1 for plays in trainer.plays if plays > 0)}, "
+              f"weakest skill: {trainer.weakest_skill().name} at {trainer.weakest_skill().level:.2f}")
+
+
+if __name__ == '__main__':
+    run()
@@ -1,5 +1,6 @@
 
 import os
+import platform
 from dotenv import load_dotenv
 
 
@@ -28,5 +29,48 @@ class Config(object):
     IS_VERBOSE = parse_env_boolean(os.environ.get("IS_VERBOSE", True))
     COM_PORT = os.environ.get("COM_PORT", 'COM3')
     BAURDRATE = os.environ.get("BAURDRATE", 115200)
+    # 'auto' switches to binary hit frames when the device offers them in its handshake, 'text' never does
+    SERIAL_PROTOCOL = os.environ.get("SERIAL_PROTOCOL", 'auto')
+    # Pending hit buffer: size, what to drop when it is full ('drop_oldest' or 'drop_newest'),
+    # and the age in seconds after which a hit is evicted instead of judged
+    HIT_BUFFER_SIZE = int(os.environ.get("HIT_BUFFER_SIZE", 1024))
+    HIT_OVERFLOW_POLICY = os.environ.get("HIT_OVERFLOW_POLICY", 'drop_oldest')
+    HIT_STALE_AFTER = float(os.environ.get("HIT_STALE_AFTER", 0.25))
+    # Main loop pacing: input and beat logic ticks per second, rendered frames per second,
+    # or frames paced by the display refresh when VSYNC is on
+    LOGIC_RATE = float(os.environ.get("LOGIC_RATE", 1000))
+    TARGET_FPS = float(os.environ.get("TARGET_FPS", 120))
+    VSYNC = parse_env_boolean(os.environ.get("VSYNC", False))
+    # Redraw and flip the whole window every frame instead of pushing only the dirty rects
+    RENDER_FULL_FLIP = parse_env_boolean(os.environ.get("RENDER_FULL_FLIP", False))
+    # Per-frame profiling of the main loop phases, shown on screen with PROFILE_OVERLAY (which turns PROFILE on)
+    # and written every PROFILE_EXPORT_INTERVAL seconds to PROFILE_EXPORT_FPATH, a .json or .csv file, if set
+    PROFILE = parse_env_boolean(os.environ.get("PROFILE", False))
+    PROFILE_OVERLAY = parse_env_boolean(os.environ.get("PROFILE_OVERLAY", False))
+    PROFILE_WINDOW = int(os.environ.get("PROFILE_WINDOW", 1024))
+    PROFILE_EXPORT_FPATH = os.environ.get('PROFILE_EXPORT_FPATH', '')
+    PROFILE_EXPORT_INTERVAL = float(os.environ.get("PROFILE_EXPORT_INTERVAL", 5.0))
+    # Per-note session logs, one directory per game under SESSION_DIR, opt in with RECORD_SESSIONS=true
+    RECORD_SESSIONS = parse_env_boolean(os.environ.get("RECORD_SESSIONS", False))
+    SESSION_DIR = os.environ.get('SESSION_DIR', './data/sessions')
+    STUDENT_NAME = os.environ.get('STUDENT_NAME', 'default')
+    # BPM progression as the exercise loops: 'step', 'linear', 'exponential' or 'pattern' (see TempoRamp),
+    # by TEMPO_STEP BPM or a TEMPO_RATIO factor per loop, with REST_BARS bars of rest between loops
+    TEMPO_RAMP = os.environ.get("TEMPO_RAMP", 'step')
+    TEMPO_STEP = float(os.environ.get("TEMPO_STEP", 5))
+    TEMPO_RATIO = float(os.environ.get("TEMPO_RATIO", 1.05))
+    REST_BARS = float(os.environ.get("REST_BARS", 2))
+    # Latency calibration of this rig (pads, serial link, speakers and display), applied to judging and rendering
+    RIG_NAME = os.environ.get("RIG_NAME", f"{platform.node()}-{COM_PORT}")
+    CALIBRATION_DIR = os.environ.get('CALIBRATION_DIR', './data/calibration')
+    APPLY_CALIBRATION = parse_env_boolean(os.environ.get("APPLY_CALIBRATION", True))
     EXERCISE_CSV_FPATH = os.environ.get('EXERCISE_CSV_FPATH', './data/exercises.tsv')
-    SOUND_TRUMPET_FPATH = os.environ.get('EXERCISE_CSV_FPATH', './data/sounds/the-price-is-right-losing-horn.mp3')
+    SOUND_TRUMPET_FPATH = os.environ.get('SOUND_TRUMPET_FPATH', './data/sounds/the-price-is-right-losing-horn.mp3')
+    # Drum samples played on pad hits, one per channel in (rh, lh, rf, lf) order
+    PLAY_DRUM_SAMPLES = parse_env_boolean(os.environ.get("PLAY_DRUM_SAMPLES", True))
+    DRUM_SAMPLE_FPATHS = os.environ.get(
+        'DRUM_SAMPLE_FPATHS', './data/sounds/tick.wav,./data/sounds/tick.wav,./data/sounds/tock.wav,./data/sounds/tock.wav'
+    ).split(',')
+    DRUM_SAMPLE_VOICES = int(os.environ.get("DRUM_SAMPLE_VOICES", 8))
+    # Mixer buffer in samples. Smaller buffers lower hit-to-sound latency, 256 is ~6 ms at 44.1 kHz
+    AUDIO_BUFFER = int(os.environ.get("AUDIO_BUFFER", 256))
@@ -1,5 +1,10 @@
+import sys
 from metronome.ui.scrolling import run
+from metronome.ui.calibration import run_calibration
 
 
 if __name__ == '__main__':
-    run()
+    if sys.argv[1:2] == ['calibrate']:
+        run_calibration()
+    else:
+        run()
@@ -3,33 +3,102 @@ import time
 import serial
 import threading
 import queue
-
-
-class Hit:
-    def __init__(self, hit_channel, hit_amplitude, hit_time):
-        self.channel = hit_channel
-        self.amplitude = hit_amplitude
-        self.time = hit_time
+from collections import deque
+from metronome.arduino.clock_sync import ClockSync
+from metronome.arduino.hits import Hit, HitBatch
+from metronome.arduino.protocol import BINARY_PROTOCOL, SYNC_CAPABILITY, SYNC_CHANNEL, FrameDecoder, parse_ready_msg
+from metronome.arduino.ring_buffer import HitRingBuffer
 
 
 class ArduinoController:
-    def __init__(self, port, baudrate=115200, timeout=5, system_ready_msg="ready", name="ArduinoController"):
+    """
+    Reads newline-terminated messages from the Arduino on a background thread.
+    reader_mode='blocking' waits on the serial read timeout and takes every available byte per read,
+    reader_mode='busy' is the original loop polling in_waiting and reading one line at a time.
+    Hits go into a bounded HitRingBuffer that the game empties with drain_hits(). Every other message is queued in
+    batches of {"time": ..., "msg": ...} dicts, one batch per read.
+    With protocol='auto', a device whose handshake advertises the binary protocol ("ready bin1") is switched to
+    fixed-size binary hit frames, decoded in bulk. Otherwise the text protocol is used.
+    Only the blocking reader supports the binary protocol.
+    Host timestamps come from clock (perf_counter, the game clock). If the handshake offers "sync", the controller
+    pings the device every sync_interval seconds and fits a ClockSync, after which hits that carry the device's
+    micros() timestamp get their time mapped onto the host clock instead of using the time they were read.
+    """
+    reader_modes = ('blocking', 'busy')
+    protocols = ('auto', 'text')
+
+    def __init__(self, port, baudrate=115200, timeout=5, system_ready_msg="ready", name="ArduinoController",
+                 reader_mode='blocking', read_timeout=0.05, protocol='auto', hit_buffer_size=1024,
+                 overflow_policy='drop_oldest', stale_after=None, sync_interval=1.0, clock=time.perf_counter):
+        if reader_mode not in self.reader_modes:
+            raise ValueError(f"reader_mode must be one of {self.reader_modes}, not {reader_mode}")
+        if protocol not in self.protocols:
+            raise ValueError(f"protocol must be one of {self.protocols}, not {protocol}")
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
         self.system_ready_msg = system_ready_msg
         self.name = name
+        self.reader_mode = reader_mode
+        self.read_timeout = read_timeout
+        self.protocol = protocol
+        self.active_protocol = 'text'
+        self.decoder = None
         self.serial_connection = None
         self.messages = queue.Queue()
+        self.pending_messages = deque()
+        self.clock = clock
+        self.hits = HitRingBuffer(capacity=hit_buffer_size, overflow_policy=overflow_policy, stale_after=stale_after,
+                                  clock=clock)
+        # Device clock synchronisation
+        self.clock_sync = ClockSync()
+        self.sync_interval = sync_interval
+        self.sync_enabled = False
+        self.ping_sent_time = None
+        self.last_ping_time = None
         self.running = False
+        self.thread = None
+        self.hit_callbacks = []
+
+    def add_hit_callback(self, callback):
+        """
+        Call callback(hit) on the reader thread for every hit, before it is queued for the game loop
+        """
+        self.hit_callbacks.append(callback)
+
+    def remove_hit_callback(self, callback):
+        if callback in self.hit_callbacks:
+            self.hit_callbacks.remove(callback)
+
+    def dispatch_hit(self, message, message_time):
+        try:
+            hit = self.parse_hit_msg(message, message_time)
+        except ValueError:
+            return None
+        if hit.device_time is not None and self.clock_sync.ready:
+            hit.time = float(self.clock_sync.to_host(hit.device_time)[0])
+        self.notify_hit_callbacks(hit)
+        return hit
+
+    def notify_hit_callbacks(self, hit):
+        for callback in self.hit_callbacks:
+            try:
+                callback(hit)
+            except Exception as e:
+                print(f"Error in hit callback {callback}: {e}")
 
     def connect(self):
         try:
             print("initialising")
-            self.serial_connection = serial.Serial(self.port, self.baudrate)
+            if self.reader_mode == 'blocking':
+                self.serial_connection = serial.Serial(self.port, self.baudrate, timeout=self.read_timeout)
+                target = self._read_batches
+            else:
+                self.serial_connection = serial.Serial(self.port, self.baudrate)
+                target = self._listen_for_messages
             self.running = True
-            thread = threading.Thread(target=self._listen_for_messages)
-            thread.start()
+            self.thread = threading.Thread(target=target, name=self.name, daemon=True)
+            self.thread.start()
             print(f"Connected to device at {self.port} "
                   f"with baud rate {self.baudrate} and timeout {self.timeout}")
         except serial.SerialException as e:
@@ -39,26 +108,156 @@ class ArduinoController:
         while self.running:
             if self.serial_connection.in_waiting > 0:
                 message = self.serial_connection.readline().decode().strip()
-                self.messages.put({"time": time.time(), "msg": message})
+                self.enqueue_batch([message], self.clock())
+            self.maybe_ping()
+
+    def _read_batches(self):
+        """
+        Block on the serial read timeout instead of spinning, then pull everything that has arrived in one read()
+        """
+        buffer = b''
+        while self.running:
+            try:
+                chunk = self.serial_connection.read(max(1, self.serial_connection.in_waiting))
+            except (serial.SerialException, OSError, TypeError) as e:
+                # Closing the port or cancelling the read from disconnect() ends up here
+                if self.running:
+                    print(f"Error reading from {self.port}: {e}")
+                break
+            self.maybe_ping()
+            if not chunk:
+                continue
+            chunk_time = self.clock()
+            if self.decoder is not None:
+                self.enqueue_hit_batch(self.decoder.feed(chunk, chunk_time))
+                continue
+            buffer += chunk
+            if b'\n' not in chunk:
+                continue
+            lines = buffer.split(b'\n')
+            buffer = lines.pop()
+            messages = [line.decode(errors='replace').strip() for line in lines]
+            messages = [message for message in messages if message != '']
+            for message in messages:
+                if message.startswith(self.system_ready_msg):
+                    self.negotiate_protocol(message)
+            self.enqueue_batch(messages, chunk_time)
+            if self.decoder is not None:
+                # Anything left over is text sent before the switch, the decoder skips it while looking for a frame
+                self.enqueue_hit_batch(self.decoder.feed(buffer, chunk_time))
+                buffer = b''
+
+    def negotiate_protocol(self, ready_msg):
+        """
+        Ask the device for binary frames if its handshake offers them, otherwise stay on the text protocol
+        """
+        offered = parse_ready_msg(ready_msg, self.system_ready_msg) or []
+        if self.protocol == 'auto' and BINARY_PROTOCOL in offered and self.decoder is None:
+            self.serial_connection.write(f"{BINARY_PROTOCOL}\n".encode())
+            self.decoder = FrameDecoder()
+            self.active_protocol = BINARY_PROTOCOL
+            print(f"{self.name}: switched to the {BINARY_PROTOCOL} binary hit protocol")
+        if SYNC_CAPABILITY in offered and self.sync_interval is not None:
+            self.sync_enabled = True
+
+    def maybe_ping(self):
+        """
+        Send a clock sync ping when one is due. Only one ping is in flight at a time, a lost one is retried.
+        """
+        if not self.sync_enabled:
+            return None
+        now = self.clock()
+        if self.last_ping_time is not None and now - self.last_ping_time < self.sync_interval:
+            return None
+        self.serial_connection.write(b"s\n")
+        self.ping_sent_time = self.last_ping_time = now
+
+    def handle_sync_reply(self, device_time, received_time):
+        if self.ping_sent_time is None:
+            return None
+        self.clock_sync.add_ping(device_time, sent_time=self.ping_sent_time, received_time=received_time)
+        self.ping_sent_time = None
+
+    def enqueue_batch(self, messages, message_time):
+        """
+        Push hits into the ring buffer and queue every other message from one read as a single item
+        """
+        other_messages = []
+        for message in messages:
+            if message.startswith('h'):
+                hit = self.dispatch_hit(message, message_time)
+                if hit is not None:
+                    self.hits.push_hit(hit)
+            elif message.startswith('s') and message[1:].isdigit():
+                self.handle_sync_reply(int(message[1:]), message_time)
+            else:
+                other_messages.append({"time": message_time, "msg": message})
+        if len(other_messages) > 0:
+            self.messages.put(other_messages)
+
+    def enqueue_hit_batch(self, batch: HitBatch):
+        if len(batch) == 0:
+            return None
+        is_sync = batch.channels == SYNC_CHANNEL
+        if is_sync.any():
+            for device_time in batch.device_times[is_sync].tolist():
+                self.handle_sync_reply(device_time, float(batch.times[0]))
+            batch = batch[~is_sync]
+        if self.clock_sync.ready and batch.device_times is not None:
+            batch.times = self.clock_sync.to_host(batch.device_times)
+        if self.hit_callbacks:
+            for hit in batch:
+                self.notify_hit_callbacks(hit)
+        self.hits.push_batch(batch)
 
     def disconnect(self):
         self.running = False
         if self.serial_connection and self.serial_connection.is_open:
+            if hasattr(self.serial_connection, 'cancel_read'):
+                # Wake the reader up from its blocking read right away rather than waiting for the timeout
+                self.serial_connection.cancel_read()
+            if self.thread is not None and self.thread is not threading.current_thread():
+                self.thread.join(timeout=max(self.read_timeout * 4, 0.5))
             self.serial_connection.close()
 
     def get_message(self):
-        return self.messages.get() if not self.messages.empty() else None
+        if len(self.pending_messages) == 0:
+            try:
+                self.pending_messages.extend(self.messages.get_nowait())
+            except queue.Empty:
+                return None
+        return self.pending_messages.popleft()
 
     @staticmethod
     def parse_hit_msg(msg: str, hit_time: float):
+        """
+        Parse a hit like "h2a57.3", optionally followed by the device's micros() timestamp as in "h2a57.3t1234567"
+        """
         if not msg.startswith('h'):
             raise ValueError(f"Hit messages start with 'h'. This message is {msg}")
         msg = msg[1:]
+        device_time = None
+        if 't' in msg:
+            msg, device_time = msg.split('t')
+            device_time = int(device_time)
         hit_channel, hit_amplitude = msg.split('a')
-        return Hit(hit_channel=int(hit_channel), hit_amplitude=float(hit_amplitude), hit_time=hit_time)
+        return Hit(hit_channel=int(hit_channel), hit_amplitude=float(hit_amplitude), hit_time=hit_time,
+                   device_time=device_time)
 
     def get_hit(self):
-        msg = self.get_message()
-        if msg is not None and msg['msg'].startswith('h'):
-            return self.parse_hit_msg(msg['msg'], msg['time'])
-        return None
+        """
+        Take the oldest pending hit, or None. Prefer drain_hits() in the game loop.
+        """
+        return self.hits.pop()
+
+    def drain_hits(self):
+        """
+        Take every pending hit in one call as a HitBatch, with stale hits already evicted
+        """
+        return self.hits.drain()
+
+    def hit_stats(self):
+        return self.hits.stats()
+
+    def sync_stats(self):
+        return self.clock_sync.stats()
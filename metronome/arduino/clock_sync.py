@@ -0,0 +1,108 @@
+from collections import deque
+import numpy as np
+
+
+# Arduino micros() is an unsigned 32 bit counter and wraps about every 71.6 minutes
+DEVICE_CLOCK_WRAP = 2 ** 32
+DEVICE_CLOCK_HALF = 2 ** 31
+
+
+class ClockSync:
+    """
+    Online mapping from the Arduino's micros() clock to host perf_counter seconds.
+    Fits host_time = offset + rate * device_seconds by least squares over the last window sync samples, which handles
+    both the clock offset and the crystal drift between the two clocks. Each sample is a sync ping: the device
+    timestamp in the reply is paired with the midpoint of the ping's round trip, and pings that took much longer
+    than the fastest recent one are rejected as outliers.
+    """
+
+    def __init__(self, window: int = 64, min_samples: int = 4, max_round_trip_ratio: float = 3.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.max_round_trip_ratio = max_round_trip_ratio
+        self.device_seconds = deque(maxlen=window)
+        self.host_times = deque(maxlen=window)
+        self.round_trips = deque(maxlen=window)
+        self.rejected = 0
+        # Fit, relative to the first device time seen to keep the regression well conditioned
+        self.device_ref = None
+        self.offset = None
+        self.rate = 1.0
+        self.residual_error = None  # RMS of the fit residuals in seconds
+        # Unwrapping state for the 32 bit device clock
+        self.last_raw = None
+        self.wraps = 0
+
+    @property
+    def ready(self):
+        return self.offset is not None
+
+    @property
+    def drift_ppm(self):
+        """
+        How fast the device clock runs compared to the host clock, in parts per million
+        """
+        return (1.0 / self.rate - 1.0) * 1e6
+
+    def unwrap(self, device_times):
+        """
+        Turn raw 32 bit micros() values, in arrival order, into a monotonic count of microseconds
+        """
+        raw = np.atleast_1d(np.asarray(device_times, dtype=np.int64))
+        if len(raw) == 0:
+            return raw
+        last_raw = raw[0] if self.last_raw is None else self.last_raw
+        steps = np.diff(raw, prepend=last_raw)
+        # A big step backwards is a wrap, a big step forwards is a late sample from before the last wrap
+        wraps = self.wraps + np.cumsum((steps < -DEVICE_CLOCK_HALF).astype(np.int64) -
+                                       (steps > DEVICE_CLOCK_HALF).astype(np.int64))
+        self.last_raw = int(raw[-1])
+        self.wraps = int(wraps[-1])
+        return raw + wraps * DEVICE_CLOCK_WRAP
+
+    def add_ping(self, device_time, sent_time: float, received_time: float):
+        """
+        Add a sync sample from a ping sent at sent_time whose reply, stamped device_time, arrived at received_time
+        """
+        round_trip = received_time - sent_time
+        device_us = int(self.unwrap(device_time)[0])
+        if len(self.round_trips) >= self.min_samples and round_trip > self.max_round_trip_ratio * min(self.round_trips):
+            self.rejected += 1
+            return False
+        self.round_trips.append(round_trip)
+        self.add_sample(device_us, sent_time + round_trip / 2.0)
+        return True
+
+    def add_sample(self, device_us: int, host_time: float):
+        if self.device_ref is None:
+            self.device_ref = device_us
+        self.device_seconds.append((device_us - self.device_ref) * 1e-6)
+        self.host_times.append(host_time)
+        self.fit()
+
+    def fit(self):
+        x = np.asarray(self.device_seconds)
+        y = np.asarray(self.host_times)
+        if len(x) < self.min_samples or np.ptp(x) == 0.0:
+            # Not enough spread for a drift estimate yet, assume both clocks tick at the same rate
+            self.rate = 1.0
+            self.offset = float(np.mean(y - x))
+        else:
+            x_mean, y_mean = x.mean(), y.mean()
+            self.rate = float(np.sum((x - x_mean) * (y - y_mean)) / np.sum((x - x_mean) ** 2))
+            self.offset = float(y_mean - self.rate * x_mean)
+        residuals = y - (self.offset + self.rate * x)
+        self.residual_error = float(np.sqrt(np.mean(residuals ** 2)))
+
+    def to_host(self, device_times, unwrapped: bool = False):
+        """
+        Map device micros() values to host perf_counter seconds. Returns None until the first sample arrives.
+        """
+        if not self.ready:
+            return None
+        device_us = np.asarray(device_times, dtype=np.int64) if unwrapped else self.unwrap(device_times)
+        return self.offset + self.rate * ((device_us - self.device_ref) * 1e-6)
+
+    def stats(self):
+        return {'samples': len(self.host_times), 'rejected': self.rejected, 'offset': self.offset,
+                'drift_ppm': self.drift_ppm, 'residual_error': self.residual_error}
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class Hit:
+    def __init__(self, hit_channel, hit_amplitude, hit_time, device_time=None):
+        self.channel = hit_channel
+        self.amplitude = hit_amplitude
+        self.time = hit_time
+        self.device_time = device_time  # Arduino micros() timestamp, when the protocol carries one
+
+
+class HitBatch:
+    """
+    Hits stored column-wise in numpy arrays, as decoded in bulk from the binary protocol.
+    Iterating over a batch yields regular Hit objects for code that handles one hit at a time.
+    """
+
+    def __init__(self, channels, amplitudes, times, device_times=None):
+        self.channels = np.asarray(channels, dtype=np.int16)
+        self.amplitudes = np.asarray(amplitudes, dtype=np.float32)
+        self.times = np.asarray(times, dtype=np.float64)
+        self.device_times = None if device_times is None else np.asarray(device_times, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __iter__(self):
+        if self.device_times is None:
+            device_times = [None] * len(self)
+        else:
+            # Negative device times mark hits that arrived without one
+            device_times = [device_time if device_time >= 0 else None for device_time in self.device_times.tolist()]
+        for channel, amplitude, hit_time, device_time in zip(self.channels.tolist(), self.amplitudes.tolist(),
+                                                            self.times.tolist(), device_times):
+            yield Hit(hit_channel=channel, hit_amplitude=amplitude, hit_time=hit_time, device_time=device_time)
+
+    def __getitem__(self, idx):
+        return HitBatch(channels=self.channels[idx], amplitudes=self.amplitudes[idx], times=self.times[idx],
+                        device_times=None if self.device_times is None else self.device_times[idx])
+
+    @classmethod
+    def empty(cls):
+        return cls(channels=[], amplitudes=[], times=[])
+
+    @classmethod
+    def from_hits(cls, hits):
+        hits = list(hits)
+        device_times = None
+        if len(hits) > 0 and all(hit.device_time is not None for hit in hits):
+            device_times = [hit.device_time for hit in hits]
+        return cls(channels=[hit.channel for hit in hits], amplitudes=[hit.amplitude for hit in hits],
+                   times=[hit.time for hit in hits], device_times=device_times)
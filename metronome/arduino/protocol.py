@@ -0,0 +1,89 @@
+import struct
+import numpy as np
+from metronome.arduino.hits import HitBatch
+
+
+# Fixed-size hit frame: sync byte, channel, amplitude in hundredths, device micros(), checksum.
+# The checksum is the low byte of the sum of the channel, amplitude and timestamp bytes.
+# The sync byte is outside the ASCII range, so leftovers of the text protocol are skipped while resyncing.
+BINARY_PROTOCOL = 'bin1'
+SYNC_BYTE = 0xA5
+FRAME_FORMAT = '<BBHIB'
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+FRAME_DTYPE = np.dtype([('sync', 'u1'), ('channel', 'u1'), ('amplitude', '<u2'),
+                        ('device_time', '<u4'), ('checksum', 'u1')])
+AMPLITUDE_SCALE = 100.0
+# Replies to clock sync pings come back as frames on this channel, carrying only the device timestamp
+SYNC_CHANNEL = 0xFF
+# Offered in the handshake ("ready bin1 sync") by devices that answer "s" pings with their micros() timestamp
+SYNC_CAPABILITY = 'sync'
+
+
+def encode_hit_frame(channel: int, amplitude: float, device_time: int):
+    body = struct.pack('<BHI', channel, int(round(amplitude * AMPLITUDE_SCALE)), device_time & 0xFFFFFFFF)
+    return bytes([SYNC_BYTE]) + body + bytes([sum(body) & 0xFF])
+
+
+def decode_frames(frame_bytes: bytes, host_time: float):
+    """
+    Decode a buffer of valid, back-to-back frames into a HitBatch in one pass
+    """
+    frames = np.frombuffer(frame_bytes, dtype=FRAME_DTYPE)
+    return HitBatch(channels=frames['channel'],
+                    amplitudes=frames['amplitude'] / AMPLITUDE_SCALE,
+                    times=np.full(len(frames), host_time, dtype=np.float64),
+                    device_times=frames['device_time'])
+
+
+def parse_ready_msg(msg: str, system_ready_msg: str = 'ready'):
+    """
+    Protocols a device advertises in its handshake, e.g. "ready bin1" -> ['bin1']. A bare "ready" is text only.
+    """
+    if not msg.startswith(system_ready_msg):
+        return None
+    return msg[len(system_ready_msg):].split()
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for the binary hit protocol.
+    Whole runs of valid frames are checked and decoded with numpy, corrupted bytes are skipped up to the next sync byte.
+    """
+
+    def __init__(self):
+        self.buffer = b''
+        self.bad_frames = 0
+        self.dropped_bytes = 0
+
+    def split_frames(self, buffer: bytes):
+        """
+        Split a buffer into valid frame bytes and an incomplete trailing frame
+        """
+        good = []
+        pos = 0
+        while True:
+            start = buffer.find(SYNC_BYTE, pos)
+            if start < 0:
+                self.dropped_bytes += len(buffer) - pos
+                return b''.join(good), b''
+            self.dropped_bytes += start - pos
+            num_frames = (len(buffer) - start) // FRAME_SIZE
+            if num_frames == 0:
+                return b''.join(good), buffer[start:]
+            raw = np.frombuffer(buffer, dtype=np.uint8, count=num_frames * FRAME_SIZE, offset=start)
+            raw = raw.reshape(num_frames, FRAME_SIZE)
+            valid = (raw[:, 0] == SYNC_BYTE) & ((raw[:, 1:-1].sum(axis=1) & 0xFF) == raw[:, -1])
+            num_valid = num_frames if valid.all() else int(np.argmin(valid))
+            good.append(buffer[start:start + num_valid * FRAME_SIZE])
+            pos = start + num_valid * FRAME_SIZE
+            if num_valid < num_frames:
+                # Skip the sync byte of the bad frame and look for the next one
+                self.bad_frames += 1
+                self.dropped_bytes += 1
+                pos += 1
+
+    def feed(self, chunk: bytes, host_time: float):
+        frame_bytes, self.buffer = self.split_frames(self.buffer + chunk)
+        if len(frame_bytes) == 0:
+            return HitBatch.empty()
+        return decode_frames(frame_bytes, host_time)
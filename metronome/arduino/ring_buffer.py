@@ -0,0 +1,123 @@
+import time
+import threading
+import numpy as np
+from metronome.arduino.hits import HitBatch
+
+
+class HitRingBuffer:
+    """
+    Bounded single-producer / single-consumer ring of hits backed by preallocated numpy columns.
+    The reader thread pushes, the game loop drains everything at once. When full, overflow_policy decides whether the
+    oldest pending hit is overwritten ('drop_oldest') or the incoming one is discarded ('drop_newest').
+    Hits older than stale_after seconds at drain time are evicted instead of being judged late.
+    Write and read positions only ever grow. A short lock guards them, because drop_oldest lets the producer move the
+    read position too.
+    """
+    overflow_policies = ('drop_oldest', 'drop_newest')
+
+    def __init__(self, capacity: int = 1024, overflow_policy: str = 'drop_oldest', stale_after: float = None,
+                 clock=time.perf_counter):
+        if overflow_policy not in self.overflow_policies:
+            raise ValueError(f"overflow_policy must be one of {self.overflow_policies}, not {overflow_policy}")
+        self.capacity = capacity
+        self.overflow_policy = overflow_policy
+        self.stale_after = stale_after
+        self.clock = clock
+        self.channels = np.zeros(capacity, dtype=np.int16)
+        self.amplitudes = np.zeros(capacity, dtype=np.float32)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.device_times = np.full(capacity, -1, dtype=np.int64)  # -1 when the protocol has no device timestamp
+        self.write_idx = 0
+        self.read_idx = 0
+        self.lock = threading.Lock()
+        # Accounting
+        self.pushed = 0
+        self.dropped = 0
+        self.stale = 0
+
+    def __len__(self):
+        return self.write_idx - self.read_idx
+
+    def push(self, channel: int, amplitude: float, hit_time: float, device_time: int = None):
+        with self.lock:
+            if self.write_idx - self.read_idx >= self.capacity:
+                self.dropped += 1
+                if self.overflow_policy == 'drop_newest':
+                    return False
+                self.read_idx += 1
+            slot = self.write_idx % self.capacity
+            self.channels[slot] = channel
+            self.amplitudes[slot] = amplitude
+            self.times[slot] = hit_time
+            self.device_times[slot] = -1 if device_time is None else device_time
+            self.write_idx += 1
+            self.pushed += 1
+        return True
+
+    def push_hit(self, hit):
+        return self.push(channel=hit.channel, amplitude=hit.amplitude, hit_time=hit.time,
+                         device_time=hit.device_time)
+
+    def push_batch(self, batch: HitBatch):
+        """
+        Copy a whole batch in with at most two slice assignments per column
+        """
+        num_hits = len(batch)
+        if num_hits == 0:
+            return 0
+        device_times = batch.device_times if batch.device_times is not None else np.full(num_hits, -1)
+        with self.lock:
+            free = self.capacity - (self.write_idx - self.read_idx)
+            if num_hits > free:
+                if self.overflow_policy == 'drop_newest':
+                    self.dropped += num_hits - free
+                    num_hits = free
+                else:
+                    overflow = num_hits - free
+                    self.dropped += overflow
+                    if num_hits > self.capacity:
+                        # Only the newest capacity hits of the batch can survive
+                        skip = num_hits - self.capacity
+                        batch, device_times, num_hits = batch[skip:], device_times[skip:], self.capacity
+                        overflow -= skip
+                    self.read_idx += overflow
+            start = self.write_idx % self.capacity
+            first = min(num_hits, self.capacity - start)
+            for column, values in ((self.channels, batch.channels), (self.amplitudes, batch.amplitudes),
+                                   (self.times, batch.times), (self.device_times, device_times)):
+                column[start:start + first] = values[:first]
+                column[:num_hits - first] = values[first:num_hits]
+            self.write_idx += num_hits
+            self.pushed += num_hits
+        return num_hits
+
+    def pop(self):
+        """
+        Take the oldest pending hit on its own, or None
+        """
+        batch = self.drain(max_hits=1)
+        return next(iter(batch), None)
+
+    def drain(self, max_hits: int = None, now: float = None):
+        """
+        Take every pending hit in arrival order as a HitBatch, evicting the stale ones first
+        """
+        with self.lock:
+            read_idx, write_idx = self.read_idx, self.write_idx
+            if self.stale_after is not None and write_idx > read_idx:
+                horizon = (self.clock() if now is None else now) - self.stale_after
+                slots = np.arange(read_idx, write_idx) % self.capacity
+                # Hits arrive in time order, so the stale ones are a prefix
+                num_stale = int(np.searchsorted(self.times[slots], horizon, side='left'))
+                self.stale += num_stale
+                read_idx += num_stale
+            if max_hits is not None:
+                write_idx = min(write_idx, read_idx + max_hits)
+            slots = np.arange(read_idx, write_idx) % self.capacity
+            batch = HitBatch(channels=self.channels[slots], amplitudes=self.amplitudes[slots],
+                             times=self.times[slots], device_times=self.device_times[slots])
+            self.read_idx = write_idx
+        return batch
+
+    def stats(self):
+        return {'pending': len(self), 'pushed': self.pushed, 'dropped': self.dropped, 'stale': self.stale}
@@ -0,0 +1,243 @@
+import os
+import sys
+import tty
+import time
+import random
+import select
+import argparse
+import threading
+from metronome.arduino.clock_sync import DEVICE_CLOCK_WRAP
+from metronome.arduino.protocol import BINARY_PROTOCOL, SYNC_CAPABILITY, SYNC_CHANNEL, encode_hit_frame
+from metronome.exercise.exercise import ExerciseFactory
+from metronome.exercise.timeline import Timeline
+
+
+class SimulatedHit:
+    def __init__(self, offset, channel, amplitude):
+        self.offset = offset  # Seconds from the start of playback
+        self.channel = channel
+        self.amplitude = amplitude
+
+
+def hits_from_exercise(exercise, bpm: float, beats_per_bar: int = 4, amplitude: float = 80.0, num_loops: int = 1):
+    """
+    Perfect playback of an exercise: one hit exactly on every note at a constant tempo
+    """
+    timeline = Timeline.compile(exercise, beats_per_bar=beats_per_bar)
+    beat_interval = 60.0 / bpm
+    loop_length = timeline.num_bars * beats_per_bar * beat_interval
+    for loop_idx in range(num_loops):
+        for onset, channel in zip(timeline.onsets.tolist(), timeline.channels.tolist()):
+            yield SimulatedHit(offset=loop_idx * loop_length + onset * beat_interval, channel=channel,
+                               amplitude=amplitude)
+
+
+def hits_from_file(fpath: str):
+    """
+    Replay a recorded stream, one "offset_seconds channel amplitude" line per hit. Skips blanks and # comments.
+    """
+    with open(fpath, 'r') as fp:
+        for line in fp:
+            line = line.split('#')[0].strip()
+            if line == '':
+                continue
+            offset, channel, amplitude = line.replace(',', ' ').split()
+            yield SimulatedHit(offset=float(offset), channel=int(channel), amplitude=float(amplitude))
+
+
+def generated_hits(rate: float, duration: float, num_channels: int = 4, amplitude: float = 80.0):
+    """
+    A roll at a fixed rate, cycling over the channels
+    """
+    for idx in range(int(rate * duration)):
+        yield SimulatedHit(offset=idx / rate, channel=idx % num_channels, amplitude=amplitude)
+
+
+class ArduinoSimulator:
+    """
+    Stand-in for the drum Arduino on a pseudo-terminal, for load tests and reproducing field issues without a board.
+    Point an ArduinoController at simulator.port, call send_ready() once it is connected, then play() a hit stream.
+    The device answers the binary protocol and clock sync requests if it offers them in its handshake, keeps its own
+    drifting micros() clock, and can add timing jitter and drop bytes to imitate a bad USB link.
+    """
+
+    def __init__(self, capabilities=(BINARY_PROTOCOL, SYNC_CAPABILITY), system_ready_msg='ready',
+                 send_device_time: bool = True, jitter: float = 0.0, drop_rate: float = 0.0, drift_ppm: float = 0.0,
+                 device_clock_offset: int = 0, seed: int = None):
+        self.capabilities = list(capabilities)
+        self.system_ready_msg = system_ready_msg
+        self.send_device_time = send_device_time
+        self.jitter = jitter  # Standard deviation in seconds of the send time of each hit
+        self.drop_rate = drop_rate  # Chance that a message loses one of its bytes
+        self.drift_rate = 1.0 + drift_ppm * 1e-6
+        self.device_clock_offset = device_clock_offset
+        self.rng = random.Random(seed)
+        self.binary = False
+        self.master_fd = None
+        self.slave_fd = None
+        self.port = None
+        self.running = False
+        self.write_lock = threading.Lock()
+        self.command_thread = None
+        self.play_thread = None
+        self.clock_start = time.perf_counter()
+        # Accounting
+        self.sent_hits = 0
+        self.dropped_bytes = 0
+        self.sync_replies = 0
+
+    def start(self):
+        self.master_fd, self.slave_fd = os.openpty()
+        # No echo or line editing on the device side, like a real serial port
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self.running = True
+        self.command_thread = threading.Thread(target=self._listen_for_commands, name='simulator-commands',
+                                               daemon=True)
+        self.command_thread.start()
+        return self.port
+
+    def stop(self):
+        self.running = False
+        for thread in (self.play_thread, self.command_thread):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout=1.0)
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self.master_fd = self.slave_fd = None
+
+    def micros(self, host_time: float = None):
+        host_time = time.perf_counter() if host_time is None else host_time
+        elapsed_us = (host_time - self.clock_start) * 1e6 * self.drift_rate
+        return int(self.device_clock_offset + elapsed_us) % DEVICE_CLOCK_WRAP
+
+    def write(self, data: bytes):
+        if self.drop_rate > 0.0 and len(data) > 0 and self.rng.random() < self.drop_rate:
+            drop_idx = self.rng.randrange(len(data))
+            data = data[:drop_idx] + data[drop_idx + 1:]
+            self.dropped_bytes += 1
+        with self.write_lock:
+            os.write(self.master_fd, data)
+
+    def send_ready(self):
+        self.write(' '.join([self.system_ready_msg] + self.capabilities).encode() + b'\n')
+
+    def encode_hit(self, channel: int, amplitude: float, device_time: int):
+        if self.binary:
+            return encode_hit_frame(channel=channel, amplitude=amplitude, device_time=device_time)
+        if self.send_device_time:
+            return f"h{channel}a{amplitude}t{device_time}\n".encode()
+        return f"h{channel}a{amplitude}\n".encode()
+
+    def _listen_for_commands(self):
+        """
+        Answer the host: switch to binary frames on "bin1", reply with the device clock on "s"
+        """
+        buffer = b''
+        while self.running:
+            readable, _, _ = select.select([self.master_fd], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self.master_fd, 1024)
+            except OSError:
+                break
+            lines = buffer.split(b'\n')
+            buffer = lines.pop()
+            for line in lines:
+                command = line.strip().decode(errors='replace')
+                if command == BINARY_PROTOCOL and BINARY_PROTOCOL in self.capabilities:
+                    self.binary = True
+                elif command == 's' and SYNC_CAPABILITY in self.capabilities:
+                    device_time = self.micros()
+                    if self.binary:
+                        self.write(encode_hit_frame(channel=SYNC_CHANNEL, amplitude=0.0, device_time=device_time))
+                    else:
+                        self.write(f"s{device_time}\n".encode())
+                    self.sync_replies += 1
+
+    def play(self, hits, start_delay: float = 0.0, block: bool = False):
+        """
+        Send a stream of SimulatedHits in real time. Every hit that is due is written in one go,
+        so rates of thousands of hits per second do not need one syscall per hit.
+        """
+        self.play_thread = threading.Thread(target=self._play, args=(list(hits), start_delay), name='simulator-play',
+                                            daemon=True)
+        self.play_thread.start()
+        if block:
+            self.play_thread.join()
+        return self.play_thread
+
+    def _play(self, hits, start_delay):
+        start_time = time.perf_counter() + start_delay
+        # Each hit is stamped with the device clock at the moment the pad was struck, then sent a bit late or early
+        schedule = []
+        for hit in hits:
+            strike_time = start_time + hit.offset
+            send_time = strike_time + (self.rng.gauss(0.0, self.jitter) if self.jitter > 0.0 else 0.0)
+            schedule.append((send_time, strike_time, hit.channel, hit.amplitude))
+        schedule.sort()
+        idx = 0
+        while self.running and idx < len(schedule):
+            now = time.perf_counter()
+            due = []
+            while idx < len(schedule) and schedule[idx][0] <= now:
+                _, strike_time, channel, amplitude = schedule[idx]
+                due.append(self.encode_hit(channel, amplitude, self.micros(strike_time)))
+                idx += 1
+            if due:
+                if self.drop_rate > 0.0:
+                    for message in due:
+                        self.write(message)
+                else:
+                    self.write(b''.join(due))
+                self.sent_hits += len(due)
+                continue
+            wait = schedule[idx][0] - now
+            # Sleep most of the way, then spin for the last half millisecond
+            if wait > 0.001:
+                time.sleep(wait - 0.0005)
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Simulated drum Arduino on a pseudo-terminal")
+    parser.add_argument('--exercise', help="play an exercise from the library perfectly")
+    parser.add_argument('--bpm', type=float, default=80.0)
+    parser.add_argument('--loops', type=int, default=1)
+    parser.add_argument('--file', help="replay hits from an 'offset channel amplitude' file")
+    parser.add_argument('--rate', type=float, default=0.0, help="generate a roll at this many hits per second")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--jitter', type=float, default=0.0, help="timing jitter std in seconds")
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--drift-ppm', type=float, default=0.0)
+    parser.add_argument('--text-only', action='store_true', help="do not offer the binary protocol")
+    parser.add_argument('--ready-delay', type=float, default=3.0)
+    args = parser.parse_args()
+    capabilities = [SYNC_CAPABILITY] if args.text_only else [BINARY_PROTOCOL, SYNC_CAPABILITY]
+    simulator = ArduinoSimulator(capabilities=capabilities, jitter=args.jitter, drop_rate=args.drop_rate,
+                                 drift_ppm=args.drift_ppm)
+    port = simulator.start()
+    print(f"Simulated Arduino on {port}, run the game with COM_PORT={port}")
+    if args.exercise:
+        exercise = ExerciseFactory().by_name(args.exercise)
+        if exercise is None:
+            print(f"No exercise named {args.exercise}")
+            sys.exit(1)
+        hits = list(hits_from_exercise(exercise, bpm=args.bpm, num_loops=args.loops))
+    elif args.file:
+        hits = list(hits_from_file(args.file))
+    else:
+        hits = list(generated_hits(rate=args.rate or 8.0, duration=args.duration))
+    time.sleep(args.ready_delay)
+    simulator.send_ready()
+    try:
+        simulator.play(hits, start_delay=1.0, block=True)
+        print(f"Sent {simulator.sent_hits} hits, dropped {simulator.dropped_bytes} bytes, "
+              f"answered {simulator.sync_replies} sync pings")
+    finally:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    run()
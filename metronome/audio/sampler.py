@@ -0,0 +1,92 @@
+import time
+import threading
+from collections import deque
+import pygame
+
+
+class DrumSampler:
+    """
+    Plays one pre-decoded sample per pad channel as soon as a hit arrives.
+    Voices are a fixed pool of reserved mixer channels, so the metronome clicks can never take them.
+    When every voice is busy the one that started first is stolen.
+    """
+
+    def __init__(self, sample_fpaths: list, num_voices: int = 8, max_amplitude: float = 100.0,
+                 min_amplitude: float = 0.0, buffer_size: int = None, clock=time.perf_counter, latency_window: int = 1024):
+        if pygame.mixer.get_init() is None:
+            raise RuntimeError("pygame.mixer must be initialised before creating a DrumSampler")
+        # pygame decodes the whole file into memory here, nothing touches the disk on a hit
+        self.samples = [pygame.mixer.Sound(fpath) for fpath in sample_fpaths]
+        self.num_voices = num_voices
+        self.max_amplitude = max_amplitude
+        self.min_amplitude = min_amplitude
+        self.buffer_size = buffer_size  # Mixer buffer in samples, as passed to pygame.mixer.pre_init
+        self.clock = clock
+        pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), num_voices + 8))
+        pygame.mixer.set_reserved(num_voices)
+        self.voices = [pygame.mixer.Channel(idx) for idx in range(num_voices)]
+        self.voice_started = [0.0] * num_voices
+        self.next_voice = 0
+        self.lock = threading.Lock()
+        self.dispatch_latencies = deque(maxlen=latency_window)
+        self.stolen_voices = 0
+
+    def output_latency(self):
+        """
+        Estimated time a sample spends in the mixer buffer before it reaches the speakers, in seconds
+        """
+        if self.buffer_size is None:
+            return 0.0
+        frequency = pygame.mixer.get_init()[0]
+        return self.buffer_size / frequency
+
+    def pick_voice(self):
+        """
+        Round-robin over idle voices, stealing the oldest one if none are free
+        """
+        for offset in range(self.num_voices):
+            idx = (self.next_voice + offset) % self.num_voices
+            if not self.voices[idx].get_busy():
+                self.next_voice = (idx + 1) % self.num_voices
+                return idx
+        self.stolen_voices += 1
+        return min(range(self.num_voices), key=self.voice_started.__getitem__)
+
+    def play(self, channel: int, amplitude: float, hit_time: float = None):
+        if not 0 <= channel < len(self.samples) or amplitude <= self.min_amplitude:
+            return None
+        volume = min(max(amplitude / self.max_amplitude, 0.0), 1.0)
+        with self.lock:
+            voice_idx = self.pick_voice()
+            voice = self.voices[voice_idx]
+            voice.stop()
+            voice.set_volume(volume)
+            voice.play(self.samples[channel])
+            play_time = self.clock()
+            self.voice_started[voice_idx] = play_time
+        if hit_time is not None:
+            self.dispatch_latencies.append(play_time - hit_time)
+        return voice_idx
+
+    def on_hit(self, hit):
+        """
+        Callback for ArduinoController.add_hit_callback, runs on the serial reader thread
+        """
+        self.play(channel=hit.channel, amplitude=hit.amplitude, hit_time=hit.time)
+
+    def latency_report(self):
+        """
+        Hit-to-sound latency in milliseconds: time from reading the hit to starting the voice,
+        plus the estimated mixer buffer delay
+        """
+        latencies = sorted(self.dispatch_latencies)
+        output_ms = self.output_latency() * 1000.0
+        if len(latencies) == 0:
+            return {'count': 0, 'output_ms': output_ms}
+        dispatch_ms = [latency * 1000.0 for latency in latencies]
+        return {'count': len(dispatch_ms),
+                'output_ms': output_ms,
+                'mean_ms': sum(dispatch_ms) / len(dispatch_ms) + output_ms,
+                'p95_ms': dispatch_ms[min(int(len(dispatch_ms) * 0.95), len(dispatch_ms) - 1)] + output_ms,
+                'max_ms': dispatch_ms[-1] + output_ms,
+                'stolen_voices': self.stolen_voices}
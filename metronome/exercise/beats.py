@@ -0,0 +1,73 @@
+from functools import lru_cache
+import numpy as np
+
+
+# Ticks per beat, the least common multiple of 1 to 16: every subdivision up to 16 lands on a whole tick
+TICKS_PER_BEAT = 720720
+
+
+class CompiledBeats:
+    """
+    A beat string like "x---,x-x,x----,-x-x-x-" compiled once into exact onsets, one entry per note.
+    Onset i is numerators[i] / denominators[i] beats from the start of the bar, as a reduced fraction, and ticks[i]
+    ticks at TICKS_PER_BEAT. coordinates holds the legacy onsets in beats rounded to 2 decimals.
+    The arrays are read-only because the compiled form is shared by every occurrence of the string.
+    """
+
+    def __init__(self, numerators, denominators, ticks, coordinates):
+        self.numerators = numerators
+        self.denominators = denominators
+        self.ticks = ticks
+        self.coordinates = coordinates
+        for values in (numerators, denominators, ticks):
+            values.flags.writeable = False
+
+    def __len__(self):
+        return len(self.ticks)
+
+
+@lru_cache(maxsize=1 << 16)
+def compile_beat_str(beat_str):
+    """
+    Compile a beat string: comma-separated beats, each split evenly between its characters, an 'x' being a note.
+    Blank beats are dropped like the legacy parser did. Cached per distinct string, which repeat heavily in a library.
+    """
+    beats = [beat.strip() for beat in (beat_str or '').split(',') if beat.strip() != '']
+    if len(beats) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return CompiledBeats(empty, empty.copy(), empty.copy(), ())
+    # One row per character of the string: the beat it belongs to, its position within the beat and the beat length
+    lengths = np.array([len(beat) for beat in beats], dtype=np.int64)
+    beat_ids = np.repeat(np.arange(len(beats), dtype=np.int64), lengths)
+    char_lengths = lengths[beat_ids]
+    positions = np.arange(len(beat_ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    notes = np.frombuffer(''.join(beats).encode('utf-32-le'), dtype=np.uint32) == ord('x')
+    beat_ids, positions, char_lengths = beat_ids[notes], positions[notes], char_lengths[notes]
+    numerators = beat_ids * char_lengths + positions
+    common = np.gcd(numerators, char_lengths)
+    # Exact for every beat length dividing TICKS_PER_BEAT, rounded to the nearest tick otherwise
+    ticks = beat_ids * TICKS_PER_BEAT + (2 * positions * TICKS_PER_BEAT + char_lengths) // (2 * char_lengths)
+    coordinates = tuple(round(beat_id + 1.0 / length * position, 2) for beat_id, length, position
+                        in zip(beat_ids.tolist(), char_lengths.tolist(), positions.tolist()))
+    return CompiledBeats(numerators // common, char_lengths // common, ticks, coordinates)
+
+
+def beats_to_ticks(beats):
+    """
+    Ticks of onsets given in beats, for patterns built from float lists rather than beat strings
+    """
+    return np.rint(np.asarray(beats, dtype=np.float64) * TICKS_PER_BEAT).astype(np.int64)
+
+
+def ticks_to_coordinates(ticks):
+    """
+    Legacy onsets in beats rounded to 2 decimals
+    """
+    return [round(tick / TICKS_PER_BEAT, 2) for tick in ticks]
+
+
+def tick_subdivisions(ticks):
+    """
+    Subdivision of the beat each onset falls on, e.g. 3 for a triplet and 5 for a quintuplet
+    """
+    return TICKS_PER_BEAT // np.gcd(np.mod(ticks, TICKS_PER_BEAT), TICKS_PER_BEAT)
@@ -0,0 +1,291 @@
+import re
+import numpy as np
+from metronome.exercise.beats import tick_subdivisions
+from metronome.exercise.character import CharacterSkills
+from metronome.exercise.timeline import CHANNEL_LIMBS
+
+
+# Subdivisions of the beat that mark triplet feel, straight feel and odd groupings
+TRIPLE_SUBDIVISIONS = (3, 6, 12)
+DUPLE_SUBDIVISIONS = (2, 4, 8, 16)
+GROUPING_SUBDIVISIONS = (5, 7, 9, 10, 11, 13, 14, 15)
+SKILL_NAMES = tuple(CharacterSkills().skill_names)
+# Phrases in an exercise or pattern name that mark it as practice for a skill, matched on whole words
+SKILL_KEYWORDS = {
+    'singles': ('singles', 'single stroke', 'alternating', 'hand to hand'),
+    'doubles': ('doubles', 'double stroke', 'stroke roll'),
+    'precision': ('warmup', 'cooldown', 'quarter note'),
+    'beats': ('beat', 'beats', 'rock', 'groove', 'four on the floor'),
+    'fills': ('fill', 'fills'),
+    'speed': ('speed', 'burst', 'bursts'),
+    'independence': ('independence', 'coordination'),
+    'patterns': ('pattern', 'patterns', 'ostinato'),
+    'hand_independence': ('hand independence',),
+    'foot_independence': ('foot independence', 'happy feet'),
+    'paradiddles': ('paradiddle', 'paradiddles'),
+    'rev_paradiddles': ('rev paradiddle', 'rev paradiddles', 'reverse paradiddle', 'reverse paradiddles'),
+    'flams_and_drags': ('flam', 'flams', 'drag', 'drags', 'ruff', 'ruffs'),
+    'ghost_notes': ('ghost', 'ghost notes'),
+    'accents': ('accent', 'accents', 'accented'),
+    'paradiddlediddles': ('paradiddlediddle', 'paradiddlediddles', 'paradiddle diddle', 'paradiddle diddles'),
+    'rev_paradiddlediddles': ('rev paradiddlediddle', 'rev paradiddlediddles', 'reverse paradiddlediddle',
+                              'reverse paradiddlediddles'),
+    'linear_drumming': ('linear',),
+    'double_bass': ('double bass',),
+    'double_bass_independence': ('double bass independence',),
+    'complexity': ('complex', 'advanced'),
+    'leading_lagging': ('leading', 'lagging', 'push', 'pull'),
+    'polyrhythms': ('polyrhythm', 'polyrhythms'),
+    'odd_time': ('odd time', 'odd meter'),
+    'groupings': ('grouping', 'groupings', 'quintuplets', 'septuplets'),
+    'half_and_double_time': ('half time', 'double time'),
+}
+
+
+def phrase_skill_bits():
+    """
+    The keywords as word tuples, each mapped to the bits of the skills it marks
+    """
+    bits = {}
+    for skill_idx, skill in enumerate(SKILL_NAMES):
+        for phrase in SKILL_KEYWORDS.get(skill, ()):
+            bits[tuple(phrase.split())] = bits.get(tuple(phrase.split()), 0) | 1 << skill_idx
+    return bits
+
+
+PHRASE_SKILL_BITS = phrase_skill_bits()
+MAX_PHRASE_WORDS = max(len(phrase) for phrase in PHRASE_SKILL_BITS)
+FIRST_PHRASE_WORDS = {phrase[0] for phrase in PHRASE_SKILL_BITS}
+
+
+def normalize_name(name):
+    """
+    Lookup key of an exercise name, case and spaces don't matter
+    """
+    return name.lower().replace(' ', '')
+
+
+def name_tokens(name):
+    return re.findall(r'[a-z0-9]+', name.lower())
+
+
+def keyword_skill_bits(tokens):
+    """
+    Bits of every skill with a keyword among the runs of consecutive words
+    """
+    bits = 0
+    for start, token in enumerate(tokens):
+        if token in FIRST_PHRASE_WORDS:
+            for stop in range(start + 1, min(start + MAX_PHRASE_WORDS, len(tokens)) + 1):
+                bits |= PHRASE_SKILL_BITS.get(tuple(tokens[start:stop]), 0)
+    return bits
+
+
+def segment_reduce(ufunc, values, starts, identity=0):
+    """
+    ufunc reduced over each segment values[starts[i]:starts[i + 1]], identity for empty segments
+    """
+    counts = np.diff(starts)
+    out = np.full(len(counts), identity, dtype=values.dtype)
+    nonempty = counts > 0
+    if nonempty.any():
+        out[nonempty] = ufunc.reduceat(values, starts[:-1][nonempty])
+    return out
+
+
+def subdivision_bits(subdivisions):
+    """
+    Bit of each subdivision in a subdivision mask, 0 for those too fine to have one
+    """
+    subdivisions = np.asarray(subdivisions, dtype=np.int64)
+    return np.where(subdivisions < 63, np.left_shift(1, np.minimum(subdivisions, 62)), 0)
+
+
+def subdivision_mask(subdivisions):
+    return int(np.bitwise_or.reduce(subdivision_bits(subdivisions)))
+
+
+def group_by_key(keys, values, num_keys):
+    """
+    Inverted index from parallel (key, value) arrays: for each key, the sorted unique values paired with it
+    """
+    num_values = int(values.max(initial=0)) + 1
+    pairs = np.unique(keys.astype(np.int64) * num_values + values)
+    pair_keys, pair_values = pairs // num_values, (pairs % num_values).astype(np.int32)
+    bounds = np.searchsorted(pair_keys, np.arange(num_keys + 1))
+    return [pair_values[bounds[key]:bounds[key + 1]] for key in range(num_keys)]
+
+
+class ExerciseCatalog:
+    """
+    Indexes and per-exercise stats over an ExerciseLibrary, built once from its flat arrays.
+    Names are in a hash index, tags (words of the exercise and pattern names), skills and limbs in inverted indexes
+    of sorted exercise indices, and the stats are numpy columns with one row per exercise,
+    so lookups are a dict access and filtered listings a few array intersections and comparisons.
+    Skills are those of CharacterSkills, inferred from SKILL_KEYWORDS and from the notes themselves.
+    Only the name index is built up front, the rest on the first query that needs it.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        self.num_exercises = len(library)
+        self.name_index = {}
+        for exercise_idx, name in enumerate(library.exercise_names):
+            self.name_index.setdefault(normalize_name(name), exercise_idx)
+        self.indexed = False
+
+    def build(self):
+        if not self.indexed:
+            self.compute_stats()
+            self.build_indexes()
+            self.indexed = True
+
+    def compute_stats(self):
+        library = self.library
+        num_exercises = self.num_exercises
+        pattern_starts = np.asarray(library.exercise_pattern_starts)
+        bar_starts = np.asarray(library.pattern_bar_starts)
+        note_starts = np.asarray(library.bar_note_starts)
+        num_loops = np.asarray(library.pattern_num_loops, dtype=np.int64)
+        # Owner of every pattern, bar and note
+        self.pattern_exercise = np.repeat(np.arange(num_exercises), np.diff(pattern_starts))
+        bar_exercise = np.repeat(self.pattern_exercise, np.diff(bar_starts))
+        note_bars = np.repeat(np.arange(len(note_starts) - 1), np.diff(note_starts))
+        note_exercise = bar_exercise[note_bars]
+        channels = np.asarray(library.note_channels, dtype=np.int64)
+        ticks = np.asarray(library.note_ticks)
+        # Notes per bar as played, every loop counted
+        pattern_notes = np.diff(note_starts[bar_starts])
+        pattern_bars = np.diff(bar_starts)
+        played_notes = np.bincount(self.pattern_exercise, weights=pattern_notes * num_loops, minlength=num_exercises)
+        self.num_bars = np.bincount(self.pattern_exercise, weights=pattern_bars * num_loops,
+                                    minlength=num_exercises).astype(np.int64)
+        self.notes_per_bar = played_notes / np.maximum(self.num_bars, 1)
+        # Notes on each channel, a channel is active if it has any
+        self.channel_notes = np.bincount(note_exercise * len(CHANNEL_LIMBS) + channels,
+                                         minlength=num_exercises * len(CHANNEL_LIMBS)
+                                         ).reshape(num_exercises, len(CHANNEL_LIMBS))
+        self.channel_mask = ((self.channel_notes > 0) << np.arange(len(CHANNEL_LIMBS))).sum(axis=1).astype(np.uint8)
+        self.num_channels = (self.channel_notes > 0).sum(axis=1)
+        # The bars, and so the notes, of an exercise are contiguous, so per-exercise values are segment reductions
+        exercise_bar_starts = bar_starts[pattern_starts]
+        exercise_note_starts = note_starts[exercise_bar_starts]
+        subdivisions = tick_subdivisions(ticks)
+        self.max_subdivision = segment_reduce(np.maximum, subdivisions, exercise_note_starts)
+        # Features the skills are inferred from: triplet and duple notes in one bar, several limbs on one onset
+        bar_bits = segment_reduce(np.bitwise_or, subdivision_bits(subdivisions), note_starts)
+        mixed_bars = ((bar_bits & subdivision_mask(TRIPLE_SUBDIVISIONS)) != 0) & (
+                (bar_bits & subdivision_mask(DUPLE_SUBDIVISIONS)) != 0)
+        self.polyrhythmic = segment_reduce(np.logical_or, mixed_bars, exercise_bar_starts, identity=False)
+        self.subdivision_mask = segment_reduce(np.bitwise_or, bar_bits, exercise_bar_starts)
+        # Exact ticks, so notes on the same onset compare equal
+        bar_ticks = int(ticks.max(initial=0)) + 1
+        onsets = np.sort(note_bars * bar_ticks + ticks)
+        unison_bars = np.unique(onsets[1:][np.diff(onsets) == 0] // bar_ticks)
+        self.unison = np.zeros(num_exercises, dtype=bool)
+        self.unison[bar_exercise[unison_bars]] = True
+
+    def build_indexes(self):
+        library = self.library
+        # Every exercise owns its own name and the names of its patterns, each distinct name is tokenised once
+        names = list(library.exercise_names) + list(library.pattern_names)
+        owners = np.concatenate([np.arange(self.num_exercises), self.pattern_exercise]).astype(np.int64)
+        name_ids, distinct_names = {}, []
+        owner_name_ids = np.empty(len(names), dtype=np.int64)
+        for row, name in enumerate(names):
+            if name not in name_ids:
+                name_ids[name] = len(distinct_names)
+                distinct_names.append(name)
+            owner_name_ids[row] = name_ids[name]
+        # Tags: distinct words over all names, paired with the exercises whose names contain them
+        tag_ids, name_tag_ids, name_skill_bits = {}, [], []
+        for name in distinct_names:
+            tokens = name_tokens(name)
+            name_tag_ids.append([tag_ids.setdefault(token, len(tag_ids)) for token in dict.fromkeys(tokens)])
+            name_skill_bits.append(keyword_skill_bits(tokens))
+        tag_counts = np.array([len(ids) for ids in name_tag_ids], dtype=np.int64)
+        flat_tags = np.array([tag for ids in name_tag_ids for tag in ids], dtype=np.int64)
+        tag_starts = np.concatenate([[0], np.cumsum(tag_counts)])
+        row_counts = tag_counts[owner_name_ids]
+        row_offsets = np.arange(row_counts.sum()) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+        pair_tags = flat_tags[np.repeat(tag_starts[owner_name_ids], row_counts) + row_offsets]
+        pair_owners = np.repeat(owners, row_counts)
+        self.tag_index = dict(zip(tag_ids, group_by_key(pair_tags, pair_owners, len(tag_ids))))
+        # Skills: keywords of any owned name, or what the notes show
+        name_skill_bits = np.array(name_skill_bits, dtype=np.int64)[owner_name_ids]
+        skill_bits = name_skill_bits[:self.num_exercises] | segment_reduce(
+            np.bitwise_or, name_skill_bits[self.num_exercises:], np.asarray(library.exercise_pattern_starts))
+        skill_masks = {skill: (skill_bits >> skill_idx & 1).astype(bool) for skill_idx, skill in enumerate(SKILL_NAMES)}
+        active = self.channel_notes > 0
+        hands, feet = active[:, :2], active[:, 2:]
+        for skill, mask in (('unison', self.unison),
+                            ('speed', self.max_subdivision >= 6),
+                            ('independence', self.num_channels >= 3),
+                            ('double_bass', feet.all(axis=1)),
+                            ('double_bass_independence', feet.all(axis=1) & hands.any(axis=1)),
+                            ('polyrhythms', self.polyrhythmic),
+                            ('groupings', (self.subdivision_mask & subdivision_mask(GROUPING_SUBDIVISIONS)) != 0)):
+            if skill in skill_masks:
+                skill_masks[skill] |= mask
+        self.skill_index = {skill: np.flatnonzero(mask).astype(np.int32) for skill, mask in skill_masks.items()}
+        self.limb_index = {limb: np.flatnonzero(active[:, channel]).astype(np.int32)
+                           for channel, limb in enumerate(CHANNEL_LIMBS)}
+
+    def __len__(self):
+        return self.num_exercises
+
+    def index_of(self, exercise_name):
+        return self.name_index.get(normalize_name(exercise_name))
+
+    def tags(self):
+        self.build()
+        return sorted(self.tag_index)
+
+    def stats(self, exercise_idx):
+        self.build()
+        return {'name': self.library.exercise_names[exercise_idx],
+                'num_bars': int(self.num_bars[exercise_idx]),
+                'notes_per_bar': float(self.notes_per_bar[exercise_idx]),
+                'max_subdivision': int(self.max_subdivision[exercise_idx]),
+                'active_channels': [limb for channel, limb in enumerate(CHANNEL_LIMBS)
+                                    if self.channel_mask[exercise_idx] >> channel & 1],
+                'skills': [skill for skill in SKILL_NAMES if self.has(self.skill_index[skill], exercise_idx)]}
+
+    @staticmethod
+    def has(indices, exercise_idx):
+        pos = int(np.searchsorted(indices, exercise_idx))
+        return pos < len(indices) and indices[pos] == exercise_idx
+
+    def select(self, tags=(), skills=(), limbs=(), min_subdivision=None, max_subdivision=None,
+               min_notes_per_bar=None, max_notes_per_bar=None):
+        """
+        Indices of the exercises that have every tag, skill and limb asked for and whose stats are in range.
+        Unknown tags, skills or limbs match nothing.
+        """
+        self.build()
+        postings = []
+        for index, keys in ((self.tag_index, [token for tag in tags for token in name_tokens(tag)]),
+                            (self.skill_index, skills), (self.limb_index, limbs)):
+            for key in keys:
+                postings.append(index.get(key, np.zeros(0, dtype=np.int32)))
+        if postings:
+            # Intersect the shortest lists first, so the work is bounded by the rarest key
+            postings.sort(key=len)
+            selected = postings[0]
+            for posting in postings[1:]:
+                if len(selected) == 0:
+                    break
+                selected = np.intersect1d(selected, posting, assume_unique=True)
+        else:
+            selected = np.arange(self.num_exercises, dtype=np.int32)
+        keep = np.ones(len(selected), dtype=bool)
+        for column, low, high in ((self.max_subdivision, min_subdivision, max_subdivision),
+                                  (self.notes_per_bar, min_notes_per_bar, max_notes_per_bar)):
+            if low is not None:
+                keep &= column[selected] >= low
+            if high is not None:
+                keep &= column[selected] <= high
+        return selected[keep]
+
+    def names(self, exercise_idxs):
+        return [self.library.exercise_names[exercise_idx] for exercise_idx in exercise_idxs]
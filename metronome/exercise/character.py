@@ -1,11 +1,66 @@
+import heapq
+
+
+# Judged notes after which an observation weighs half as much as the newest one
+SKILL_HALF_LIFE = 50
+SKILL_DECAY = 0.5 ** (1.0 / SKILL_HALF_LIFE)
+# Mean absolute timing error in ms that halves a skill's level
+TIMING_SCALE_MS = 20.0
+
+
 class Skill:
+    """
+    A skill whose level follows the notes judged while training it, through exponentially weighted moving averages
+    of the accuracy (1 for a hit, 0 for a miss) and of the signed and absolute timing error of the hits.
+    The averages are bias corrected, so the first notes count fully instead of being pulled towards the start value.
+    The level goes from 0 (untrained, or never on time) to 1 (every note hit dead on).
+    """
+
     def __init__(self, name: str, level: float, difficulty_idx):
         self.name = name
         self.level = level
         self.difficulty_idx = difficulty_idx
+        self.samples = 0
+        # Weighted sums, and the total weight they were accumulated with
+        self.hit_sum, self.hit_weight = 0.0, 0.0
+        self.error_sum, self.abs_error_sum, self.error_weight = 0.0, 0.0, 0.0
+        self.version = 0  # Bumped on every change of level, to spot outdated heap entries
+
+    @property
+    def accuracy(self):
+        return self.hit_sum / self.hit_weight if self.hit_weight > 0 else 0.0
+
+    @property
+    def error(self):
+        return self.error_sum / self.error_weight if self.error_weight > 0 else 0.0
+
+    @property
+    def abs_error(self):
+        return self.abs_error_sum / self.error_weight if self.error_weight > 0 else 0.0
+
+    def observe(self, hit: bool, error_ms: float = None, count: int = 1):
+        """
+        Fold in count judged notes at once, all hits with the same error or all misses, in O(1)
+        """
+        decay = SKILL_DECAY ** count
+        self.hit_sum = self.hit_sum * decay + (1.0 - decay) * (1.0 if hit else 0.0)
+        self.hit_weight = self.hit_weight * decay + (1.0 - decay)
+        if hit and error_ms is not None:
+            self.error_sum = self.error_sum * decay + (1.0 - decay) * error_ms
+            self.abs_error_sum = self.abs_error_sum * decay + (1.0 - decay) * abs(error_ms)
+            self.error_weight = self.error_weight * decay + (1.0 - decay)
+        self.samples += count
+        self.level = self.accuracy * TIMING_SCALE_MS / (TIMING_SCALE_MS + self.abs_error)
+        self.version += 1
 
 
 class CharacterSkills:
+    """
+    The skills of a character, kept in a min-heap on level so that the weakest one is found in O(log n).
+    Updating a skill pushes a new entry instead of moving the old one, outdated entries are dropped when they surface
+    and the heap is rebuilt once they outnumber the skills.
+    """
+
     def __init__(self, interests=None, **kwargs):
         if interests is None:
             interests = ["singles", "doubles", "unison", "precision", "beats", "fills", "speed", "independence",
@@ -18,13 +73,39 @@ class CharacterSkills:
         self.skill_names = interests
         self.skills = [kwargs.get(skill, Skill(name=skill, level=0.0, difficulty_idx=idx))
                        for idx, skill in enumerate(self.skill_names)]
+        self.skill_index = {skill.name: idx for idx, skill in enumerate(self.skills)}
+        self.rebuild_heap()
+
+    def rebuild_heap(self):
+        # Ties go to the skill listed first
+        self.heap = [(skill.level, idx, skill.version) for idx, skill in enumerate(self.skills)]
+        heapq.heapify(self.heap)
+
+    def observe(self, skill_idxs, hit: bool, error_ms: float = None, count: int = 1):
+        """
+        Update the skills at skill_idxs with count judged notes, O(log n) each
+        """
+        for idx in skill_idxs:
+            skill = self.skills[idx]
+            skill.observe(hit, error_ms=error_ms, count=count)
+            heapq.heappush(self.heap, (skill.level, idx, skill.version))
+        if len(self.heap) > 4 * len(self.skills) + 16:
+            self.rebuild_heap()
 
     def get_weakest_skill(self):
-        max_skill = 0.0
-        for each_skill in self.skills:
-            if each_skill.level <= max_skill:
-                return each_skill
-        return self.skills[0]
+        """
+        Lowest level skill, None without any skill
+        """
+        heap = self.heap
+        while heap and heap[0][2] != self.skills[heap[0][1]].version:
+            heapq.heappop(heap)
+        if not heap:
+            if len(self.skills) == 0:
+                return None
+            # Every entry was outdated, skills updated behind the heap's back
+            self.rebuild_heap()
+            heap = self.heap
+        return self.skills[heap[0][1]]
 
 
 class Character:
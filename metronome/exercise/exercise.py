@@ -1,5 +1,6 @@
 
 from config import Config
+from metronome.exercise.beats import beats_to_ticks, compile_beat_str
 
 
 class Pattern:
@@ -7,7 +8,7 @@ class Pattern:
     Pattern of beats for each voice
     """
     def __init__(self, name, left_foot: list = None, right_foot: list = None,
-                 left_hand: list = None, right_hand: list = None, num_loops: int = 1):
+                 left_hand: list = None, right_hand: list = None, num_loops: int = 1, ticks: dict = None):
         self.name = name
         # List of lists of bars to be repeated in a loop
         # Like [[0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.5], ... ] for 8th note beats
@@ -16,6 +17,8 @@ class Pattern:
         self.left_hand = left_hand
         self.right_hand = right_hand
         self.num_loops = num_loops
+        # Exact onsets when known: limb name -> one array of ticks per bar, see metronome.exercise.beats
+        self.ticks = ticks
         self.num_bars = max(len(self.left_foot or []), len(self.right_foot or []),
                             len(self.left_hand or []), len(self.right_hand or []))
         self.current_idx = 0
@@ -35,23 +38,10 @@ class Pattern:
     @staticmethod
     def beat_str_to_coordinates(beat_str):
         """
-        Parse a beat string like "x---,x---,x---,x---" into timing coordinates for the game.
+        Parse a beat string like "x---,x---,x---,x---" into timing coordinates for the game, rounded to 2 decimals.
+        The exact onsets are in compile_beat_str(beat_str).
         """
-        if beat_str is None:
-            return []
-        beats = [beat.strip() for beat in beat_str.split(',') if beat.strip() != '']
-        if len(beats) == 0:
-            return []
-        out_bars = []
-        for idx, beat in enumerate(beats):
-            out_bar = []
-            if len(beat) > 0:
-                increment = 1.0 / len(beat)
-                for note_idx, note in enumerate(beat):
-                    if note == 'x':
-                        out_bar.append(round(idx + increment * note_idx, 2))
-            out_bars.extend(out_bar)
-        return out_bars
+        return list(compile_beat_str(beat_str).coordinates)
 
     @classmethod
     def from_tsv(cls, name, left_foot: list = None, right_foot: list = None,
@@ -60,17 +50,22 @@ class Pattern:
         Parse a pattern from a TSV list of pattern strings like
         ["x---,x---,x---,x---", "x-x,-x-,x-x,-x-", "x---,x---,x---,x---"]
         """
-        if left_foot is not None:
-            left_foot = [cls.beat_str_to_coordinates(lf) for lf in left_foot]
-        if right_foot is not None:
-            right_foot = [cls.beat_str_to_coordinates(rf) for rf in right_foot]
-        if left_hand is not None:
-            left_hand = [cls.beat_str_to_coordinates(lh) for lh in left_hand]
-        if right_hand is not None:
-            right_hand = [cls.beat_str_to_coordinates(rh) for rh in right_hand]
-        return cls(name=name,
-                   left_foot=left_foot, right_foot=right_foot, left_hand=left_hand, right_hand=right_hand,
-                   num_loops=num_loops)
+        limbs = {'left_foot': left_foot, 'right_foot': right_foot, 'left_hand': left_hand, 'right_hand': right_hand}
+        num_bars = max(len(beat_strs or []) for beat_strs in limbs.values())
+        coordinates, ticks = {}, {}
+        for limb, beat_strs in limbs.items():
+            compiled = [compile_beat_str(beat_str) for beat_str in beat_strs or [None] * num_bars]
+            coordinates[limb] = None if beat_strs is None else [list(bar.coordinates) for bar in compiled]
+            ticks[limb] = [bar.ticks for bar in compiled]
+        return cls(name=name, num_loops=num_loops, ticks=ticks, **coordinates)
+
+    def bar_ticks(self, limb, bar_idx):
+        """
+        Exact onsets of one limb in a bar, in ticks from the start of the bar
+        """
+        if self.ticks is not None:
+            return self.ticks[limb][bar_idx]
+        return beats_to_ticks(getattr(self, limb)[bar_idx])
 
     def __getitem__(self, idx):
         bar_idx = idx % self.num_bars
@@ -109,34 +104,18 @@ class Exercise:
         self.pattern_idx = 0
 
     @classmethod
-    def from_tsv(cls, exercise_str):
-        # Break the string into relevant sections and split into lists
-        exercise_lines = exercise_str.replace('\n\n', '\n').split('\n')
-        name = exercise_lines[0].replace('\t', '')
-        pattern_names = exercise_lines[1].split('\t')[1:]
-        rh = exercise_lines[2].split('\t')[1:]
-        lh = exercise_lines[3].split('\t')[1:]
-        rf = exercise_lines[4].split('\t')[1:]
-        lf = exercise_lines[5].split('\t')[1:]
-        loops = exercise_lines[6].split('\t')[1:]
-        # Iterate over loops, adding patterns in chunks with num_loops identifying the first member of the loop
-        pattern_list = []
-        for idx, num_loops in enumerate(loops):
-            if num_loops == '':
-                pass
-            else:
-                end_idx = idx
-                for next_idx in range(idx + 1, len(loops)):
-                    if loops[next_idx] != '':
-                        end_idx = next_idx - 1
-                        break
-                end_idx += 1
-                new_pattern = Pattern.from_tsv(name=pattern_names[idx],
-                                               left_foot=lf[idx:end_idx], right_foot=rf[idx:end_idx],
-                                               right_hand=rh[idx:end_idx], left_hand=lh[idx:end_idx],
-                                               num_loops=int(num_loops))
-                pattern_list.append(new_pattern)
-        return cls(name=name, patterns=pattern_list)
+    def from_tsv(cls, exercise_str, fpath='<string>', line=1):
+        """
+        Parse one exercise block, the text after its '!!!' marker: the name, then the N, RH, LH, RF, LF and Loops rows.
+        Raises an ExerciseParseError pointing at the line and column of the problem.
+        """
+        # Imported here because the parser builds Exercise and Pattern objects from this module
+        from metronome.exercise.parser import ExerciseBlock
+        lines = exercise_str.split('\n')
+        rows = [(line + offset, cells) for offset, cells in enumerate(row.rstrip('\r').split('\t') for row in lines)
+                if offset > 0 and any(cell.strip() != '' for cell in cells)]
+        block = ExerciseBlock(name=lines[0].replace('\t', '').strip(), rows=rows, fpath=fpath, line=line)
+        return block.parse()
 
     def __iter__(self):
         return self
@@ -174,26 +153,41 @@ class Exercise:
 
 class ExerciseFactory:
     """
-    Load exercises from csv
+    Load exercises from csv, through the compiled library that is parsed once per process and cached on disk
     """
-    def __init__(self):
-        self.csv_fpath = Config.EXERCISE_CSV_FPATH
-        with open('./data/exercises.tsv', 'r') as fp:
-            exercise_lines = '\n'.join(fp.readlines())
-        exercise_groups = exercise_lines.split('!!!')[1:]
-        self.exercises = [Exercise.from_tsv(ex_group) for ex_group in exercise_groups]
+    def __init__(self, csv_fpath: str = None):
+        # Imported here because the library builds Exercise and Pattern objects from this module
+        from metronome.exercise.library import load_library
+        self.csv_fpath = csv_fpath or Config.EXERCISE_CSV_FPATH
+        self.library = load_library(self.csv_fpath)
+        self._exercises = None
+
+    @property
+    def exercises(self):
+        if self._exercises is None:
+            self._exercises = [self.library.exercise(idx) for idx in range(len(self.library))]
+        return self._exercises
 
     def by_name(self, exercise_name):
-        exercise_name = exercise_name.lower().replace(' ', '')
-        for exercise in self.exercises:
-            assert isinstance(exercise, Exercise)
-            if exercise.name.lower().replace(' ', '') == exercise_name:
-                return exercise
-        return None
-
-    def list_names(self):
-        return [ex.name for ex in self.exercises]
-
-
+        exercise_idx = self.library.index_of(exercise_name)
+        if exercise_idx is None:
+            return None
+        return self.library.exercise(exercise_idx)
 
+    def timeline(self, exercise_name, beats_per_bar: int = 4):
+        """
+        Compiled Timeline of an exercise, shared by every game on this library
+        """
+        exercise_idx = self.library.index_of(exercise_name)
+        if exercise_idx is None:
+            return None
+        return self.library.timeline(exercise_idx, beats_per_bar=beats_per_bar)
 
+    def list_names(self, **filters):
+        """
+        Every exercise name, or only those matching ExerciseCatalog.select filters like skills=['paradiddles']
+        """
+        if not filters:
+            return list(self.library.exercise_names)
+        catalog = self.library.catalog
+        return catalog.names(catalog.select(**filters))
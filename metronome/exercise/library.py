@@ -0,0 +1,221 @@
+import os
+import json
+import hashlib
+from array import array
+import numpy as np
+from metronome.exercise.beats import ticks_to_coordinates
+from metronome.exercise.catalog import ExerciseCatalog
+from metronome.exercise.exercise import Exercise, Pattern
+from metronome.exercise.parser import ExerciseParser
+from metronome.exercise.timeline import CHANNEL_LIMBS, Timeline
+
+
+# Bump whenever the compiled layout or the parsing rules change, older caches are then rebuilt
+CACHE_VERSION = 4
+CACHE_SUFFIX = '.cache'
+ARRAY_NAMES = ('exercise_pattern_starts', 'pattern_num_loops', 'pattern_bar_starts', 'bar_note_starts',
+               'note_ticks', 'note_channels')
+
+
+def file_digest(fpath, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(fpath, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExerciseLibrary:
+    """
+    Every exercise of a TSV file compiled into flat numpy arrays plus a name table.
+    Exercises are rebuilt from the arrays only when asked for, so a large library costs a few array loads.
+    The compiled form is persisted in a directory next to the source, memory-mapped on load
+    and rebuilt whenever the source's content hash changes. The exercises that failed to parse are cached with it
+    as (name, error) pairs in skipped, and reported again on every load from the cache.
+    """
+
+    def __init__(self, exercise_names, pattern_names, exercise_pattern_starts, pattern_num_loops, pattern_bar_starts,
+                 bar_note_starts, note_ticks, note_channels, skipped=None):
+        self.exercise_names = exercise_names
+        self.skipped = skipped or []
+        self.pattern_names = pattern_names
+        # exercise i has patterns exercise_pattern_starts[i]:exercise_pattern_starts[i + 1], likewise for the
+        # bars of a pattern and the notes of a bar. Notes are grouped by channel within a bar, in source order.
+        self.exercise_pattern_starts = exercise_pattern_starts
+        self.pattern_num_loops = pattern_num_loops
+        self.pattern_bar_starts = pattern_bar_starts
+        self.bar_note_starts = bar_note_starts
+        self.note_ticks = note_ticks  # Exact onsets within the bar at TICKS_PER_BEAT
+        self.note_channels = note_channels
+        self.timelines = {}
+        self._catalog = None
+
+    def __len__(self):
+        return len(self.exercise_names)
+
+    @classmethod
+    def from_exercises(cls, exercises):
+        """
+        Compile any iterable of exercises, consumed once, into compact typed arrays
+        """
+        exercise_names, pattern_names = [], []
+        exercise_pattern_starts, pattern_bar_starts, bar_note_starts = array('q', [0]), array('q', [0]), array('q', [0])
+        pattern_num_loops, note_ticks, note_channels = array('i'), array('q'), array('b')
+        for exercise in exercises:
+            exercise_names.append(exercise.name)
+            for pattern in exercise.patterns:
+                pattern_names.append(pattern.name)
+                pattern_num_loops.append(pattern.num_loops)
+                for bar_idx in range(pattern.num_bars):
+                    for channel, limb in enumerate(CHANNEL_LIMBS):
+                        ticks = pattern.bar_ticks(limb, bar_idx)
+                        note_ticks.extend(ticks.tolist())
+                        note_channels.extend([channel] * len(ticks))
+                    bar_note_starts.append(len(note_ticks))
+                pattern_bar_starts.append(len(bar_note_starts) - 1)
+            exercise_pattern_starts.append(len(pattern_names))
+        return cls(exercise_names=exercise_names, pattern_names=pattern_names,
+                   exercise_pattern_starts=np.frombuffer(exercise_pattern_starts, dtype=np.int64),
+                   pattern_num_loops=np.frombuffer(pattern_num_loops, dtype=np.int32),
+                   pattern_bar_starts=np.frombuffer(pattern_bar_starts, dtype=np.int64),
+                   bar_note_starts=np.frombuffer(bar_note_starts, dtype=np.int64),
+                   note_ticks=np.frombuffer(note_ticks, dtype=np.int64),
+                   note_channels=np.frombuffer(note_channels, dtype=np.int8))
+
+    @classmethod
+    def from_tsv(cls, fpath, skip_errors: bool = True):
+        """
+        Stream and compile a TSV library. Bad exercises are reported and left out unless skip_errors is False.
+        """
+        parser = ExerciseParser(fpath, skip_errors=skip_errors)
+        library = cls.from_exercises(parser.exercises())
+        library.skipped = [(name, str(error)) for name, error in zip(parser.skipped, parser.errors)]
+        return library
+
+    @staticmethod
+    def cache_dir(fpath):
+        return fpath + CACHE_SUFFIX
+
+    def save(self, cache_dir, meta):
+        """
+        Write every array as .npy and the names as JSON, then the metadata that marks the cache as complete
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        meta_fpath = os.path.join(cache_dir, 'meta.json')
+        if os.path.exists(meta_fpath):
+            os.remove(meta_fpath)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(cache_dir, name + '.npy'), getattr(self, name))
+        with open(os.path.join(cache_dir, 'names.json'), 'w') as fp:
+            json.dump({'exercises': self.exercise_names, 'patterns': self.pattern_names, 'skipped': self.skipped}, fp)
+        with open(meta_fpath + '.tmp', 'w') as fp:
+            json.dump(meta, fp)
+        os.replace(meta_fpath + '.tmp', meta_fpath)
+
+    @classmethod
+    def from_cache(cls, cache_dir):
+        with open(os.path.join(cache_dir, 'names.json'), 'r') as fp:
+            names = json.load(fp)
+        arrays = {name: np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r') for name in ARRAY_NAMES}
+        skipped = [(name, error) for name, error in names['skipped']]
+        for name, error in skipped:
+            # Reported on every load, as a fresh parse would
+            print(f"skipping exercise {name!r}: {error}")
+        return cls(exercise_names=names['exercises'], pattern_names=names['patterns'], skipped=skipped, **arrays)
+
+    @classmethod
+    def load(cls, fpath):
+        """
+        Compiled library for a TSV file: from the cache when it is still valid, otherwise parsed and cached
+        """
+        stat = os.stat(fpath)
+        cache_dir = cls.cache_dir(fpath)
+        meta_fpath = os.path.join(cache_dir, 'meta.json')
+        meta = None
+        if os.path.isfile(meta_fpath):
+            with open(meta_fpath, 'r') as fp:
+                meta = json.load(fp)
+        if meta is not None and meta.get('version') == CACHE_VERSION:
+            # Same size and mtime is taken at face value, anything else is settled by the content hash
+            if meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns:
+                return cls.from_cache(cache_dir)
+            digest = file_digest(fpath)
+            if meta['sha1'] == digest:
+                meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                cls.write_meta(meta_fpath, meta)
+                return cls.from_cache(cache_dir)
+        else:
+            digest = file_digest(fpath)
+        library = cls.from_tsv(fpath)
+        try:
+            library.save(cache_dir, meta={'version': CACHE_VERSION, 'sha1': digest, 'size': stat.st_size,
+                                          'mtime_ns': stat.st_mtime_ns})
+        except OSError as e:
+            # A read-only library still works, it is just parsed on every run
+            print(f"could not cache the exercise library in {cache_dir}: {e}")
+        return library
+
+    @staticmethod
+    def write_meta(meta_fpath, meta):
+        try:
+            with open(meta_fpath + '.tmp', 'w') as fp:
+                json.dump(meta, fp)
+            os.replace(meta_fpath + '.tmp', meta_fpath)
+        except OSError:
+            pass
+
+    def exercise(self, exercise_idx):
+        """
+        Rebuild a fresh Exercise from the arrays, safe to iterate without touching anyone else's copy
+        """
+        patterns = []
+        for pattern_idx in range(self.exercise_pattern_starts[exercise_idx],
+                                 self.exercise_pattern_starts[exercise_idx + 1]):
+            limbs = {limb: [] for limb in CHANNEL_LIMBS}
+            ticks = {limb: [] for limb in CHANNEL_LIMBS}
+            for bar_idx in range(self.pattern_bar_starts[pattern_idx], self.pattern_bar_starts[pattern_idx + 1]):
+                notes = slice(self.bar_note_starts[bar_idx], self.bar_note_starts[bar_idx + 1])
+                bar_ticks, channels = np.array(self.note_ticks[notes]), self.note_channels[notes]
+                for channel, limb in enumerate(CHANNEL_LIMBS):
+                    ticks[limb].append(bar_ticks[channels == channel])
+                    limbs[limb].append(ticks_to_coordinates(ticks[limb][-1].tolist()))
+            patterns.append(Pattern(name=self.pattern_names[pattern_idx],
+                                    num_loops=int(self.pattern_num_loops[pattern_idx]), ticks=ticks, **limbs))
+        return Exercise(name=self.exercise_names[exercise_idx], patterns=patterns)
+
+    @property
+    def catalog(self):
+        """
+        Name, tag, skill and limb indexes with per-exercise stats, built on first use
+        """
+        if self._catalog is None:
+            self._catalog = ExerciseCatalog(self)
+        return self._catalog
+
+    def index_of(self, exercise_name):
+        return self.catalog.index_of(exercise_name)
+
+    def timeline(self, exercise_idx, beats_per_bar=4):
+        """
+        Compiled Timeline of an exercise, built once per beats_per_bar
+        """
+        key = (exercise_idx, beats_per_bar)
+        if key not in self.timelines:
+            self.timelines[key] = Timeline.compile(self.exercise(exercise_idx), beats_per_bar=beats_per_bar)
+        return self.timelines[key]
+
+
+# Libraries already loaded by this process, by absolute path
+loaded_libraries = {}
+
+
+def load_library(fpath):
+    """
+    Parse or load a library once per process, reloading only if the file changed on disk
+    """
+    fpath = os.path.abspath(fpath)
+    stat = os.stat(fpath)
+    key = (stat.st_size, stat.st_mtime_ns)
+    if fpath not in loaded_libraries or loaded_libraries[fpath][0] != key:
+        loaded_libraries[fpath] = (key, ExerciseLibrary.load(fpath))
+    return loaded_libraries[fpath][1]
@@ -0,0 +1,177 @@
+import re
+from metronome.exercise.exercise import Exercise, Pattern
+
+
+BLOCK_MARKER = '!!!'
+NAME_ROW = 'N'
+LOOPS_ROW = 'Loops'
+# Row label of each limb, as keyword arguments of Pattern.from_tsv
+LIMB_ROWS = {'RH': 'right_hand', 'LH': 'left_hand', 'RF': 'right_foot', 'LF': 'left_foot'}
+ROW_LABELS = (NAME_ROW, *LIMB_ROWS, LOOPS_ROW)
+INVALID_BEAT_CHAR = re.compile(r'[^x\-, ]')
+
+
+class ExerciseParseError(ValueError):
+    """
+    A malformed exercise, located by file, line and column (both 1-based, column in characters)
+    """
+
+    def __init__(self, message, fpath='<string>', line=None, column=None):
+        super().__init__(message)
+        self.message = message
+        self.fpath = fpath
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        return f"{self.fpath}:{self.line}:{self.column}: {self.message}"
+
+
+def cell_column(cells, cell_idx):
+    """
+    1-based character column where a tab-separated cell starts
+    """
+    return sum(len(cell) + 1 for cell in cells[:cell_idx]) + 1
+
+
+class ExerciseBlock:
+    """
+    The raw rows of one exercise, from its '!!!' header line up to the next one.
+    The name is known as soon as the header is read, the body is only parsed into an Exercise by parse().
+    """
+
+    def __init__(self, name, rows, fpath='<string>', line=1):
+        self.name = name
+        self.rows = rows  # (line number, cells) of every non-blank row after the header
+        self.fpath = fpath
+        self.line = line
+
+    def error(self, message, line=None, column=1):
+        return ExerciseParseError(message, fpath=self.fpath, line=self.line if line is None else line, column=column)
+
+    def labelled_rows(self):
+        labelled = {}
+        for line, cells in self.rows:
+            label = cells[0].strip()
+            if label not in ROW_LABELS:
+                raise self.error(f"unknown row {label!r} in exercise {self.name!r}, expected one of {ROW_LABELS}",
+                                 line=line)
+            if label in labelled:
+                raise self.error(f"duplicate {label} row in exercise {self.name!r}, first one on line "
+                                 f"{labelled[label][0]}", line=line)
+            labelled[label] = (line, cells)
+        for label in (NAME_ROW, LOOPS_ROW):
+            if label not in labelled:
+                raise self.error(f"exercise {self.name!r} has no {label} row")
+        return labelled
+
+    def parse(self):
+        """
+        Parse the body into an Exercise. Each number in the Loops row starts a pattern that spans every column up to
+        the next one, the last pattern runs up to the last column with anything in it.
+        """
+        if self.name is None:
+            raise self.error(f"row before the first {BLOCK_MARKER} exercise header", line=self.rows[0][0])
+        if self.name == '':
+            raise self.error("exercise without a name", column=len(BLOCK_MARKER) + 1)
+        rows = self.labelled_rows()
+        loops_line, loops = rows[LOOPS_ROW]
+        num_columns = 1 + max([idx for _, cells in rows.values() for idx, cell in enumerate(cells)
+                               if idx > 0 and cell.strip() != ''], default=0)
+        pattern_starts = []
+        for idx in range(1, num_columns):
+            num_loops = loops[idx].strip() if idx < len(loops) else ''
+            if num_loops == '':
+                continue
+            if not num_loops.isdigit() or int(num_loops) < 1:
+                raise self.error(f"Loops must be a positive integer, not {num_loops!r}", line=loops_line,
+                                 column=cell_column(loops, idx))
+            pattern_starts.append((idx, int(num_loops)))
+        if len(pattern_starts) == 0:
+            raise self.error(f"exercise {self.name!r} has no pattern, the Loops row is empty", line=loops_line)
+        limb_bars = {}
+        for label, limb in LIMB_ROWS.items():
+            line, cells = rows.get(label, (None, []))
+            bars = [cells[idx] if idx < len(cells) else '' for idx in range(num_columns)]
+            for idx, bar in enumerate(bars[1:], start=1):
+                bad_char = INVALID_BEAT_CHAR.search(bar)
+                if bad_char is not None:
+                    raise self.error(f"unexpected {bad_char.group()!r} in beat string {bar!r}, "
+                                     f"only 'x', '-' and ',' are allowed", line=line,
+                                     column=cell_column(cells, idx) + bad_char.start())
+                if idx < pattern_starts[0][0] and bar.strip() != '':
+                    raise self.error(f"notes before the first pattern, its Loops cell is on column "
+                                     f"{cell_column(loops, pattern_starts[0][0])}", line=line,
+                                     column=cell_column(cells, idx))
+            limb_bars[limb] = bars
+        names_line, names = rows[NAME_ROW]
+        patterns = []
+        for pattern_idx, (start, num_loops) in enumerate(pattern_starts):
+            stop = pattern_starts[pattern_idx + 1][0] if pattern_idx + 1 < len(pattern_starts) else num_columns
+            name = names[start].strip() if start < len(names) else ''
+            if name == '':
+                raise self.error("pattern without a name", line=names_line, column=cell_column(names, start))
+            patterns.append(Pattern.from_tsv(name=name, num_loops=num_loops,
+                                             **{limb: bars[start:stop] for limb, bars in limb_bars.items()}))
+        return Exercise(name=self.name, patterns=patterns)
+
+
+def read_blocks(lines, fpath='<string>'):
+    """
+    Group an iterable of lines into ExerciseBlocks, yielding each one as soon as the next header shows up.
+    Only the block being read is held in memory. Rows before the first header end up in a block without a name.
+    """
+    block = None
+    for line_number, line in enumerate(lines, start=1):
+        cells = line.rstrip('\r\n').split('\t')
+        if cells[0].strip() == BLOCK_MARKER:
+            if block is not None:
+                yield block
+            block = ExerciseBlock(name=''.join(cells[1:]).strip(), rows=[], fpath=fpath, line=line_number)
+        elif any(cell.strip() != '' for cell in cells):
+            if block is None:
+                block = ExerciseBlock(name=None, rows=[], fpath=fpath, line=line_number)
+            block.rows.append((line_number, cells))
+    if block is not None:
+        yield block
+
+
+class ExerciseParser:
+    """
+    Streaming parser for TSV exercise libraries.
+    The file is read line by line and every exercise is yielded as soon as its block ends, so memory stays constant
+    however large the library is. Names can be listed without parsing any body.
+    Errors are ExerciseParseErrors that point at the offending line and column. With skip_errors, a bad block is
+    reported, kept in errors (and its name in skipped) and skipped, and the rest of the file still loads.
+    """
+
+    def __init__(self, fpath, skip_errors: bool = False):
+        self.fpath = fpath
+        self.skip_errors = skip_errors
+        self.errors = []
+        self.skipped = []  # Names of the blocks that were skipped, matching errors
+
+    def blocks(self):
+        with open(self.fpath, 'r') as fp:
+            yield from read_blocks(fp, fpath=self.fpath)
+
+    def names(self):
+        for block in self.blocks():
+            if block.name is not None:
+                yield block.name
+
+    def exercises(self):
+        for block in self.blocks():
+            try:
+                exercise = block.parse()
+            except ExerciseParseError as e:
+                if not self.skip_errors:
+                    raise
+                print(f"skipping exercise {block.name!r}: {e}")
+                self.errors.append(e)
+                self.skipped.append(block.name)
+                continue
+            yield exercise
+
+    def __iter__(self):
+        return self.exercises()
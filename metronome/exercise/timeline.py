@@ -0,0 +1,153 @@
+import numpy as np
+from metronome.exercise.beats import TICKS_PER_BEAT, ticks_to_coordinates
+from metronome.exercise.exercise import Exercise
+
+
+# Channel order used by the game lanes, matching GameUI.pattern_to_targets
+CHANNEL_KEYS = ('rh', 'lh', 'rf', 'lf')
+CHANNEL_LIMBS = ('right_hand', 'left_hand', 'right_foot', 'left_foot')
+
+
+class Timeline:
+    """
+    Flat, pre-sorted view of an Exercise with every loop unrolled.
+    One row per note in the parallel arrays, plus per-bar lookups so that the game never has to touch the iterator.
+    """
+
+    def __init__(self, name, beats_per_bar, onsets, beats, channels, pattern_ids, bar_ids,
+                 bar_starts, bar_patterns, pattern_names, pattern_bounds, loop_bounds, ticks=None):
+        self.name = name
+        self.beats_per_bar = beats_per_bar
+        # Per-note arrays, sorted by onset then channel
+        self.onsets = onsets  # Absolute onset in beats from the start of the exercise
+        self.beats = beats  # Onset in beats from the start of the bar
+        self.ticks = ticks  # Exact onset in ticks from the start of the bar, equal onsets compare equal here
+        self.channels = channels
+        self.pattern_ids = pattern_ids
+        self.bar_ids = bar_ids
+        # Per-bar arrays. bar_starts has num_bars + 1 entries so notes of bar i are bar_starts[i]:bar_starts[i + 1]
+        self.bar_starts = bar_starts
+        self.bar_patterns = bar_patterns
+        # Per-pattern lookups. pattern_bounds[i] is the first bar of pattern i, loop_bounds the first bar of each loop
+        self.pattern_names = pattern_names
+        self.pattern_bounds = pattern_bounds
+        self.loop_bounds = loop_bounds
+        self.num_bars = len(bar_patterns)
+        self.num_notes = len(onsets)
+
+    @classmethod
+    def compile(cls, exercise: Exercise, beats_per_bar: int = 4):
+        """
+        Unroll every pattern and loop of an exercise into flat numpy arrays
+        """
+        ticks, channels, pattern_ids, bar_ids = [], [], [], []
+        bar_starts, bar_patterns, pattern_bounds, loop_bounds = [0], [], [], []
+        bar_idx = 0
+        num_notes = 0
+        for pattern_idx, pattern in enumerate(exercise.patterns):
+            pattern_bounds.append(bar_idx)
+            # Sort each distinct bar once, by exact onset then channel, then reuse it for every loop
+            sorted_bars = []
+            for pattern_bar in range(pattern.num_bars):
+                bar_ticks = [pattern.bar_ticks(limb, pattern_bar) for limb in CHANNEL_LIMBS]
+                bar_channels = np.repeat(np.arange(len(CHANNEL_LIMBS), dtype=np.int8), [len(t) for t in bar_ticks])
+                bar_ticks = np.concatenate(bar_ticks).astype(np.int64)
+                order = np.lexsort((bar_channels, bar_ticks))
+                sorted_bars.append((bar_ticks[order], bar_channels[order]))
+            for loop_idx in range(pattern.num_loops):
+                loop_bounds.append(bar_idx)
+                for notes, note_channels in sorted_bars:
+                    ticks.append(notes)
+                    channels.append(note_channels)
+                    num_notes += len(notes)
+                    pattern_ids.append(np.full(len(notes), pattern_idx, dtype=np.int32))
+                    bar_ids.append(np.full(len(notes), bar_idx, dtype=np.int32))
+                    bar_patterns.append(pattern_idx)
+                    bar_starts.append(num_notes)
+                    bar_idx += 1
+        pattern_bounds.append(bar_idx)
+        loop_bounds.append(bar_idx)
+        ticks = np.concatenate(ticks) if ticks else np.zeros(0, dtype=np.int64)
+        bar_ids = np.concatenate(bar_ids) if bar_ids else np.zeros(0, dtype=np.int32)
+        beats = ticks / TICKS_PER_BEAT
+        return cls(name=exercise.name, beats_per_bar=beats_per_bar,
+                   onsets=bar_ids * beats_per_bar + beats,
+                   beats=beats,
+                   ticks=ticks,
+                   channels=np.concatenate(channels) if channels else np.zeros(0, dtype=np.int8),
+                   pattern_ids=np.concatenate(pattern_ids) if pattern_ids else np.zeros(0, dtype=np.int32),
+                   bar_ids=bar_ids,
+                   bar_starts=np.asarray(bar_starts, dtype=np.int64),
+                   bar_patterns=np.asarray(bar_patterns, dtype=np.int32),
+                   pattern_names=[pattern.name for pattern in exercise.patterns],
+                   pattern_bounds=np.asarray(pattern_bounds, dtype=np.int32),
+                   loop_bounds=np.asarray(loop_bounds, dtype=np.int32))
+
+    def bar_slice(self, bar_idx):
+        return slice(self.bar_starts[bar_idx], self.bar_starts[bar_idx + 1])
+
+    def bar_notes(self, bar_idx):
+        """
+        Beats within the bar and channels of every note in a bar, as array views
+        """
+        notes = self.bar_slice(bar_idx)
+        return self.beats[notes], self.channels[notes]
+
+    def bar_pattern_name(self, bar_idx):
+        return self.pattern_names[self.bar_patterns[bar_idx]]
+
+    def __getitem__(self, bar_idx):
+        """
+        Same dict layout as Pattern.__getitem__, for code that still wants per-limb lists rounded to 2 decimals
+        """
+        notes = self.bar_slice(bar_idx)
+        ticks, channels = self.ticks[notes], self.channels[notes]
+        out_bar = {'name': self.bar_pattern_name(bar_idx)}
+        for channel, key in enumerate(CHANNEL_KEYS):
+            out_bar[key] = ticks_to_coordinates(ticks[channels == channel].tolist())
+        return out_bar
+
+    def __len__(self):
+        return self.num_bars
+
+
+class TimelineCursor:
+    """
+    Read position over a Timeline. Handing out a bar and checking for the end of the exercise are both O(1).
+    """
+
+    def __init__(self, timeline: Timeline, loop: bool = True):
+        self.timeline = timeline
+        self.loop = loop
+        self.bar_idx = -1  # Index of the bar most recently handed out
+
+    def next_bar(self):
+        """
+        Advance to the next bar and return its (beats, channels) arrays. Wraps to the start when looping.
+        """
+        if self.bar_idx + 1 >= self.timeline.num_bars:
+            if not self.loop or self.timeline.num_bars == 0:
+                raise StopIteration
+            self.bar_idx = -1
+        self.bar_idx += 1
+        return self.timeline.bar_notes(self.bar_idx)
+
+    @property
+    def pattern_name(self):
+        return self.timeline.bar_pattern_name(max(self.bar_idx, 0))
+
+    @property
+    def pattern_idx(self):
+        return int(self.timeline.bar_patterns[max(self.bar_idx, 0)])
+
+    def remaining_bars(self):
+        return self.timeline.num_bars - 1 - self.bar_idx
+
+    def is_last_bar(self):
+        return self.bar_idx == self.timeline.num_bars - 1
+
+    def is_pattern_end(self):
+        return int(self.timeline.pattern_bounds[self.pattern_idx + 1]) == self.bar_idx + 1
+
+    def reset(self):
+        self.bar_idx = -1
@@ -0,0 +1,91 @@
+import heapq
+from metronome.exercise.catalog import SKILL_NAMES
+from metronome.exercise.character import CharacterSkills
+
+
+class SkillTrainer:
+    """
+    Online skill model over an exercise library, driving which exercise comes next.
+    Every judged note of the exercise being played updates the skills the catalog tags it with.
+    The next exercise is the least played one that trains the weakest skill: the weakest skill comes from the
+    CharacterSkills heap and each skill keeps its own min-heap of exercises on play count, built the first time the
+    skill is asked for, so a recommendation is O(log n) and can be refreshed between patterns.
+    """
+
+    def __init__(self, library, skills: CharacterSkills = None):
+        self.library = library
+        self.catalog = library.catalog
+        self.catalog.build()
+        if skills is None:
+            # Only the skills the library has something to practise
+            skills = CharacterSkills(interests=[skill for skill in SKILL_NAMES
+                                                if len(self.catalog.skill_index[skill]) > 0])
+        self.skills = skills
+        self.plays = [0] * len(library)
+        self.exercise_heaps = {}
+        self.exercise_idx = None
+        self.current_skills = []  # Indices in self.skills of the skills the current exercise trains
+
+    def exercise_skill_idxs(self, exercise_idx):
+        return [self.skills.skill_index[skill] for skill in self.catalog.stats(exercise_idx)['skills']
+                if skill in self.skills.skill_index]
+
+    def start_exercise(self, exercise_name):
+        """
+        Count a play of an exercise and make it the one judged notes are credited to
+        """
+        exercise_idx = self.catalog.index_of(exercise_name)
+        if exercise_idx is None:
+            raise ValueError(f"unknown exercise {exercise_name!r}")
+        self.exercise_idx = exercise_idx
+        self.current_skills = self.exercise_skill_idxs(exercise_idx)
+        self.plays[exercise_idx] += 1
+        for skill_idx in self.current_skills:
+            heap = self.exercise_heaps.get(skill_idx)
+            if heap is not None:
+                heapq.heappush(heap, (self.plays[exercise_idx], exercise_idx))
+                if len(heap) > 4 * len(self.catalog.skill_index[self.skills.skills[skill_idx].name]) + 16:
+                    del self.exercise_heaps[skill_idx]
+
+    def observe(self, hit: bool, error_ms: float = None):
+        self.skills.observe(self.current_skills, hit, error_ms=error_ms)
+
+    def observe_misses(self, count: int):
+        self.skills.observe(self.current_skills, False, count=count)
+
+    def weakest_skill(self):
+        return self.skills.get_weakest_skill()
+
+    def exercise_heap(self, skill_idx):
+        heap = self.exercise_heaps.get(skill_idx)
+        if heap is None:
+            exercise_idxs = self.catalog.skill_index.get(self.skills.skills[skill_idx].name)
+            exercise_idxs = [] if exercise_idxs is None else exercise_idxs.tolist()
+            heap = [(self.plays[exercise_idx], exercise_idx) for exercise_idx in exercise_idxs]
+            heapq.heapify(heap)
+            self.exercise_heaps[skill_idx] = heap
+        return heap
+
+    def next_exercise(self):
+        """
+        Name of the least played exercise for the weakest skill, other than the one being played if there is a choice.
+        None without skills or when the weakest skill has no exercise in the library.
+        """
+        skill = self.weakest_skill()
+        if skill is None:
+            return None
+        heap = self.exercise_heap(self.skills.skill_index[skill.name])
+        while heap and heap[0][0] != self.plays[heap[0][1]]:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        exercise_idx = heap[0][1]
+        if exercise_idx == self.exercise_idx and len(heap) > 1:
+            # Runner up: set the top aside, drop the outdated entries that surface, then put it back
+            current = heapq.heappop(heap)
+            while heap and heap[0][0] != self.plays[heap[0][1]]:
+                heapq.heappop(heap)
+            if heap:
+                exercise_idx = heap[0][1]
+            heapq.heappush(heap, current)
+        return self.library.exercise_names[exercise_idx]
@@ -0,0 +1,243 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from metronome.exercise.timeline import CHANNEL_LIMBS
+from metronome.game.recorder import SessionLog, JUDGEMENT_HIT, JUDGEMENT_MISS, JUDGEMENT_EXPIRED
+
+
+NUM_CHANNELS = len(CHANNEL_LIMBS)
+# Signed timing errors are binned in ms, anything further out lands in the first or last bin
+ERROR_RANGE_MS = 250.0
+ERROR_BIN_MS = 1.0
+NUM_ERROR_BINS = int(2 * ERROR_RANGE_MS / ERROR_BIN_MS)
+# Tempo trend bins, in BPM
+BPM_BIN = 5.0
+NUM_BPM_BINS = 80
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def find_sessions(session_root):
+    """
+    Every recorded session directory under session_root, at any depth, in name order
+    """
+    session_dirs = []
+    for dpath, dnames, fnames in os.walk(session_root):
+        if 'header.json' in fnames:
+            session_dirs.append(dpath)
+            dnames.clear()
+    return sorted(session_dirs)
+
+
+def histogram_percentiles(histogram, percentiles=PERCENTILES):
+    """
+    Percentiles of the signed error in ms from a histogram over the error bins, interpolated within a bin
+    """
+    total = histogram.sum()
+    if total == 0:
+        return [float('nan')] * len(percentiles)
+    cdf = np.cumsum(histogram)
+    ranks = np.asarray(percentiles, dtype=np.float64) / 100.0 * total
+    bins = np.minimum(np.searchsorted(cdf, ranks, side='left'), len(histogram) - 1)
+    below = cdf[bins] - histogram[bins]
+    fraction = (ranks - below) / np.maximum(histogram[bins], 1)
+    return (-ERROR_RANGE_MS + (bins + fraction) * ERROR_BIN_MS).tolist()
+
+
+def moments_report(moments):
+    """
+    Count, mean and standard deviation from (count, sum, sum of squares) rows
+    """
+    count, total, squares = moments[..., 0], moments[..., 1], moments[..., 2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares / count - mean ** 2, 0.0))
+    return count, mean, std
+
+
+class TimingSummary:
+    """
+    Mergeable timing statistics of one or more recorded sessions, all fixed-size arrays so that summaries of months of
+    sessions add up in microseconds. Errors are signed and in ms, negative when rushing ahead of the target.
+      histogram: hits per channel and error bin
+      channel_moments: count, sum and sum of squares of the error per channel
+      channel_counts: hits, expired targets and penalised misses per channel
+      bpm_moments: count, sum and sum of squares of the error per BPM bin
+      patterns: pattern name -> hits, expired targets and sum of absolute errors
+    """
+
+    def __init__(self):
+        self.num_sessions = 0
+        self.histogram = np.zeros((NUM_CHANNELS, NUM_ERROR_BINS), dtype=np.int64)
+        self.channel_moments = np.zeros((NUM_CHANNELS, 3), dtype=np.float64)
+        self.channel_counts = np.zeros((NUM_CHANNELS, 3), dtype=np.int64)
+        self.bpm_moments = np.zeros((NUM_BPM_BINS, 3), dtype=np.float64)
+        self.patterns = {}
+
+    @classmethod
+    def from_session(cls, log: SessionLog):
+        """
+        Summarize one session, with whole-column numpy operations over its judgements
+        """
+        summary = cls()
+        summary.num_sessions = 1
+        # Plain ndarray views of the memmaps, numpy operations on memmap subclasses pay for wrapping every result
+        judgements, targets, tempo = [{column: np.asarray(values) for column, values in log[table].items()}
+                                      for table in ('judgements', 'targets', 'tempo')]
+        kinds, channels = judgements['kind'], judgements['channel'].astype(np.int64)
+        known = (channels >= 0) & (channels < NUM_CHANNELS)
+        for column, kind in enumerate((JUDGEMENT_HIT, JUDGEMENT_EXPIRED, JUDGEMENT_MISS)):
+            summary.channel_counts[:, column] = np.bincount(channels[known & (kinds == kind)], minlength=NUM_CHANNELS)
+        hits = known & (kinds == JUDGEMENT_HIT)
+        times, hit_channels = judgements['time'][hits], channels[hits]
+        # Errors are logged in beats, the tempo at the time of the hit turns them into ms
+        if len(tempo['time']) > 0:
+            segments = np.maximum(np.searchsorted(tempo['time'], times, side='right') - 1, 0)
+            bpms = tempo['bpm'].astype(np.float64)[segments]
+        else:
+            bpms = np.full(len(times), float(log.header.get('bpm', 60)))
+        errors = judgements['error'][hits] * 60000.0 / bpms
+        # Clipped before truncating, so that truncation rounds down like floor
+        error_bins = np.clip((errors + ERROR_RANGE_MS) / ERROR_BIN_MS, 0, NUM_ERROR_BINS - 1).astype(np.int64)
+        summary.histogram += np.bincount(hit_channels * NUM_ERROR_BINS + error_bins,
+                                         minlength=NUM_CHANNELS * NUM_ERROR_BINS).reshape(NUM_CHANNELS, -1)
+        squares = errors * errors
+        for column, weights in enumerate((None, errors, squares)):
+            summary.channel_moments[:, column] = np.bincount(hit_channels, weights=weights, minlength=NUM_CHANNELS)
+        bpm_bins = np.clip(bpms / BPM_BIN, 0, NUM_BPM_BINS - 1).astype(np.int64)
+        for column, weights in enumerate((None, errors, squares)):
+            summary.bpm_moments[:, column] = np.bincount(bpm_bins, weights=weights, minlength=NUM_BPM_BINS)
+        # Hits and expired targets point back at their target, and the target at its pattern
+        pattern_names = log.header.get('patterns', [])
+        if len(pattern_names) > 0 and 'pattern' in targets and len(targets['id']) > 0:
+            judged = known & ((kinds == JUDGEMENT_HIT) | (kinds == JUDGEMENT_EXPIRED))
+            target_ids, judged_ids = targets['id'], judgements['target_id'][judged]
+            if target_ids[-1] - target_ids[0] == len(target_ids) - 1:
+                # Ids are consecutive in a session, so the row is an offset
+                rows = judged_ids - target_ids[0]
+            else:
+                rows = np.searchsorted(target_ids, judged_ids)
+            valid = (rows >= 0) & (rows < len(target_ids))
+            rows[~valid] = 0
+            valid &= target_ids[rows] == judged_ids
+            patterns = targets['pattern'].astype(np.int64)[rows]
+            valid &= (patterns >= 0) & (patterns < len(pattern_names))
+            patterns = patterns[valid]
+            judged_kinds = kinds[judged][valid]
+            abs_errors = np.zeros(len(kinds))
+            abs_errors[hits] = np.abs(errors)
+            abs_errors = abs_errors[judged][valid]
+            num_patterns = len(pattern_names)
+            pattern_hits = np.bincount(patterns, weights=judged_kinds == JUDGEMENT_HIT, minlength=num_patterns)
+            pattern_expired = np.bincount(patterns, weights=judged_kinds == JUDGEMENT_EXPIRED, minlength=num_patterns)
+            pattern_errors = np.bincount(patterns, weights=abs_errors, minlength=num_patterns)
+            for pattern_idx, name in enumerate(pattern_names):
+                values = np.array([pattern_hits[pattern_idx], pattern_expired[pattern_idx],
+                                   pattern_errors[pattern_idx]])
+                summary.patterns[name] = summary.patterns.get(name, 0.0) + values
+        return summary
+
+    def merge(self, other):
+        self.num_sessions += other.num_sessions
+        self.histogram += other.histogram
+        self.channel_moments += other.channel_moments
+        self.channel_counts += other.channel_counts
+        self.bpm_moments += other.bpm_moments
+        for name, values in other.patterns.items():
+            self.patterns[name] = self.patterns.get(name, 0.0) + values
+        return self
+
+    def channel_report(self):
+        """
+        Signed timing error distribution of each limb: count, mean, std and percentiles in ms, plus how many
+        targets expired unhit and how many penalised misses it had
+        """
+        count, mean, std = moments_report(self.channel_moments)
+        report = {}
+        for channel, limb in enumerate(CHANNEL_LIMBS):
+            report[limb] = {'hits': int(self.channel_counts[channel, 0]),
+                            'expired': int(self.channel_counts[channel, 1]),
+                            'misses': int(self.channel_counts[channel, 2]),
+                            'mean_ms': float(mean[channel]), 'std_ms': float(std[channel]),
+                            **{f"p{percentile}_ms": value for percentile, value
+                               in zip(PERCENTILES, histogram_percentiles(self.histogram[channel]))}}
+        return report
+
+    def tempo_trend(self):
+        """
+        Mean signed error per BPM bin, and the slope of a least squares line through them in ms per BPM.
+        A negative slope means rushing more, or dragging less, as the tempo goes up.
+        """
+        count, mean, std = moments_report(self.bpm_moments)
+        played = count > 0
+        bpms = (np.arange(NUM_BPM_BINS) + 0.5) * BPM_BIN
+        slope = float('nan')
+        if np.count_nonzero(played) >= 2:
+            slope = float(np.polyfit(bpms[played], mean[played], deg=1, w=np.sqrt(count[played]))[0])
+        return {'bpm': bpms[played].tolist(), 'hits': count[played].astype(np.int64).tolist(),
+                'mean_ms': mean[played].tolist(), 'std_ms': std[played].tolist(), 'slope_ms_per_bpm': slope}
+
+    def pattern_accuracy(self):
+        """
+        Share of targets hit and mean absolute error in ms of every pattern played
+        """
+        report = {}
+        for name, (hits, expired, abs_errors) in sorted(self.patterns.items()):
+            if hits + expired == 0:
+                continue
+            report[name] = {'hits': int(hits), 'expired': int(expired), 'accuracy': hits / (hits + expired),
+                            'mean_abs_ms': abs_errors / hits if hits > 0 else float('nan')}
+        return report
+
+    def consistency(self):
+        """
+        Spread of the signed error over every limb together
+        """
+        count, mean, std = moments_report(self.channel_moments.sum(axis=0))
+        percentiles = histogram_percentiles(self.histogram.sum(axis=0))
+        return {'hits': int(count), 'mean_ms': float(mean), 'std_ms': float(std),
+                **{f"p{percentile}_ms": value for percentile, value in zip(PERCENTILES, percentiles)},
+                'iqr_ms': percentiles[PERCENTILES.index(75)] - percentiles[PERCENTILES.index(25)]}
+
+    def skill_measures(self):
+        """
+        Raw measures of the timing skills listed in CharacterSkills, in ms, lower is better.
+        leading_lagging is the mean signed error, precision its spread, hand_independence how far apart the hands sit.
+        """
+        _, mean, _ = moments_report(self.channel_moments)
+        consistency = self.consistency()
+        return {'leading_lagging': abs(consistency['mean_ms']), 'precision': consistency['std_ms'],
+                'hand_independence': float(abs(mean[0] - mean[1]))}
+
+    def report(self):
+        return {'sessions': self.num_sessions, 'consistency': self.consistency(), 'skills': self.skill_measures(),
+                'channels': self.channel_report(), 'tempo': self.tempo_trend(), 'patterns': self.pattern_accuracy()}
+
+
+def summarize_session(session_dir):
+    """
+    (student, TimingSummary) of one session directory
+    """
+    log = SessionLog(session_dir)
+    return log.header.get('student'), TimingSummary.from_session(log)
+
+
+def summarize_sessions(session_dirs, processes: int = 0, chunksize: int = 16):
+    """
+    TimingSummary of every student over many sessions. With processes, sessions are read and summarized in a process
+    pool (None for one per CPU) and only the fixed-size summaries travel back to be merged.
+    """
+    if processes == 0:
+        summaries = map(summarize_session, session_dirs)
+        return merge_by_student(summaries)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return merge_by_student(pool.map(summarize_session, session_dirs, chunksize=chunksize))
+
+
+def merge_by_student(summaries):
+    students = {}
+    for student, summary in summaries:
+        if student in students:
+            students[student].merge(summary)
+        else:
+            students[student] = summary
+    return students
@@ -0,0 +1,72 @@
+import random
+from metronome.arduino.hits import Hit
+
+
+class BotPlayer:
+    """
+    Input source that plays the engine's own targets, for headless regression runs and benchmarks.
+    Hands out a hit for every target whose (possibly mistimed) hit time the engine clock has reached,
+    with a gaussian timing error in seconds (clipped at 5 sigma) and a chance of skipping the note altogether.
+    latency delays the hits of each channel by a fixed number of seconds, as a rig's pads, serial link and speakers do.
+    """
+
+    def __init__(self, timing_error: float = 0.0, miss_rate: float = 0.0, amplitude: float = 80.0, seed: int = None,
+                 latency=None):
+        self.engine = None
+        self.latency = list(latency) if latency is not None else []
+        self.timing_error = timing_error
+        self.miss_rate = miss_rate
+        self.amplitude = amplitude
+        self.rng = random.Random(seed)
+        # Target id -> timing error in seconds, None for notes the bot skips or has already played
+        self.planned = {}
+        self.played = 0
+        self.last_drain = 0.0
+
+    def attach(self, engine):
+        self.engine = engine
+        engine.input_source = self
+        return self
+
+    def plan(self):
+        if self.miss_rate > 0.0 and self.rng.random() < self.miss_rate:
+            return None
+        if self.timing_error == 0.0:
+            return 0.0
+        return min(max(self.rng.gauss(0.0, self.timing_error), -5.0 * self.timing_error), 5.0 * self.timing_error)
+
+    def drain_hits(self):
+        engine = self.engine
+        now = engine.clock.now()
+        if engine.got_first_hit is False:
+            # Count in with a hit on any pad
+            self.last_drain = now
+            return [Hit(hit_channel=0, hit_amplitude=self.amplitude, hit_time=now)]
+        # Only targets that can have come due since the last drain, allowing for the timing error
+        margin = 6.0 * self.timing_error + max(self.latency, default=0.0) + 1e-3
+        latency = self.latency
+        targets = engine.targets
+        start = targets.search(engine.tempo.beat_at(self.last_drain - margin))
+        stop = targets.search(engine.tempo.beat_at(now + margin), side='right')
+        self.last_drain = now
+        hits = []
+        for target_id, beat, channel in zip(targets.columns['id'][start:stop].tolist(),
+                                            targets.beat[start:stop].tolist(),
+                                            targets.columns['channel'][start:stop].tolist()):
+            if target_id not in self.planned:
+                self.planned[target_id] = self.plan()
+            error = self.planned[target_id]
+            if error is None:
+                continue
+            # Read through the tempo map every time, the BPM may have ramped since the target was spawned
+            hit_time = engine.tempo.time_at(beat) + error + (latency[channel] if channel < len(latency) else 0.0)
+            if hit_time <= now:
+                hits.append(Hit(hit_channel=channel, hit_amplitude=self.amplitude, hit_time=hit_time))
+                self.planned[target_id] = None
+        if len(self.planned) > 4 * len(targets) + 64:
+            # Forget culled targets
+            first_id = int(targets['id'][0]) if len(targets) > 0 else targets.next_id
+            self.planned = {target_id: error for target_id, error in self.planned.items() if target_id >= first_id}
+        self.played += len(hits)
+        hits.sort(key=lambda hit: hit.time)
+        return hits
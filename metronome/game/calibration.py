@@ -0,0 +1,209 @@
+import os
+import json
+import numpy as np
+from config import Config
+
+
+CALIBRATION_MODES = ('audio', 'visual')
+CALIBRATION_VERSION = 1
+
+
+def rig_fname(rig):
+    return ''.join(char if char.isalnum() or char in '-_' else '_' for char in rig) + '.json'
+
+
+def fit_channel_offsets(stimulus_times, hit_times, hit_channels, num_channels: int = 4, max_deviations: float = 3.0,
+                        min_hits: int = 4, max_iterations: int = 10):
+    """
+    Latency of each channel from taps played along to stimuli: every tap is paired with the nearest stimulus and
+    the offset is the mean of those delays once outliers are gone. Outliers are rejected iteratively, anything more
+    than max_deviations robust standard deviations (1.4826 median absolute deviations) away from the median,
+    so double taps, missed stimuli and a tap on the wrong beat do not pull the fit. A tap can only be paired within
+    half the gap to the neighbouring stimuli, the fit cannot tell a latency from a whole beat late.
+    Returns the offsets in seconds, NaN for channels with fewer than min_hits inliers, and a fit report per channel.
+    """
+    stimulus_times = np.sort(np.asarray(stimulus_times, dtype=np.float64))
+    hit_times = np.asarray(hit_times, dtype=np.float64)
+    hit_channels = np.asarray(hit_channels, dtype=np.int64)
+    offsets = np.full(num_channels, np.nan)
+    report = []
+    if len(stimulus_times) == 0:
+        return offsets, [{'hits': 0, 'inliers': 0} for _ in range(num_channels)]
+    # Nearest stimulus of every tap
+    if len(stimulus_times) == 1:
+        nearest = np.zeros(len(hit_times), dtype=np.int64)
+    else:
+        right = np.clip(np.searchsorted(stimulus_times, hit_times), 1, len(stimulus_times) - 1)
+        left = right - 1
+        nearest = np.where(np.abs(hit_times - stimulus_times[left]) <= np.abs(hit_times - stimulus_times[right]),
+                           left, right)
+    delays = hit_times - stimulus_times[nearest]
+    for channel in range(num_channels):
+        channel_hits = hit_channels == channel
+        channel_delays = delays[channel_hits]
+        # A stimulus answered twice only keeps its first tap
+        _, first = np.unique(nearest[channel_hits], return_index=True)
+        channel_delays = channel_delays[np.sort(first)]
+        inliers = np.ones(len(channel_delays), dtype=bool)
+        for _ in range(max_iterations):
+            if np.count_nonzero(inliers) < min_hits:
+                break
+            median = np.median(channel_delays[inliers])
+            spread = 1.4826 * np.median(np.abs(channel_delays[inliers] - median))
+            # Floor the spread at 1 ms, a perfectly steady player must not reject everything off by a microsecond
+            kept = np.abs(channel_delays - median) <= max_deviations * max(spread, 1e-3)
+            if np.array_equal(kept, inliers):
+                break
+            inliers = kept
+        num_inliers = int(np.count_nonzero(inliers))
+        fit = {'hits': int(channel_hits.sum()), 'inliers': num_inliers}
+        if num_inliers >= min_hits:
+            offsets[channel] = float(np.mean(channel_delays[inliers]))
+            fit.update(offset_ms=offsets[channel] * 1000.0, std_ms=float(np.std(channel_delays[inliers])) * 1000.0)
+        report.append(fit)
+    return offsets, report
+
+
+class LatencyCalibration:
+    """
+    Per-channel latencies of one rig (pads, serial link, speakers and display), persisted as JSON per rig.
+      audio_offsets: delay from a click being played to the tap answering it, per channel, in seconds
+      visual_offsets: delay from a flash being drawn to the tap answering it, per channel, in seconds
+    Judging takes the audio offset of its channel off every pad hit, so a player on the beat they hear scores 0.
+    Rendering runs visual_lead seconds ahead, so that what they see lines up with what they hear.
+    """
+
+    def __init__(self, rig: str = 'default', audio_offsets=None, visual_offsets=None, fits=None):
+        self.rig = rig
+        self.audio_offsets = list(audio_offsets) if audio_offsets is not None else []
+        self.visual_offsets = list(visual_offsets) if visual_offsets is not None else []
+        self.fits = fits or {}
+
+    @staticmethod
+    def default_rig():
+        return Config.RIG_NAME
+
+    @classmethod
+    def for_rig(cls, rig=None, calibration_dir=None):
+        """
+        The saved calibration of a rig, or an empty one that changes nothing
+        """
+        rig = rig or cls.default_rig()
+        fpath = os.path.join(calibration_dir or Config.CALIBRATION_DIR, rig_fname(rig))
+        if not os.path.isfile(fpath):
+            return cls(rig=rig)
+        return cls.load(fpath)
+
+    @classmethod
+    def load(cls, fpath):
+        with open(fpath, 'r') as fp:
+            data = json.load(fp)
+        return cls(rig=data['rig'], audio_offsets=data.get('audio_offsets'),
+                   visual_offsets=data.get('visual_offsets'), fits=data.get('fits'))
+
+    def save(self, calibration_dir=None):
+        calibration_dir = calibration_dir or Config.CALIBRATION_DIR
+        os.makedirs(calibration_dir, exist_ok=True)
+        fpath = os.path.join(calibration_dir, rig_fname(self.rig))
+        with open(fpath + '.tmp', 'w') as fp:
+            json.dump({'version': CALIBRATION_VERSION, 'rig': self.rig, 'audio_offsets': self.audio_offsets,
+                       'visual_offsets': self.visual_offsets, 'fits': self.fits}, fp, indent=2)
+        os.replace(fpath + '.tmp', fpath)
+        return fpath
+
+    def update(self, mode, offsets, report):
+        """
+        Keep the newly fitted channels of a pass, channels without enough taps keep their previous offset
+        """
+        if mode not in CALIBRATION_MODES:
+            raise ValueError(f"unknown calibration mode {mode!r}, expected one of {CALIBRATION_MODES}")
+        previous = getattr(self, f"{mode}_offsets")
+        merged = [previous[channel] if channel < len(previous) else 0.0 for channel in range(len(offsets))]
+        for channel, offset in enumerate(offsets):
+            if not np.isnan(offset):
+                merged[channel] = float(offset)
+        setattr(self, f"{mode}_offsets", merged)
+        self.fits[mode] = report
+
+    def input_offsets(self, num_channels):
+        """
+        Seconds to take off the time of a pad hit on each channel
+        """
+        return [self.audio_offsets[channel] if channel < len(self.audio_offsets) else 0.0
+                for channel in range(num_channels)]
+
+    @property
+    def visual_lead(self):
+        """
+        How much later the display is than the speakers, in seconds, over the channels calibrated both ways
+        """
+        num_channels = min(len(self.audio_offsets), len(self.visual_offsets))
+        if num_channels == 0:
+            return 0.0
+        return float(np.mean(self.visual_offsets[:num_channels]) - np.mean(self.audio_offsets[:num_channels]))
+
+
+class Calibrator:
+    """
+    One calibration pass, headless: num_stimuli clicks or flashes period seconds apart after a lead-in, and the pad
+    hits that answer them. The stimuli are split evenly between the channels, in order, so the player can be told
+    which pad to tap. The view presents each stimulus returned by update and reports back when it actually did,
+    then fit() turns the taps into per-channel offsets.
+    """
+
+    def __init__(self, mode: str, input_source, clock, period: float = 0.5, num_stimuli: int = 64,
+                 lead_in: float = 2.0, num_channels: int = 4):
+        if mode not in CALIBRATION_MODES:
+            raise ValueError(f"unknown calibration mode {mode!r}, expected one of {CALIBRATION_MODES}")
+        self.mode = mode
+        self.input_source = input_source
+        self.clock = clock
+        self.period = period
+        self.num_stimuli = num_stimuli
+        self.lead_in = lead_in
+        self.num_channels = num_channels
+        self.scheduled = None
+        self.presented = np.full(num_stimuli, np.nan)  # When each stimulus actually went out
+        self.next_stimulus = 0
+        self.hit_times, self.hit_channels = [], []
+
+    def start(self, now=None):
+        now = self.clock.now() if now is None else now
+        self.scheduled = now + self.lead_in + np.arange(self.num_stimuli) * self.period
+        return self
+
+    def channel_of(self, stimulus_idx):
+        return min(stimulus_idx * self.num_channels // self.num_stimuli, self.num_channels - 1)
+
+    @property
+    def prompt_channel(self):
+        return self.channel_of(min(self.next_stimulus, self.num_stimuli - 1))
+
+    def update(self, now=None):
+        """
+        Collect pad hits and return the indices of the stimuli that are due
+        """
+        now = self.clock.now() if now is None else now
+        for hit in self.input_source.drain_hits():
+            self.hit_times.append(hit.time)
+            self.hit_channels.append(hit.channel)
+        due = []
+        while self.next_stimulus < self.num_stimuli and self.scheduled[self.next_stimulus] <= now:
+            due.append(self.next_stimulus)
+            self.next_stimulus += 1
+        return due
+
+    def presented_at(self, stimulus_idx, at_time):
+        self.presented[stimulus_idx] = at_time
+
+    def is_done(self, now=None):
+        now = self.clock.now() if now is None else now
+        return self.scheduled is not None and now >= self.scheduled[-1] + self.period
+
+    def fit(self, max_deviations: float = 3.0, min_hits: int = 4):
+        """
+        Offsets per channel from the taps, against the presented times where the view reported them
+        """
+        stimulus_times = np.where(np.isnan(self.presented), self.scheduled, self.presented)
+        return fit_channel_offsets(stimulus_times, self.hit_times, self.hit_channels, num_channels=self.num_channels,
+                                   max_deviations=max_deviations, min_hits=min_hits)
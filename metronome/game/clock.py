@@ -0,0 +1,27 @@
+import time
+
+
+class PerfClock:
+    """
+    Monotonic clock in seconds, read once per frame from perf_counter_ns
+    """
+
+    @staticmethod
+    def now():
+        return time.perf_counter_ns() * 1e-9
+
+
+class ManualClock:
+    """
+    Clock that only moves when told to, for driving the game engine headless and faster than real time
+    """
+
+    def __init__(self, start_time=0.0):
+        self.time = start_time
+
+    def now(self):
+        return self.time
+
+    def advance(self, seconds):
+        self.time += seconds
+        return self.time
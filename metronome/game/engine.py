@@ -0,0 +1,249 @@
+from collections import deque
+from metronome.exercise.timeline import Timeline, TimelineCursor
+from metronome.game.clock import PerfClock
+from metronome.game.entities import EntityStore
+from metronome.game.profiler import FrameProfiler
+from metronome.game.recorder import JUDGEMENT_HIT, JUDGEMENT_IGNORED, JUDGEMENT_MISS
+from metronome.game.tempo import TempoMap, TempoRamp
+
+
+class GameEngine:
+    """
+    Game state and rules with no pygame in sight: beat scheduling, target spawning, judging, scoring and BPM ramps.
+    Time only comes from the injected clock (anything with a now() in seconds) and hits only from the input source
+    (anything with a drain_hits()), so a whole exercise can be simulated headless and as fast as the CPU allows.
+    Everything is scheduled in beats. Objects are spawned lead_beats before they reach the centre line and culled
+    lead_beats after, matching a view that shows beats_on_screen beats centred on the line.
+    The tempo of each loop of the exercise is compiled from the ramp into the tempo map when its first bar spawns,
+    and the map is the only conversion between beats and clock time, for spawning, judging, drawing and the bot.
+    Targets, attempts and beat lines live in the numpy columns of an EntityStore, not in per-note objects.
+    An optional recorder (see SessionRecorder) is handed every target, raw hit, judgement and tempo change,
+    and an optional trainer (see SkillTrainer) every judged note, to update the skills the exercise trains.
+    An optional LatencyCalibration takes each channel's latency off pad hits before they are judged, and moves
+    render_beat, the beat the view draws, ahead by the display's lag behind the speakers.
+    An optional FrameProfiler times the input and object phases of every update.
+    """
+
+    def __init__(self, timeline: Timeline, bpm: float = 60, beats_per_bar: int = 4, beats_on_screen: int = 6,
+                 hit_window: float = 0.1, clock=None, input_source=None, num_channels: int = 4,
+                 hit_threshold: float = 10.0, penalize_missed_attempts: bool = False, wait_for_first_hit: bool = True,
+                 bpm_step: float = 5, rest_seconds: float = 3.0, ramp: TempoRamp = None,
+                 recorder=None, trainer=None, calibration=None, profiler: FrameProfiler = None):
+        self.clock = clock or PerfClock()
+        self.profiler = profiler if profiler is not None else FrameProfiler(enabled=False)
+        self.input_source = input_source
+        self.recorder = recorder
+        self.trainer = trainer
+        self.calibration = calibration
+        self.input_offsets = [0.0] * num_channels
+        self.visual_lead = 0.0
+        if calibration is not None:
+            self.input_offsets = calibration.input_offsets(num_channels)
+            self.visual_lead = calibration.visual_lead
+        # Game settings
+        self.bpm = bpm
+        self.tempo = TempoMap(bpm=bpm, start_time=self.clock.now())
+        self.beats_per_bar = beats_per_bar
+        self.beats_on_screen = beats_on_screen
+        self.lead_beats = beats_on_screen / 2.0
+        self.hit_window = hit_window  # In beats either side of a target
+        self.num_channels = num_channels
+        self.hit_threshold = hit_threshold  # out of 100
+        self.penalize_missed_attempts = penalize_missed_attempts
+        # bpm_step and rest_seconds make the default ramp: step BPM faster after each loop, with a rest in seconds
+        self.ramp = ramp or TempoRamp(curve='step', step=bpm_step, rest_seconds=rest_seconds)
+        self.timeline = timeline
+        self.cursor = TimelineCursor(timeline)
+        self.current_pattern_name = timeline.bar_pattern_name(0)
+        # Beat clock
+        self.current_beat = 0.0
+        self.render_beat = 0.0
+        self.next_spawn_beat = 1.0
+        self.next_beat = 0
+        self.targeted_beat = -1
+        self.got_first_hit = not wait_for_first_hit
+        self.completed_loops = 0
+        self.loop_ends = deque()  # Beats where the notes of the compiled loops not yet played through end
+        self.rest_beats = 0.0  # Rest after the loop being spawned
+        # Game state
+        self.entities = EntityStore(num_channels=num_channels)
+        self.targets = self.entities.targets
+        self.attempts = self.entities.attempts
+        self.lines = self.entities.lines
+        self.score = 0
+        self.misses = 0
+        self.combo = 0
+        self.max_combo = 0
+
+    def start(self, now=None):
+        """
+        Put beat 0 at now and start spawning one beat later
+        """
+        now = self.clock.now() if now is None else now
+        self.got_first_hit = True
+        self.tempo.restart(bpm=self.bpm, start_time=now)
+        if self.recorder is not None:
+            self.recorder.record_tempo(now, 0.0, self.bpm)
+        self.current_beat = 0.0
+        self.render_beat = 0.0
+        self.next_spawn_beat = 1.0
+        self.next_beat = 0
+        self.targeted_beat = -1
+
+    def set_bpm(self, new_bpm, at_time=None):
+        """
+        Change the tempo without moving anything that is already scheduled.
+        Ramp changes compiled for later in the current loop are dropped, the next loop ramps on from new_bpm.
+        """
+        self.bpm = new_bpm
+        at_time = self.clock.now() if at_time is None else at_time
+        self.tempo.set_bpm(bpm=new_bpm, at_time=at_time)
+        if self.recorder is not None:
+            self.recorder.record_tempo(at_time, self.tempo.beat_at(at_time), new_bpm)
+
+    def judge_hit(self, channel, hit_time, penalize=True):
+        """
+        Judge a hit against the nearest unjudged target on its channel and record the resulting attempt.
+        Returns whether it hit.
+        """
+        hit_beat = self.tempo.beat_at(hit_time)
+        target_idx = self.entities.judge(channel=channel, beat=hit_beat, window=self.hit_window)
+        hit = target_idx >= 0
+        if hit:
+            self.score += 1
+            self.combo += 1
+            self.max_combo = max(self.max_combo, self.combo)
+        elif penalize:
+            self.combo = 0
+            self.misses += 1
+        self.entities.spawn_attempt(beat=hit_beat, channel=channel, hit=hit)
+        # Signed timing error in beats, negative when early
+        error = hit_beat - float(self.targets.beat[target_idx]) if hit else float('nan')
+        if self.recorder is not None:
+            if hit:
+                target_id, kind = int(self.targets.columns['id'][target_idx]), JUDGEMENT_HIT
+            else:
+                target_id, kind = -1, JUDGEMENT_MISS if penalize else JUDGEMENT_IGNORED
+            self.recorder.record_judgement(hit_time, hit_beat, channel, target_id, error, kind)
+        if self.trainer is not None and (hit or penalize):
+            self.trainer.observe(hit, error_ms=error * 60000.0 / self.bpm if hit else None)
+        return hit
+
+    def key_hit(self, channel):
+        """
+        A hit from the keyboard, judged now. Keyboard misses always count.
+        """
+        return self.judge_hit(channel=channel, hit_time=self.clock.now(), penalize=True)
+
+    def break_combo(self):
+        self.combo = 0
+
+    def drain_inputs(self):
+        if self.input_source is None:
+            return []
+        hits = self.input_source.drain_hits()
+        if self.recorder is not None and len(hits) > 0:
+            self.recorder.record_hits(hits)
+        return hits
+
+    def check_inputs(self):
+        offsets = self.input_offsets
+        for new_hit in self.drain_inputs():
+            if new_hit.amplitude > self.hit_threshold:
+                # Judged at the time the player meant, before the rig's latency on that channel
+                channel = new_hit.channel
+                offset = offsets[channel] if 0 <= channel < len(offsets) else 0.0
+                self.judge_hit(channel=channel, hit_time=new_hit.time - offset, penalize=self.penalize_missed_attempts)
+
+    def spawn_bar(self, bar_beat):
+        beats, channels = self.cursor.next_bar()
+        self.current_pattern_name = self.cursor.pattern_name
+        beats = bar_beat + beats
+        first_id = self.targets.next_id
+        self.entities.spawn_targets(beats=beats, channels=channels)
+        if self.recorder is not None:
+            self.recorder.record_targets(first_id, beats, channels, self.cursor.pattern_idx)
+
+    def compile_loop(self, loop_beat):
+        """
+        Append the tempo changes of the loop starting at loop_beat to the tempo map, ahead of any of its notes
+        """
+        timeline = self.timeline
+        loop_beats = timeline.num_bars * self.beats_per_bar
+        pattern_beats = [int(bar) * self.beats_per_bar for bar in timeline.pattern_bounds[1:-1]]
+        bpm = self.tempo.bpm_at_beat(loop_beat)
+        for beat, bpm in self.ramp.loop_segments(bpm, loop_beats, pattern_beats):
+            at_time = self.tempo.append(loop_beat + beat, bpm)
+            if self.recorder is not None:
+                self.recorder.record_tempo(at_time, loop_beat + beat, bpm)
+        self.loop_ends.append(loop_beat + loop_beats)
+        self.rest_beats = self.ramp.rest_beats(bpm, self.beats_per_bar)
+
+    def spawn_due(self):
+        """
+        Spawn every beat line, and every bar of targets, whose spawn beat has been reached
+        """
+        while self.current_beat >= self.next_spawn_beat:
+            # Scheduled to reach the centre line once they have scrolled in from the right edge
+            line_beat = self.next_spawn_beat + self.lead_beats
+            if self.next_beat == 0:
+                if self.cursor.bar_idx < 0 or self.cursor.is_last_bar():
+                    # The cursor wraps back to the first bar once the exercise is over
+                    self.compile_loop(loop_beat=line_beat)
+                self.spawn_bar(bar_beat=line_beat)
+            self.entities.spawn_line(beat=line_beat, beat_idx=self.next_beat)
+            self.next_spawn_beat += 1.0
+            if self.cursor.is_last_bar() and self.next_beat == self.beats_per_bar - 1:
+                # Leave a rest before the exercise starts over
+                self.next_spawn_beat += self.rest_beats
+            self.next_beat += 1
+            self.next_beat %= self.beats_per_bar
+
+    def record_expired(self, now):
+        """
+        Hand the targets that were just culled without a hit to the recorder, copied before the ring reuses them
+        """
+        culled = self.entities.culled
+        expired = ~self.targets.columns['hit'][culled]
+        columns = self.targets.columns
+        self.recorder.record_expired(now, columns['id'][culled][expired], columns['beat'][culled][expired],
+                                     columns['channel'][culled][expired])
+
+    def update(self, now=None):
+        """
+        Advance the game to now. Returns the beat_idx of every beat line that reached the centre line,
+        so that the view can click.
+        """
+        now = self.clock.now() if now is None else now
+        self.current_beat = self.tempo.beat_at(now)
+        self.render_beat = self.tempo.beat_at(now + self.visual_lead) if self.visual_lead else self.current_beat
+        clicks = []
+        # Wait for first hit to start the game
+        if self.got_first_hit is False:
+            if len(self.drain_inputs()) > 0:
+                self.start(now=now)
+            return clicks
+        # The tempo and loop count follow the compiled map, both change exactly on a ramp's beat
+        while self.loop_ends and self.current_beat >= self.loop_ends[0]:
+            self.loop_ends.popleft()
+            self.completed_loops += 1
+        self.bpm = self.tempo.bpm_at_beat(self.current_beat)
+        with self.profiler.phase('inputs'):
+            self.check_inputs()
+        with self.profiler.phase('objects'):
+            # Click as soon as the clock has reached a line's beat, however late the update lands
+            clicks = self.entities.click(self.current_beat)
+            if len(clicks) > 0:
+                self.targeted_beat = (self.targeted_beat + len(clicks)) % self.beats_per_bar
+            # Cull everything that has scrolled off the left edge, counting the targets that were never hit
+            missed = self.entities.cull(before_beat=self.current_beat - self.lead_beats)
+            if missed > 0:
+                self.combo = 0
+                self.misses += missed
+                if self.recorder is not None:
+                    self.record_expired(now)
+                if self.trainer is not None:
+                    self.trainer.observe_misses(missed)
+            # Generate Lines and Targets
+            self.spawn_due()
+        return clicks
@@ -0,0 +1,198 @@
+import numpy as np
+
+
+class EntityRing:
+    """
+    Struct-of-arrays storage for one kind of entity, kept sorted by beat in preallocated numpy columns.
+    Live rows are [head, tail). Spawning appends at the tail, culling moves the head past everything that has
+    scrolled off, and the live block is moved back to the front only when the tail reaches the end of the arrays,
+    so a long session reuses the same memory instead of creating and collecting an object per note.
+    Every row also gets a serial id that stays the same when the block moves.
+    """
+
+    def __init__(self, capacity: int = 256, **columns):
+        self.capacity = capacity
+        self.dtypes = dict(beat=np.float64, id=np.int64, **columns)
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        self.head = 0
+        self.tail = 0
+        self.next_id = 0
+        # Aliases for the columns used on every frame
+        self.beat = self.columns['beat']
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def __getitem__(self, name):
+        """
+        View of a column over the live rows
+        """
+        return self.columns[name][self.head:self.tail]
+
+    def reserve(self, count):
+        """
+        Make room for count more rows at the tail, compacting first and growing only if that is not enough
+        """
+        if self.tail + count <= self.capacity:
+            return
+        live = self.tail - self.head
+        capacity = self.capacity
+        while live + count > capacity:
+            capacity *= 2
+        if capacity != self.capacity:
+            columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        else:
+            columns = self.columns
+        for name, column in self.columns.items():
+            columns[name][:live] = column[self.head:self.tail]
+        self.columns, self.capacity = columns, capacity
+        self.beat = self.columns['beat']
+        self.head, self.tail = 0, live
+
+    def extend(self, beats, **values):
+        """
+        Append rows sorted by beat, at or after the last live beat. Returns the slice of the new rows.
+        """
+        count = len(beats)
+        self.reserve(count)
+        rows = slice(self.tail, self.tail + count)
+        self.columns['beat'][rows] = beats
+        self.columns['id'][rows] = np.arange(self.next_id, self.next_id + count)
+        for name, value in values.items():
+            self.columns[name][rows] = value
+        self.next_id += count
+        self.tail += count
+        return rows
+
+    def append(self, beat, **values):
+        """
+        Append one row, inserted in beat order if it is earlier than the last live row. Returns its index.
+        """
+        self.reserve(1)
+        idx = self.tail
+        if self.tail > self.head and beat < self.beat[self.tail - 1]:
+            idx = self.head + int(np.searchsorted(self.beat[self.head:self.tail], beat, side='right'))
+            for column in self.columns.values():
+                column[idx + 1:self.tail + 1] = column[idx:self.tail]
+        self.columns['beat'][idx] = beat
+        self.columns['id'][idx] = self.next_id
+        for name, value in values.items():
+            self.columns[name][idx] = value
+        self.next_id += 1
+        self.tail += 1
+        return idx
+
+    def search(self, beat, side='left'):
+        """
+        Absolute index at which beat would be inserted among the live rows
+        """
+        return self.head + int(np.searchsorted(self.beat[self.head:self.tail], beat, side=side))
+
+    def cull(self, before_beat):
+        """
+        Drop every row before before_beat. Returns the slice of dropped rows, still readable until the next spawn.
+        """
+        cut = self.search(before_beat)
+        culled = slice(self.head, cut)
+        self.head = cut
+        return culled
+
+    def clear(self):
+        self.head = self.tail = 0
+
+
+class EntityStore:
+    """
+    Targets, attempts and beat lines of a game, one EntityRing each.
+    Spawning a bar, culling, counting misses and finding beat line crossings are numpy operations over whole columns.
+    Each channel also keeps its own beat-sorted ring of target ids, so judging a hit is a bisect into the targets of
+    its channel alone, however many notes the other channels have around the hit beat. There is one ring per channel
+    up to num_channels to start with, more are added as targets show up on higher channels.
+    Targets are only ever spawned with extend, so their ids are consecutive and an id maps straight to its row.
+    """
+
+    def __init__(self, capacity: int = 256, num_channels: int = 4):
+        self.targets = EntityRing(capacity, channel=np.int8, hit=np.bool_)
+        self.attempts = EntityRing(capacity, channel=np.int8, hit=np.bool_)
+        self.lines = EntityRing(capacity // 4, beat_idx=np.int8)
+        self.channel_capacity = max(capacity // num_channels, 16)
+        self.channel_targets = [EntityRing(self.channel_capacity, target_id=np.int64) for _ in range(num_channels)]
+        self.clicked = 0  # Absolute index in lines of the first line not yet clicked
+        self.culled = slice(0, 0)  # Rows of targets dropped by the last cull, readable until the next spawn
+
+    def spawn_targets(self, beats, channels):
+        channels = np.asarray(channels)
+        if len(channels) > 0:
+            if channels.min() < 0:
+                raise ValueError(f"target channels must not be negative, got {int(channels.min())}")
+            while int(channels.max()) >= len(self.channel_targets):
+                self.channel_targets.append(EntityRing(self.channel_capacity, target_id=np.int64))
+        targets = self.targets
+        first_id = targets.next_id
+        rows = targets.extend(beats, channel=channels, hit=False)
+        beats = targets.beat[rows]
+        channels = targets.columns['channel'][rows]
+        target_ids = np.arange(first_id, targets.next_id)
+        for channel, index in enumerate(self.channel_targets):
+            on_channel = channels == channel
+            if on_channel.any():
+                index.extend(beats[on_channel], target_id=target_ids[on_channel])
+        return rows
+
+    def spawn_attempt(self, beat, channel, hit):
+        return self.attempts.append(beat, channel=channel, hit=hit)
+
+    def spawn_line(self, beat, beat_idx):
+        lines = self.lines
+        if lines.tail == lines.capacity:
+            # Compaction moves the rows, keep the click position relative to the head
+            offset = self.clicked - lines.head
+            lines.reserve(1)
+            self.clicked = lines.head + offset
+        return lines.append(beat, beat_idx=beat_idx)
+
+    def judge(self, channel, beat, window):
+        """
+        Mark the nearest unjudged target on the channel within window beats as hit. Returns its index or -1.
+        """
+        if not 0 <= channel < len(self.channel_targets):
+            return -1
+        index = self.channel_targets[channel]
+        start, stop = index.search(beat - window, side='right'), index.search(beat + window)
+        if start >= stop:
+            return -1
+        targets = self.targets
+        # Rows of the candidates in the targets ring, from their consecutive ids
+        rows = index.columns['target_id'][start:stop] - (targets.next_id - len(targets)) + targets.head
+        candidates = (~targets.columns['hit'][rows]).nonzero()[0]
+        if len(candidates) == 0:
+            return -1
+        errors = np.abs(index.beat[start:stop][candidates] - beat)
+        idx = int(rows[candidates[np.argmin(errors)]])
+        targets.columns['hit'][idx] = True
+        return idx
+
+    def click(self, current_beat):
+        """
+        Beat indices of the lines crossed since the last call, in order
+        """
+        lines = self.lines
+        self.clicked = max(self.clicked, lines.head)
+        crossed = lines.search(current_beat, side='right')
+        if crossed <= self.clicked:
+            return []
+        beat_idxs = lines.columns['beat_idx'][self.clicked:crossed].tolist()
+        self.clicked = crossed
+        return beat_idxs
+
+    def cull(self, before_beat):
+        """
+        Drop everything before before_beat, returns how many of the dropped targets were never hit
+        """
+        culled = self.culled = self.targets.cull(before_beat)
+        missed = int(np.count_nonzero(~self.targets.columns['hit'][culled]))
+        for index in self.channel_targets:
+            index.cull(before_beat)
+        self.attempts.cull(before_beat)
+        self.lines.cull(before_beat)
+        return missed
@@ -0,0 +1,272 @@
+import os
+import csv
+import json
+import math
+import time
+
+
+PERCENTILES = (50, 95, 99)
+EXPORT_FIELDS = ('time', 'frames', 'kind', 'name', 'samples', 'mean', 'p50', 'p95', 'p99', 'max', 'last')
+
+
+class RollingHistogram:
+    """
+    The last `window` durations in seconds, in fixed memory: a ring of the samples and of the log-spaced bin each one
+    fell in (bins_per_decade bins a decade, from min_value to max_value), and the count of samples per bin.
+    A new sample takes the slot of the oldest one in the ring and in the counts, so recording is O(1) whatever the
+    window, and percentiles are read off the counts to within a bin, about 12% wide with 20 bins a decade.
+    """
+
+    def __init__(self, window: int = 1024, min_value: float = 1e-6, max_value: float = 1.0, bins_per_decade: int = 20):
+        self.window = window
+        self.min_value = min_value
+        self.bins_per_decade = bins_per_decade
+        self.log_min = math.log10(min_value)
+        self.num_bins = int(round((math.log10(max_value) - self.log_min) * bins_per_decade)) + 1
+        self.counts = [0] * self.num_bins
+        self.ring_values = [0.0] * window
+        self.ring_bins = [-1] * window  # -1 for slots never written
+        self.slot = 0
+        self.samples = 0  # Ever recorded, the window holds the last min(samples, window) of them
+        self.total = 0.0  # Sum over the window
+
+    def __len__(self):
+        return min(self.samples, self.window)
+
+    def record(self, value):
+        if value > self.min_value:
+            bin_idx = min(int((math.log10(value) - self.log_min) * self.bins_per_decade), self.num_bins - 1)
+        else:
+            bin_idx = 0
+        slot = self.slot
+        old_bin = self.ring_bins[slot]
+        if old_bin >= 0:
+            self.counts[old_bin] -= 1
+            self.total -= self.ring_values[slot]
+        self.counts[bin_idx] += 1
+        self.ring_bins[slot] = bin_idx
+        self.ring_values[slot] = value
+        self.total += value
+        self.slot = slot + 1 if slot + 1 < self.window else 0
+        self.samples += 1
+
+    def bin_edges(self):
+        return [self.min_value * 10.0 ** (bin_idx / self.bins_per_decade) for bin_idx in range(self.num_bins + 1)]
+
+    def percentiles(self, percentiles=PERCENTILES):
+        """
+        Percentiles of the window, interpolated log-linearly within their bin
+        """
+        num_samples = len(self)
+        if num_samples == 0:
+            return [float('nan')] * len(percentiles)
+        values = []
+        for percentile in percentiles:
+            rank = percentile / 100.0 * num_samples
+            below = 0
+            for bin_idx, count in enumerate(self.counts):
+                if count > 0 and below + count >= rank:
+                    fraction = (rank - below) / count
+                    values.append(self.min_value * 10.0 ** ((bin_idx + fraction) / self.bins_per_decade))
+                    break
+                below += count
+        return values
+
+    def max(self):
+        return max(self.ring_values[:len(self)], default=float('nan'))
+
+    def mean(self):
+        return self.total / len(self) if len(self) > 0 else float('nan')
+
+
+class RollingGauge:
+    """
+    The last `window` readings of a count (live targets, queued hits...), with exact percentiles over them
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.ring_values = [0] * window
+        self.slot = 0
+        self.samples = 0
+        self.last = 0
+
+    def __len__(self):
+        return min(self.samples, self.window)
+
+    def record(self, value):
+        self.ring_values[self.slot] = value
+        self.slot = self.slot + 1 if self.slot + 1 < self.window else 0
+        self.samples += 1
+        self.last = value
+
+    def percentiles(self, percentiles=PERCENTILES):
+        values = sorted(self.ring_values[:len(self)])
+        if len(values) == 0:
+            return [float('nan')] * len(percentiles)
+        return [values[min(int(percentile / 100.0 * len(values)), len(values) - 1)] for percentile in percentiles]
+
+    def max(self):
+        return max(self.ring_values[:len(self)], default=float('nan'))
+
+    def mean(self):
+        return sum(self.ring_values[:len(self)]) / len(self) if len(self) > 0 else float('nan')
+
+
+class PhaseTimer:
+    """
+    Scoped timer of one phase, reused every time the phase runs: `with profiler.phase('draw'): ...`
+    """
+    __slots__ = ('histogram', 'timer', 'started')
+
+    def __init__(self, histogram, timer):
+        self.histogram = histogram
+        self.timer = timer
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = self.timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.record(self.timer() - self.started)
+        return False
+
+
+class NullScope:
+    """
+    What a disabled profiler hands out instead of a PhaseTimer, a with block over it costs two empty calls
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SCOPE = NullScope()
+
+
+class FrameProfiler:
+    """
+    Hot-path instrumentation of the main loop: a rolling histogram of the wall time of each named phase, of the
+    interval between frames, and rolling gauges of the counts that drive the cost of a frame.
+    Phases are timed by wall clock (perf_counter) whatever clock drives the game, they can nest and overlap.
+    Disabled, phase() returns a shared no-op scope and gauge() and end_frame() return at once, so the hooks can stay
+    in the hot path. With an export_fpath, end_frame writes the report every export_interval seconds: the whole
+    report to a .json file, replaced each time, or one row per phase and gauge appended to a .csv file.
+    """
+
+    def __init__(self, enabled: bool = True, window: int = 1024, export_fpath: str = None,
+                 export_interval: float = 5.0, timer=time.perf_counter):
+        self.enabled = enabled
+        self.window = window
+        self.export_fpath = export_fpath or None
+        self.export_interval = export_interval
+        self.timer = timer
+        self.histograms = {}  # Phase name -> RollingHistogram, in the order phases first ran
+        self.timers = {}
+        self.gauges = {}
+        self.frames = 0
+        self.last_frame_time = None
+        self.started_at = None
+        self.next_export_time = None
+        self.exports = 0
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = RollingHistogram(window=self.window)
+        return histogram
+
+    def phase(self, name):
+        if self.enabled is False:
+            return NULL_SCOPE
+        phase_timer = self.timers.get(name)
+        if phase_timer is None:
+            phase_timer = self.timers[name] = PhaseTimer(self.histogram(name), self.timer)
+        return phase_timer
+
+    def gauge(self, name, value):
+        if self.enabled is False:
+            return None
+        gauge = self.gauges.get(name)
+        if gauge is None:
+            gauge = self.gauges[name] = RollingGauge(window=self.window)
+        gauge.record(value)
+
+    def end_frame(self):
+        """
+        Count a rendered frame, time the interval since the last one, and export when due
+        """
+        if self.enabled is False:
+            return None
+        now = self.timer()
+        if self.last_frame_time is None:
+            self.started_at = now
+            self.next_export_time = now + self.export_interval
+        else:
+            self.histogram('frame_interval').record(now - self.last_frame_time)
+        self.last_frame_time = now
+        self.frames += 1
+        if self.export_fpath is not None and now >= self.next_export_time:
+            self.export(at_time=now)
+            self.next_export_time = now + self.export_interval
+
+    def report(self):
+        """
+        Stats over the rolling window: phases in milliseconds, gauges in their own units
+        """
+        report = {'frames': self.frames, 'phases': {}, 'gauges': {}}
+        for name, histogram in self.histograms.items():
+            p50, p95, p99 = histogram.percentiles()
+            report['phases'][name] = {'samples': len(histogram), 'mean': histogram.mean() * 1e3, 'p50': p50 * 1e3,
+                                      'p95': p95 * 1e3, 'p99': p99 * 1e3, 'max': histogram.max() * 1e3}
+        for name, gauge in self.gauges.items():
+            p50, p95, p99 = gauge.percentiles()
+            report['gauges'][name] = {'samples': len(gauge), 'mean': gauge.mean(), 'p50': p50, 'p95': p95, 'p99': p99,
+                                      'max': gauge.max(), 'last': gauge.last}
+        return report
+
+    def export(self, fpath=None, at_time=None):
+        fpath = fpath or self.export_fpath
+        at_time = self.timer() if at_time is None else at_time
+        elapsed = at_time - self.started_at if self.started_at is not None else 0.0
+        report = self.report()
+        directory = os.path.dirname(fpath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if fpath.endswith('.json'):
+            report.update(time=elapsed, histograms={name: {'bin_edges': histogram.bin_edges(),
+                                                           'counts': list(histogram.counts)}
+                                                    for name, histogram in self.histograms.items()})
+            with open(fpath + '.tmp', 'w') as fp:
+                json.dump(report, fp, indent=2)
+            os.replace(fpath + '.tmp', fpath)
+        else:
+            is_new = not os.path.isfile(fpath)
+            with open(fpath, 'a', newline='') as fp:
+                writer = csv.DictWriter(fp, fieldnames=EXPORT_FIELDS)
+                if is_new:
+                    writer.writeheader()
+                for kind in ('phases', 'gauges'):
+                    for name, stats in report[kind].items():
+                        writer.writerow(dict(stats, time=round(elapsed, 6), frames=self.frames, kind=kind[:-1],
+                                             name=name))
+        self.exports += 1
+        return fpath
+
+    def overlay_lines(self):
+        """
+        One line of text per phase and gauge, for an on-screen overlay
+        """
+        report = self.report()
+        lines = [f"{'frames':<16} {report['frames']}"]
+        for name, stats in report['phases'].items():
+            lines.append(f"{name:<16} p50 {stats['p50']:6.2f}  p95 {stats['p95']:6.2f}  p99 {stats['p99']:6.2f}  "
+                         f"max {stats['max']:6.2f} ms")
+        for name, stats in report['gauges'].items():
+            lines.append(f"{name:<16} {stats['last']:>4}  p95 {stats['p95']:>4}  max {stats['max']:>4}")
+        return lines
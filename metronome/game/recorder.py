@@ -0,0 +1,214 @@
+import os
+import json
+import queue
+import threading
+import datetime
+import numpy as np
+from config import Config
+from metronome.arduino.hits import HitBatch
+
+
+SESSION_VERSION = 2
+# Columns of every table, each stored as its own raw little-endian file that np.memmap can open
+TABLES = {
+    'targets': (('id', '<i8'), ('beat', '<f8'), ('channel', 'i1'), ('pattern', '<i2')),
+    'hits': (('time', '<f8'), ('channel', 'i1'), ('amplitude', '<f4'), ('device_time', '<i8')),
+    'judgements': (('time', '<f8'), ('beat', '<f8'), ('channel', 'i1'), ('target_id', '<i8'), ('error', '<f4'),
+                   ('kind', 'u1')),
+    'tempo': (('time', '<f8'), ('beat', '<f8'), ('bpm', '<f4')),
+}
+# Judgement kinds: a hit on a target, a counted miss, a miss that was not penalised, a target that was never hit
+JUDGEMENT_KINDS = ('hit', 'miss', 'ignored', 'expired')
+JUDGEMENT_HIT, JUDGEMENT_MISS, JUDGEMENT_IGNORED, JUDGEMENT_EXPIRED = range(len(JUDGEMENT_KINDS))
+
+
+def column_fname(table, column):
+    return f"{table}.{column}.bin"
+
+
+class SessionRecorder:
+    """
+    Per-note log of a game session: every scheduled target, every raw hit, every judgement and every tempo change.
+    The game thread only puts (table, values) items on a queue. A background writer turns them into typed columns
+    and appends them in batches, one file per column in the session directory, next to a JSON header describing
+    the exercise, the BPM ramp and the layout. Times are on the game clock (perf_counter), beats on the engine's.
+    """
+
+    def __init__(self, session_dir, header: dict = None, flush_rows: int = 4096, flush_interval: float = 1.0):
+        self.session_dir = session_dir
+        self.header = dict(header or {}, version=SESSION_VERSION,
+                           tables={table: dict(columns) for table, columns in TABLES.items()},
+                           judgement_kinds=list(JUDGEMENT_KINDS))
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.pending = {table: [] for table in TABLES}
+        self.pending_rows = 0
+        self.rows = {table: 0 for table in TABLES}
+        self.files = {}
+        self.thread = None
+        self.closed = False
+
+    @classmethod
+    def for_engine(cls, engine, session_root, exercise_name, student: str = None, **kwargs):
+        """
+        Start recording a GameEngine into a new directory under session_root
+        """
+        started_at = datetime.datetime.now()
+        name = ''.join(char if char.isalnum() else '_' for char in exercise_name.lower())
+        session_dir = os.path.join(session_root, f"{started_at.strftime(Config.DATE_STR_FORMAT)}-{name}")
+        # Two sessions started within the same second must not append to each other's columns
+        base_dir, suffix = session_dir, 1
+        while os.path.exists(session_dir):
+            suffix += 1
+            session_dir = f"{base_dir}-{suffix}"
+        header = {'exercise': exercise_name, 'student': student, 'patterns': list(engine.timeline.pattern_names),
+                  'started_at': started_at.isoformat(), 'clock': 'perf_counter',
+                  'bpm': engine.bpm, 'tempo_ramp': engine.ramp.describe(),
+                  'beats_per_bar': engine.beats_per_bar, 'hit_window': engine.hit_window,
+                  'hit_threshold': engine.hit_threshold,
+                  # Hits are recorded raw, judgements at the hit time less the channel's input offset
+                  'input_offsets': list(engine.input_offsets), 'visual_lead': engine.visual_lead}
+        recorder = cls(session_dir, header=header, **kwargs).start()
+        for at_time, beat, bpm in zip(engine.tempo.times, engine.tempo.beats, engine.tempo.bpms):
+            recorder.record_tempo(at_time, beat, bpm)
+        engine.recorder = recorder
+        return recorder
+
+    def start(self):
+        os.makedirs(self.session_dir, exist_ok=True)
+        self.write_header()
+        for table, columns in TABLES.items():
+            for column, _ in columns:
+                self.files[table, column] = open(os.path.join(self.session_dir, column_fname(table, column)), 'ab')
+        self.thread = threading.Thread(target=self.run, name='SessionRecorder', daemon=True)
+        self.thread.start()
+        return self
+
+    # Called from the game loop, each is a single queue put
+
+    def record_targets(self, first_id, beats, channels, pattern=-1):
+        """
+        A bar of targets with consecutive ids from first_id, pattern indexing the header's patterns.
+        The arrays must not be written to afterwards.
+        """
+        self.queue.put(('targets', (first_id, beats, channels, pattern)))
+
+    def record_hits(self, hits):
+        self.queue.put(('hits', hits))
+
+    def record_judgement(self, at_time, beat, channel, target_id, error, kind):
+        self.queue.put(('judgements', (at_time, beat, channel, target_id, error, kind)))
+
+    def record_expired(self, at_time, target_ids, beats, channels):
+        """
+        Targets culled without being hit, judged at at_time
+        """
+        self.queue.put(('judgements', (at_time, beats, channels, target_ids, np.nan, JUDGEMENT_EXPIRED)))
+
+    def record_tempo(self, at_time, beat, bpm):
+        self.queue.put(('tempo', (at_time, beat, bpm)))
+
+    # Writer thread
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self.flush()
+                continue
+            if item is None:
+                break
+            table, values = item
+            columns = self.to_columns(table, values)
+            self.pending[table].append(columns)
+            self.pending_rows += len(columns[0])
+            if self.pending_rows >= self.flush_rows:
+                self.flush()
+        self.flush()
+
+    @staticmethod
+    def to_columns(table, values):
+        """
+        Typed column arrays of one queued item, scalars broadcast over the rows
+        """
+        if table == 'targets':
+            first_id, beats, channels, pattern = values
+            values = (np.arange(first_id, first_id + len(beats)), beats, channels, pattern)
+        elif table == 'hits':
+            hits = values if isinstance(values, HitBatch) else HitBatch.from_hits(values)
+            device_times = hits.device_times if hits.device_times is not None else np.full(len(hits), -1)
+            values = (hits.times, hits.channels, hits.amplitudes, device_times)
+        columns = np.broadcast_arrays(*[np.asarray(value) for value in values])
+        return [np.ascontiguousarray(np.atleast_1d(column), dtype=dtype)
+                for column, (_, dtype) in zip(columns, TABLES[table])]
+
+    def flush(self):
+        for table, chunks in self.pending.items():
+            if len(chunks) == 0:
+                continue
+            for column_idx, (column, _) in enumerate(TABLES[table]):
+                data = np.concatenate([chunk[column_idx] for chunk in chunks])
+                self.files[table, column].write(data.tobytes())
+                self.files[table, column].flush()
+            self.rows[table] += sum(len(chunk[0]) for chunk in chunks)
+            self.pending[table] = []
+        self.pending_rows = 0
+
+    def write_header(self):
+        fpath = os.path.join(self.session_dir, 'header.json')
+        with open(fpath + '.tmp', 'w') as fp:
+            json.dump(dict(self.header, rows=self.rows), fp, indent=2)
+        os.replace(fpath + '.tmp', fpath)
+
+    def close(self):
+        """
+        Write everything still queued, then the final row counts into the header
+        """
+        if self.closed or self.thread is None:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        for fp in self.files.values():
+            fp.close()
+        self.write_header()
+
+    def stats(self):
+        return {'rows': dict(self.rows),
+                'bytes': sum(os.path.getsize(fp.name) for fp in self.files.values())}
+
+
+class SessionLog:
+    """
+    Read side of a recorded session: the header, and every column memory-mapped the first time its table is read.
+    Row counts come from the file sizes, so a session that is still being written or was cut short opens too.
+    """
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        with open(os.path.join(session_dir, 'header.json'), 'r') as fp:
+            self.header = json.load(fp)
+        self.tables = {}
+
+    def load_column(self, table, column, dtype):
+        fpath = os.path.join(self.session_dir, column_fname(table, column))
+        if not os.path.isfile(fpath) or os.path.getsize(fpath) < np.dtype(dtype).itemsize:
+            return np.zeros(0, dtype=dtype)
+        num_rows = os.path.getsize(fpath) // np.dtype(dtype).itemsize
+        return np.memmap(fpath, dtype=dtype, mode='r', shape=(num_rows,))
+
+    def __getitem__(self, table):
+        """
+        Columns of a table, trimmed to the rows every column has
+        """
+        if table not in self.tables:
+            self.tables[table] = {column: self.load_column(table, column, dtype)
+                                  for column, dtype in self.header['tables'][table].items()}
+        columns = self.tables[table]
+        num_rows = min(len(values) for values in columns.values())
+        return {column: values[:num_rows] for column, values in columns.items()}
+
+    def __len__(self):
+        return len(self['judgements']['time'])
@@ -0,0 +1,156 @@
+import time
+from collections import deque
+from metronome.game.clock import PerfClock
+
+
+class FrameScheduler:
+    """
+    Main loop pacing: logic (input polling, beat clock, judging) on a fixed high-rate tick, rendering at a target FPS.
+    Between deadlines the loop sleeps, then spins for the last stretch, because OS sleeps overshoot. The spin
+    window follows the overshoot actually measured on this machine, capped at max_spin and at half the logic period:
+    every tick sleeps for a while, so the overshoot keeps being measured and a few slow wakeups age out of the window.
+    With vsync the display flip blocks until the next refresh, so a frame is only rendered vsync_margin before the
+    refresh is due, and logic keeps its own deadlines in between. The refresh period is refresh_rate's, or else
+    measured between the flips of the first frames, which are rendered back to back. A flip that overran a refresh
+    counts as a missed frame and widens the margin. Logic ticks held up by a flip are taken late rather than dropped.
+    A task that starts more than late_tolerance of its period after its deadline counts as a missed deadline,
+    and its next deadline is realigned on the current time instead of bursting to catch up.
+    """
+
+    def __init__(self, logic_rate: float = 1000.0, target_fps: float = 120.0, vsync: bool = False,
+                 max_spin: float = 0.002, late_tolerance: float = 1.0, clock=None, sleep=time.sleep,
+                 refresh_rate: float = None, vsync_margin: float = 0.002):
+        self.logic_period = 1.0 / logic_rate
+        self.frame_period = 0.0 if vsync or not target_fps else 1.0 / target_fps
+        self.vsync = vsync
+        self.refresh_period = 1.0 / refresh_rate if refresh_rate else None
+        self.measure_refresh = not refresh_rate
+        self.vsync_margin = vsync_margin
+        self.flip_times = deque(maxlen=16)  # When the most recent vsync flips returned
+        self.flip_paced = False  # Whether the next flip was scheduled ahead of a refresh
+        self.max_spin = min(max_spin, self.logic_period / 2.0)
+        self.spin_threshold = self.max_spin / 4.0
+        self.overshoots = deque(maxlen=64)  # How late the most recent sleeps woke up
+        self.late_tolerance = late_tolerance  # In periods of the task
+        self.clock = clock or PerfClock()
+        self.sleep = sleep
+        self.next_logic_time = None
+        self.next_render_time = None
+        # Accounting
+        self.logic_ticks = 0
+        self.frames = 0
+        self.missed_logic = 0
+        self.missed_frames = 0
+        self.max_logic_lateness = 0.0
+        self.max_frame_lateness = 0.0
+        self.sleep_time = 0.0
+        self.started_at = None
+
+    def start(self, now=None):
+        now = self.clock.now() if now is None else now
+        self.started_at = now
+        self.next_logic_time = now
+        self.next_render_time = now
+
+    def wait_until(self, deadline):
+        """
+        Hybrid wait: sleep while the deadline is far, spin once it is within spin_threshold
+        """
+        while True:
+            remaining = deadline - self.clock.now()
+            if remaining <= 0.0:
+                return
+            if remaining > self.spin_threshold:
+                sleep_for = remaining - self.spin_threshold
+                wake_time = self.clock.now() + sleep_for
+                self.sleep(sleep_for)
+                self.sleep_time += sleep_for
+                self.overshoots.append(max(self.clock.now() - wake_time, 0.0))
+                if len(self.overshoots) % 16 == 0:
+                    self.update_spin_threshold()
+
+    def update_spin_threshold(self):
+        """
+        Spin for a bit more than the 90th percentile overshoot, outliers (preemption, GC) are not worth spinning for
+        """
+        overshoots = sorted(self.overshoots)
+        self.spin_threshold = min(max(1.5 * overshoots[int(len(overshoots) * 0.9)], 5e-5), self.max_spin)
+
+    def advance(self, deadline, period, now, tolerance=None):
+        """
+        Next deadline of a periodic task that started at now, and how late it started
+        """
+        lateness = now - deadline
+        if lateness > (self.late_tolerance * period if tolerance is None else tolerance):
+            return now + period, lateness, True
+        return deadline + period, lateness, False
+
+    def step(self, logic, render):
+        """
+        Wait for the next deadline and run whatever is due. logic(now) returns False to stop the loop.
+        """
+        if self.next_logic_time is None:
+            self.start()
+        self.wait_until(min(self.next_logic_time, self.next_render_time))
+        now = self.clock.now()
+        keep_running = True
+        if now >= self.next_logic_time:
+            tolerance = None
+            if self.vsync and self.refresh_period is not None:
+                # Held up by a flip that started on time, catch up instead of dropping ticks
+                tolerance = max(self.late_tolerance * self.logic_period, self.vsync_margin + self.logic_period)
+            self.next_logic_time, lateness, missed = self.advance(self.next_logic_time, self.logic_period, now,
+                                                                  tolerance=tolerance)
+            self.max_logic_lateness = max(self.max_logic_lateness, lateness)
+            self.missed_logic += missed
+            self.logic_ticks += 1
+            keep_running = logic(now) is not False
+        if keep_running and now >= self.next_render_time:
+            if self.vsync:
+                self.max_frame_lateness = max(self.max_frame_lateness, now - self.next_render_time)
+                self.frames += 1
+                render()
+                self.next_render_time = self.after_flip(started_at=now, flipped_at=self.clock.now())
+            else:
+                self.next_render_time, lateness, missed = self.advance(self.next_render_time, self.frame_period, now)
+                self.max_frame_lateness = max(self.max_frame_lateness, lateness)
+                self.missed_frames += missed
+                self.frames += 1
+                render()
+        return keep_running
+
+    def after_flip(self, started_at, flipped_at):
+        """
+        When to render the next vsync frame, from when the last flip returned
+        """
+        self.flip_times.append(flipped_at)
+        if self.measure_refresh and len(self.flip_times) >= 2:
+            # Back to back flips return one refresh apart, a skipped refresh only makes an interval longer
+            times = list(self.flip_times)
+            self.refresh_period = max(min(later - earlier for earlier, later in zip(times, times[1:])), 1e-3)
+        paced, self.flip_paced = self.flip_paced, False
+        if self.refresh_period is None or len(self.flip_times) < 3 and self.measure_refresh:
+            return flipped_at
+        # Only a flip started ahead of a known refresh can have overrun it, the others wait for whichever comes
+        if paced and flipped_at - started_at > self.vsync_margin + self.refresh_period / 2.0:
+            # Started too close to the refresh and waited for the one after
+            self.missed_frames += 1
+            self.vsync_margin = min(self.vsync_margin + 5e-4, self.refresh_period / 2.0)
+        self.flip_paced = True
+        return flipped_at + self.refresh_period - self.vsync_margin
+
+    def run(self, logic, render):
+        self.start()
+        while self.step(logic, render):
+            pass
+
+    def stats(self):
+        elapsed = max(self.clock.now() - self.started_at, 1e-9) if self.started_at is not None else 1e-9
+        return {'logic_hz': self.logic_ticks / elapsed,
+                'fps': self.frames / elapsed,
+                'missed_logic': self.missed_logic,
+                'missed_frames': self.missed_frames,
+                'max_logic_late_ms': self.max_logic_lateness * 1e3,
+                'max_frame_late_ms': self.max_frame_lateness * 1e3,
+                'sleep_fraction': self.sleep_time / elapsed,
+                'spin_ms': self.spin_threshold * 1e3}
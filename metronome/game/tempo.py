@@ -0,0 +1,131 @@
+from bisect import bisect_right
+
+
+RAMP_CURVES = ('step', 'linear', 'exponential', 'pattern')
+
+
+class TempoMap:
+    """
+    Piecewise-constant tempo mapping beats to clock seconds and back.
+    Each segment starts at a (beat, time) pair, so a tempo change never moves anything already scheduled in beats.
+    Segments are either appended ahead of time at given beats (a compiled TempoRamp) or cut in live with set_bpm.
+    Both directions are a bisect over the segment starts, which only ever increase since every tempo is positive.
+    """
+
+    def __init__(self, bpm, start_time=0.0):
+        self.beats = [0.0]
+        self.times = [start_time]
+        self.bpms = [bpm]
+
+    def restart(self, bpm, start_time):
+        """
+        Put beat 0 at start_time and forget all previous tempo changes
+        """
+        self.beats = [0.0]
+        self.times = [start_time]
+        self.bpms = [bpm]
+
+    def set_bpm(self, bpm, at_time):
+        """
+        Change the tempo from at_time onwards, keeping the beat position at at_time continuous
+        """
+        at_beat = self.beat_at(at_time)
+        # A change replaces any segments that would have started later
+        idx = bisect_right(self.times, at_time)
+        del self.beats[idx:], self.times[idx:], self.bpms[idx:]
+        if self.times and self.times[-1] == at_time:
+            self.bpms[-1] = bpm
+        else:
+            self.beats.append(at_beat)
+            self.times.append(at_time)
+            self.bpms.append(bpm)
+
+    def append(self, beat, bpm):
+        """
+        Change the tempo from beat onwards, at or after the start of the last segment.
+        Its start time is derived from the segment before, never from a clock, so a compiled map cannot drift.
+        """
+        if beat < self.beats[-1]:
+            raise ValueError(f"tempo segment at beat {beat} starts before the last one at beat {self.beats[-1]}")
+        if bpm <= 0:
+            raise ValueError(f"tempo must be positive, not {bpm} BPM")
+        if beat == self.beats[-1]:
+            self.bpms[-1] = bpm
+            return self.times[-1]
+        at_time = self.times[-1] + (beat - self.beats[-1]) * 60.0 / self.bpms[-1]
+        self.beats.append(beat)
+        self.times.append(at_time)
+        self.bpms.append(bpm)
+        return at_time
+
+    def beat_at(self, at_time):
+        idx = max(bisect_right(self.times, at_time) - 1, 0)
+        return self.beats[idx] + (at_time - self.times[idx]) * self.bpms[idx] / 60.0
+
+    def time_at(self, beat):
+        idx = max(bisect_right(self.beats, beat) - 1, 0)
+        return self.times[idx] + (beat - self.beats[idx]) * 60.0 / self.bpms[idx]
+
+    def bpm_at(self, at_time):
+        return self.bpms[max(bisect_right(self.times, at_time) - 1, 0)]
+
+    def bpm_at_beat(self, beat):
+        return self.bpms[max(bisect_right(self.beats, beat) - 1, 0)]
+
+
+class TempoRamp:
+    """
+    How the tempo moves as an exercise loops, compiled one loop at a time into TempoMap segments.
+      step: the whole loop at one tempo, step BPM faster after each loop
+      linear: step BPM faster over each loop, rising beat by beat
+      exponential: ratio times faster over each loop, rising beat by beat by the same factor
+      pattern: step BPM faster after every pattern of the loop
+    Each loop is followed by a rest at the tempo the next loop starts at, rest_bars long, or rest_seconds long
+    when rest_bars is None. Tempos are clamped to [min_bpm, max_bpm].
+    """
+
+    def __init__(self, curve: str = 'step', step: float = 5, ratio: float = 1.05, rest_bars: float = None,
+                 rest_seconds: float = 3.0, min_bpm: float = 20, max_bpm: float = 400):
+        if curve not in RAMP_CURVES:
+            raise ValueError(f"unknown tempo ramp {curve!r}, expected one of {RAMP_CURVES}")
+        self.curve = curve
+        self.step = step
+        self.ratio = ratio
+        self.rest_bars = rest_bars
+        self.rest_seconds = rest_seconds
+        self.min_bpm = min_bpm
+        self.max_bpm = max_bpm
+
+    def describe(self):
+        return {'curve': self.curve, 'step': self.step, 'ratio': self.ratio, 'rest_bars': self.rest_bars,
+                'rest_seconds': self.rest_seconds, 'min_bpm': self.min_bpm, 'max_bpm': self.max_bpm}
+
+    def clamp(self, bpm):
+        return min(max(bpm, self.min_bpm), self.max_bpm)
+
+    def loop_segments(self, start_bpm, loop_beats, pattern_beats=()):
+        """
+        Tempo changes of one loop that starts at start_bpm, as (beat from the start of the loop, bpm) pairs.
+        The last one is at loop_beats, where the notes end, and holds for the rest and into the next loop.
+        pattern_beats are the beats where every pattern after the first starts.
+        """
+        if self.curve == 'step':
+            return [(loop_beats, self.clamp(start_bpm + self.step))]
+        if self.curve == 'pattern':
+            changes = list(pattern_beats) + [loop_beats]
+            return [(beat, self.clamp(start_bpm + self.step * (idx + 1))) for idx, beat in enumerate(changes)]
+        num_beats = max(int(round(loop_beats)), 1)
+        segments = []
+        for beat_idx in range(1, num_beats + 1):
+            progress = beat_idx / num_beats
+            if self.curve == 'linear':
+                bpm = start_bpm + self.step * progress
+            else:
+                bpm = start_bpm * self.ratio ** progress
+            segments.append((loop_beats * progress, self.clamp(bpm)))
+        return segments
+
+    def rest_beats(self, bpm, beats_per_bar):
+        if self.rest_bars is not None:
+            return self.rest_bars * beats_per_bar
+        return self.rest_seconds * bpm / 60.0
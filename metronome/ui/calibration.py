@@ -0,0 +1,143 @@
+import sys
+import pygame
+from config import Config
+from metronome.ui.colors import *
+from metronome.ui.text_cache import HudText
+from metronome.arduino.arduino_threaded import ArduinoController
+from metronome.game.calibration import CALIBRATION_MODES, Calibrator, LatencyCalibration
+from metronome.game.clock import PerfClock
+from metronome.game.scheduler import FrameScheduler
+
+
+FLASH_SECONDS = 0.08
+
+
+class CalibrationUI:
+    """
+    Pygame view over one Calibrator per mode: clicks for the audio pass, white flashes for the visual pass.
+    A click is presented when it is handed to the mixer and a flash when the frame showing it has been flipped,
+    so whatever the speakers and the display add on top shows up in the fitted offsets.
+    Escape abandons the calibration, the rig keeps its previous one.
+    """
+
+    def __init__(self, window, hit_collector: ArduinoController, calibration: LatencyCalibration = None,
+                 modes=CALIBRATION_MODES, clock=None, **calibrator_kwargs):
+        self.window = window
+        self.width, self.height = self.window.get_size()
+        pygame.display.set_caption('Monotonous Industrial Blender - Latency Calibration')
+        self.clock = clock if clock is not None else PerfClock()
+        self.hit_collector = hit_collector
+        if self.hit_collector.running is False:
+            self.hit_collector.connect()
+        self.calibration = calibration if calibration is not None else LatencyCalibration.for_rig()
+        self.modes = list(modes)
+        self.calibrator_kwargs = calibrator_kwargs
+        self.tick_sound = pygame.mixer.Sound('./data/sounds/tick.wav')
+        self.hud_title = HudText(size=48, center=(self.width / 2, self.height / 4))
+        self.hud_prompt = HudText(size=36, center=(self.width / 2, self.height / 4 + 60))
+        self.flash_rect = pygame.Rect(0, 0, self.width // 3, self.height // 3)
+        self.flash_rect.center = (self.width // 2, self.height * 2 // 3)
+        self.flash_until = 0.0
+        self.flash_pending = []  # Stimuli drawn in the coming frame, presented once it is flipped
+        self.calibrator = None
+        self.num_passes = len(self.modes)
+        self.finished = False
+        self.cancelled = False
+        self.next_pass()
+
+    def next_pass(self, now=None):
+        if len(self.modes) == 0:
+            self.calibrator = None
+            self.finished = True
+            return None
+        self.calibrator = Calibrator(self.modes.pop(0), input_source=self.hit_collector, clock=self.clock,
+                                     **self.calibrator_kwargs).start(now)
+        return self.calibrator
+
+    def finish_pass(self):
+        offsets, report = self.calibrator.fit()
+        self.calibration.update(self.calibrator.mode, offsets, report)
+        for channel, fit in enumerate(report):
+            if 'offset_ms' in fit:
+                print(f"{self.calibrator.mode} channel {channel}: {fit['offset_ms']:.1f} ms +/- {fit['std_ms']:.1f} ms "
+                      f"({fit['inliers']}/{fit['hits']} taps kept)")
+            else:
+                print(f"{self.calibrator.mode} channel {channel}: not enough taps ({fit['inliers']}/{fit['hits']}), "
+                      f"offset left unchanged")
+
+    def handle_keydown(self, event):
+        if event.key == pygame.K_ESCAPE:
+            self.cancelled = True
+
+    def update(self, current_time=None):
+        if self.calibrator is None:
+            return None
+        now = self.clock.now() if current_time is None else current_time
+        for stimulus_idx in self.calibrator.update(now):
+            if self.calibrator.mode == 'audio':
+                self.tick_sound.play()
+                self.calibrator.presented_at(stimulus_idx, self.clock.now())
+            else:
+                self.flash_pending.append(stimulus_idx)
+                self.flash_until = now + FLASH_SECONDS
+        if self.calibrator.is_done(now):
+            self.finish_pass()
+            self.next_pass(now)
+
+    def draw(self):
+        self.window.fill(BLACK)
+        if self.calibrator is not None:
+            calibrator = self.calibrator
+            pass_idx = self.num_passes - len(self.modes)
+            stimulus = 'clicks' if calibrator.mode == 'audio' else 'flashes'
+            self.hud_title.set(f"Calibration {pass_idx}/{self.num_passes}: {calibrator.mode}")
+            self.hud_prompt.set(f"Tap pad {calibrator.prompt_channel + 1} along with the {stimulus}")
+            self.hud_title.draw(self.window.blit)
+            self.hud_prompt.draw(self.window.blit)
+            if calibrator.mode == 'visual' and self.clock.now() < self.flash_until:
+                self.window.fill(WHITE, self.flash_rect)
+        pygame.display.flip()
+        if len(self.flash_pending) > 0:
+            flipped_at = self.clock.now()
+            for stimulus_idx in self.flash_pending:
+                self.calibrator.presented_at(stimulus_idx, flipped_at)
+            self.flash_pending = []
+
+
+def run_calibration():
+    width, height = 1800, 1000
+    pygame.mixer.pre_init(buffer=Config.AUDIO_BUFFER)
+    pygame.init()
+    pygame.mixer.init()
+    window = pygame.display.set_mode((width, height))
+    hit_collector = ArduinoController(port=Config.COM_PORT, baudrate=Config.BAURDRATE, name='hits',
+                                      protocol=Config.SERIAL_PROTOCOL, hit_buffer_size=Config.HIT_BUFFER_SIZE,
+                                      overflow_policy=Config.HIT_OVERFLOW_POLICY, stale_after=Config.HIT_STALE_AFTER)
+    # No drum samples here, a pad sounding would be another click to tap along to
+    calibration_ui = CalibrationUI(window=window, hit_collector=hit_collector)
+    if hit_collector.running is False:
+        raise ValueError(f"could not connect to Arduino on port={Config.COM_PORT} at baudrate={Config.BAURDRATE}")
+    scheduler = FrameScheduler(logic_rate=Config.LOGIC_RATE, target_fps=Config.TARGET_FPS, vsync=False)
+
+    def tick(now):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                calibration_ui.cancelled = True
+            elif event.type == pygame.KEYDOWN:
+                calibration_ui.handle_keydown(event=event)
+        if calibration_ui.cancelled is False:
+            calibration_ui.update(current_time=now)
+        return calibration_ui.finished is False and calibration_ui.cancelled is False
+
+    try:
+        scheduler.run(logic=tick, render=calibration_ui.draw)
+    finally:
+        hit_collector.disconnect()
+        pygame.quit()
+    if calibration_ui.finished is True:
+        fpath = calibration_ui.calibration.save()
+        print(f"Calibration of {calibration_ui.calibration.rig} saved to {fpath}, "
+              f"visual lead {calibration_ui.calibration.visual_lead * 1000.0:.1f} ms")
+    else:
+        print("Calibration cancelled, nothing saved")
+    sys.exit()
@@ -0,0 +1,85 @@
+import pygame
+
+
+class Compositor:
+    """
+    Dirty-rect renderer over a pre-rendered static background.
+    Every frame, begin_frame paints the background back over whatever was drawn last frame, drawing calls report
+    the rects they touch through mark or blit, and end_frame pushes the union of both frames' rects to the display.
+    With full_flip, or when a frame dirties most of the window anyway, it falls back to a full background blit and flip.
+    """
+
+    def __init__(self, window, full_flip: bool = False, max_dirty_fraction: float = 0.5):
+        self.window = window
+        self.screen_rect = window.get_rect()
+        self.full_flip = full_flip
+        self.max_dirty_area = max_dirty_fraction * self.screen_rect.width * self.screen_rect.height
+        self.background = None
+        self.fblits = getattr(window, 'fblits', None)
+        self.needs_full_redraw = True
+        self.previous_rects = []
+        self.dirty_rects = []
+        # Accounting
+        self.frames = 0
+        self.full_frames = 0
+        self.pushed_area = 0
+
+    def set_background(self, background):
+        """
+        Swap the static layer, the next frame is redrawn in full
+        """
+        self.background = background
+        self.needs_full_redraw = True
+
+    def begin_frame(self):
+        self.dirty_rects = []
+        if self.full_flip or self.needs_full_redraw:
+            self.window.blit(self.background, (0, 0))
+        else:
+            # Erase last frame's moving objects by restoring the background under them
+            for rect in self.previous_rects:
+                self.window.blit(self.background, rect, area=rect)
+
+    def mark(self, rect):
+        rect = self.screen_rect.clip(rect)
+        if rect.width > 0 and rect.height > 0:
+            self.dirty_rects.append(rect)
+        return rect
+
+    def blit(self, surface, dest, area=None):
+        return self.mark(self.window.blit(surface, dest, area))
+
+    def blits(self, blit_sequence):
+        """
+        Draw a list of (surface, dest) pairs in one call, with fblits where pygame has it
+        """
+        if len(blit_sequence) == 0:
+            return []
+        if self.fblits is not None:
+            self.fblits(blit_sequence)
+            rects = [pygame.Rect(dest, surface.get_size()) for surface, dest in blit_sequence]
+        else:
+            rects = self.window.blits(blit_sequence)
+        for rect in rects:
+            self.mark(rect)
+        return rects
+
+    def end_frame(self):
+        self.frames += 1
+        rects = self.previous_rects + self.dirty_rects
+        dirty_area = sum(rect.width * rect.height for rect in rects)
+        if self.full_flip or self.needs_full_redraw or dirty_area > self.max_dirty_area:
+            pygame.display.flip()
+            self.full_frames += 1
+            self.pushed_area += self.screen_rect.width * self.screen_rect.height
+            self.needs_full_redraw = False
+        else:
+            pygame.display.update(rects)
+            self.pushed_area += dirty_area
+        self.previous_rects = self.dirty_rects
+
+    def stats(self):
+        return {'frames': self.frames,
+                'full_frames': self.full_frames,
+                'mean_pushed_fraction': self.pushed_area / max(self.frames, 1) / (
+                        self.screen_rect.width * self.screen_rect.height)}
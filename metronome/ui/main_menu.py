@@ -2,6 +2,7 @@ import time
 
 import pygame
 from metronome.ui.colors import *
+from metronome.ui.text_cache import render_text
 from config import Config
 
 
@@ -17,8 +18,7 @@ class Button:
     def draw(self, win):
         # pygame.draw.rect(win, self.color, (self.x, self.y, self.width, self.height), 0)
         if self.text != '':
-            font = pygame.font.SysFont(None, 30)
-            text = font.render(self.text, 1, self.color)
+            text = render_text(self.text, 30, self.color, sysfont=True)
             win.blit(text, (
             self.x + (self.width / 2 - text.get_width() / 2), self.y + (self.height / 2 - text.get_height() / 2)))
 
@@ -87,9 +87,8 @@ class MenuUI:
             button.color = HIGHLIGHT_COLOR if i == self.selected_exercise else MENU_COLOR
             button.draw(self.screen)
         # BPM and Beats Per Bar display
-        font = pygame.font.SysFont(None, 36)
-        bpm_text = font.render(f'BPM: {self.bpm}', True, WHITE)
-        beats_text = font.render(f'Beats/Bar: {self.beats_per_bar}', True, WHITE)
+        bpm_text = render_text(f'BPM: {self.bpm}', 36, WHITE, sysfont=True)
+        beats_text = render_text(f'Beats/Bar: {self.beats_per_bar}', 36, WHITE, sysfont=True)
         self.screen.blit(bpm_text, (547, 700))
         self.screen.blit(beats_text, (1150, 700))
         # Update the Display
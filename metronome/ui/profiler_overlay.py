@@ -0,0 +1,42 @@
+import pygame
+from metronome.ui.colors import *
+from metronome.ui.text_cache import get_font
+
+
+class ProfilerOverlay:
+    """
+    On-screen report of a FrameProfiler, one line per phase and gauge, anchored at bottomleft.
+    The text is only re-rendered every refresh_interval seconds, so the overlay barely shows in what it reports.
+    """
+
+    def __init__(self, profiler, bottomleft, size: int = 18, color=HIGHLIGHT_COLOR, refresh_interval: float = 0.5):
+        self.profiler = profiler
+        self.bottomleft = bottomleft
+        self.font = get_font(size)
+        self.color = color
+        self.refresh_interval = refresh_interval
+        self.next_refresh = None
+        self.surface = None
+        self.rect = None
+
+    def refresh(self):
+        """
+        Render the current report into a single surface, drawn with one blit until the next refresh
+        """
+        lines = [self.font.render(line, True, self.color) for line in self.profiler.overlay_lines()]
+        line_height = self.font.get_linesize()
+        surface = pygame.Surface((max(line.get_width() for line in lines), line_height * len(lines)), pygame.SRCALPHA)
+        for line_idx, line in enumerate(lines):
+            surface.blit(line, (0, line_idx * line_height))
+        self.surface = surface
+        self.rect = surface.get_rect(bottomleft=self.bottomleft)
+
+    def draw(self, blit, now=None):
+        """
+        Draw through any blit(surface, dest) callable, a Surface's or a Compositor's
+        """
+        now = self.profiler.timer() if now is None else now
+        if self.next_refresh is None or now >= self.next_refresh:
+            self.refresh()
+            self.next_refresh = now + self.refresh_interval
+        return blit(self.surface, self.rect)
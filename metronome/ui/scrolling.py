@@ -1,147 +1,124 @@
 import sys
-import time
+import numpy as np
 import pygame
 from config import Config
 from metronome.ui.colors import *
 from metronome.ui.main_menu import MenuUI
-from metronome.exercise.exercise import ExerciseFactory, Pattern
-from metronome.arduino.arduino_threaded import Hit, ArduinoController
+from metronome.ui.compositor import Compositor
+from metronome.ui.profiler_overlay import ProfilerOverlay
+from metronome.ui.text_cache import HudText, render_text
+from metronome.ui.sprites import SpriteAtlas, TARGET_RADIUS, ATTEMPT_RADIUS
+from metronome.exercise.exercise import ExerciseFactory
+from metronome.exercise.trainer import SkillTrainer
+from metronome.arduino.arduino_threaded import ArduinoController
+from metronome.audio.sampler import DrumSampler
+from metronome.game.clock import PerfClock
+from metronome.game.calibration import LatencyCalibration
+from metronome.game.engine import GameEngine
+from metronome.game.profiler import FrameProfiler
+from metronome.game.recorder import SessionRecorder
+from metronome.game.scheduler import FrameScheduler
+from metronome.game.tempo import TempoRamp
 
 
-class MovingObject:
-    def __init__(self, window, offset=0.0, channel=-1):
-        self.window = window
-        self.screen_width, self.screen_height = self.window.get_size()
-        self.last_updated = time.time()
-        self.offset = offset
-        self.channel = channel
-        self.x = self.screen_width + self.offset  # Starting position at the right edge
-        self.hit = False
-        self.font = pygame.font.Font(None, 24)
-
-    def get_y(self):
-        if self.channel == 0:
-            return 0
-        elif self.channel == 1:
-            return 70
-        elif self.channel == 2:
-            return 180
-        elif self.channel == 3:
-            return 250
-        else:
-            return 300
-
-    def update(self, speed):
-        self.x -= speed * (time.time() - self.last_updated)
-        self.last_updated = time.time()
-
-
-class Target(MovingObject):
-    def draw(self):
-        if self.hit is True:
-            pygame.draw.circle(self.window, LIGHT_BLUE, (int(self.x), int(self.get_y() + 250)), 12)
-            pygame.draw.circle(self.window, BLACK, (int(self.x), int(self.get_y() + 250)), 10)
-        else:
-            pygame.draw.circle(self.window, LIGHT_BLUE, (int(self.x), int(self.get_y() + 250)), 12)
-            if self.channel % 2 == 0:
-                target_side = self.font.render("R", True, BLACK)
-            else:
-                target_side = self.font.render("L", True, BLACK)
-            self.window.blit(target_side, (int(self.x - 6), int(self.get_y() + 243)))
-
-
-class Attempt(MovingObject):
-    def draw(self):
-        color = GREEN if self.hit else WHITE
-        pygame.draw.circle(self.window, color, (int(self.x - self.screen_width / 2), int(self.get_y() + 250)), 6)
-
-
-class BeatLine:
-    def __init__(self, window, click_sound_tick, click_sound_tock=None, beat_idx=1):
-        self.window = window
-        self.screen_width, self.screen_height = self.window.get_size()
-        self.last_updated = time.time()
-        self.x = self.screen_width  # Starting position at the right edge
-        self.hit = False
-        self.on_the_one = beat_idx == 0
-        self.beat_idx = beat_idx
-        self.click_sound_tick = click_sound_tick
-        self.click_sound_tock = click_sound_tock or click_sound_tick
-        self.font = pygame.font.Font(None, 36)
-
-    def update(self, speed):
-        self.x -= speed * (time.time() - self.last_updated)
-        self.last_updated = time.time()
-
-    def draw(self, targeted_beat, beats_per_bar):
-        if self.on_the_one is True:
-            pygame.draw.line(self.window, WHITE, (self.x, 200), (self.x, self.screen_height), 5)
-        else:
-            pygame.draw.line(self.window, WHITE, (self.x, 200), (self.x, self.screen_height), 1)
-        bpm_text = self.font.render(f"{self.beat_idx + 1}", True, WHITE)
-        text_rect = bpm_text.get_rect(center=(self.x, 180))
-        self.window.blit(bpm_text, text_rect)
-        if abs(self.x - (self.screen_width / 2)) < 2.0 and self.hit is False:
-            if self.on_the_one is True:
-                self.click_sound_tick.play()
-            else:
-                self.click_sound_tock.play()
-            self.hit = True
-            targeted_beat += 1
-            targeted_beat %= beats_per_bar
-        return targeted_beat
+LANE_Y = (250, 320, 430, 500)  # Centre line of each channel's lane, drawn off lane 4 for anything else
+# Lane lookup by channel for whole columns, anything out of range lands on the last entry
+LANE_Y_ARRAY = np.array(LANE_Y + (550,))
 
 
 class GameUI:
+    """
+    Pygame view over a GameEngine: turns keys into hits, clicks on beat lines and draws the engine state
+    """
+
     def __init__(self, window, hit_collector: ArduinoController, exercise_name: str, bpm: int = 60,
-                 beats_per_bar: int = 4, beats_on_screen: int = 6):
+                 beats_per_bar: int = 4, beats_on_screen: int = 6, profiler: FrameProfiler = None,
+                 calibration: LatencyCalibration = None):
         self.window = window
         self.width, self.height = self.window.get_size()
         pygame.display.set_caption(f'Monotonous Industrial Blender - Extreme {exercise_name.title()} Edition')
-        # Game settings
-        self.bpm = bpm
-        self.beat_interval = None
-        self.next_beat_time = None
-        self.beats_on_screen = beats_on_screen
-        self.speed = 0
-        self.update_bpm(self.bpm)
+        self.beat_width = self.width / beats_on_screen
         self.center_line_position = self.width // 2
-        self.beats_per_bar = beats_per_bar
-        self.next_beat = 0
-        self.targeted_beat = -1
-        self.channels = 4
         self.keys = [pygame.K_a, pygame.K_s, pygame.K_d, pygame.K_f]
-        self.exercise = ExerciseFactory().by_name(exercise_name=exercise_name)
-        self.current_pattern = self.exercise.patterns[0].__getitem__(0)
-        # Game state
-        self.lines = []
-        self.targets = []
-        self.attempts = []
-        self.score = 0
-        self.misses = 0
-        self.combo = 0
-        self.max_combo = 0
-        # Colors, fonts, and sounds
-        self.black = (0, 0, 0)
-        self.white = (255, 255, 255)
-        self.font = pygame.font.Font(None, 36)
-        self.big_font = pygame.font.Font(None, 48)
+        exercise_factory = ExerciseFactory()
+        self.exercise = exercise_factory.by_name(exercise_name=exercise_name)
+        # HUD and sounds
+        self.hud_score = HudText(size=36, topleft=(10, 10))
+        self.hud_combo = HudText(size=36, topleft=(10, 40))
+        self.hud_bpm = HudText(size=36, topright=(self.width - 30, 10))
+        self.hud_beats_per_bar = HudText(size=36, topright=(self.width - 30, 40))
+        self.hud_current_beat = HudText(size=36, topright=(self.width - 30, 70))
+        self.hud_exercise = HudText(size=36, center=(self.width / 2, 130))
+        self.hud_next_exercise = HudText(size=24, center=(self.width / 2, 165))
+        self.hud = [self.hud_score, self.hud_combo, self.hud_bpm, self.hud_beats_per_bar, self.hud_current_beat,
+                    self.hud_exercise, self.hud_next_exercise]
         self.tick_sound = pygame.mixer.Sound('./data/sounds/tick.wav')
         self.tock_sound = pygame.mixer.Sound('./data/sounds/tock.wav')
         # Hit collection system
         self.hit_collector = hit_collector
         if self.hit_collector.running is False:
             self.hit_collector.connect()
-        self.hit_accuracy = 15
-        self.hit_threshold = 10.0  # out of 100
-        self.got_first_hit = False
-        self.penalize_missed_attempts = False
+        self.hit_queue = getattr(self.hit_collector, 'hits', None)  # Pending hits, for the profiler's queue depth
+        # Phase timings, the overlay needs them on
+        self.profiler = profiler if profiler is not None else FrameProfiler(enabled=False)
+        self.hit_accuracy = 15  # In pixels either side of a target
+        # Game rules and state, the hit window is converted from pixels into beats
+        timeline = exercise_factory.timeline(exercise_name=exercise_name, beats_per_bar=beats_per_bar)
+        # Skill model fed by every judged note, recommending what to practise next
+        self.exercise_name = exercise_name
+        self.trainer = SkillTrainer(exercise_factory.library)
+        self.trainer.start_exercise(exercise_name)
+        self.pattern_name, self.completed_loops = None, 0
+        self.next_exercise = self.trainer.next_exercise()
+        # Latencies of the rig measured by `python -m metronome calibrate`, taken off judging and rendering
+        self.calibration = calibration
+        self.engine = GameEngine(timeline=timeline, bpm=bpm,
+                                 beats_per_bar=beats_per_bar, beats_on_screen=beats_on_screen,
+                                 hit_window=self.hit_accuracy / self.beat_width, clock=PerfClock(),
+                                 input_source=self.hit_collector, wait_for_first_hit=Config.DEBUG_MODE is False,
+                                 ramp=TempoRamp(curve=Config.TEMPO_RAMP, step=Config.TEMPO_STEP,
+                                                ratio=Config.TEMPO_RATIO, rest_bars=Config.REST_BARS),
+                                 trainer=self.trainer, calibration=self.calibration, profiler=self.profiler)
+        self.recorder = None
+        if Config.RECORD_SESSIONS is True:
+            self.recorder = SessionRecorder.for_engine(self.engine, Config.SESSION_DIR, exercise_name,
+                                                       student=Config.STUDENT_NAME)
+        # Static layers are drawn once, then only what moves is redrawn and pushed to the display
+        self.compositor = Compositor(window=self.window, full_flip=Config.RENDER_FULL_FLIP)
+        self.atlas = SpriteAtlas()
+        self.target_sprites = [self.atlas.target(0), self.atlas.target(1), self.atlas.target(0, hit=True)]
+        self.attempt_sprites = [self.atlas.attempt(hit=False), self.atlas.attempt(hit=True)]
+        self.idle_background = self.render_background(with_lanes=False)
+        self.play_background = self.render_background(with_lanes=True)
+        self.overlay = None
+        if Config.PROFILE_OVERLAY is True and self.profiler.enabled is True:
+            self.overlay = ProfilerOverlay(self.profiler, bottomleft=(10, self.height - 10))
+
+    def close(self):
+        """
+        Finish writing the session log and the profile
+        """
+        if self.profiler.enabled is True:
+            if self.profiler.export_fpath is not None:
+                self.profiler.export()
+            if Config.IS_VERBOSE is True:
+                print(f"Frame profile: {self.profiler.report()}")
+        if self.recorder is not None:
+            self.recorder.close()
+            if Config.IS_VERBOSE is True:
+                print(f"Session recorded to {self.recorder.session_dir}: {self.recorder.stats()}")
 
-    def update_bpm(self, new_bpm):
-        self.bpm = new_bpm
-        self.beat_interval = 60.0 / self.bpm
-        self.next_beat_time = time.time() + self.beat_interval
-        self.speed = (self.width / (60.0 / self.bpm)) / self.beats_on_screen
+    def render_background(self, with_lanes=True):
+        background = pygame.Surface((self.width, self.height)).convert()
+        background.fill(BLACK)
+        if with_lanes is True:
+            # Draw guide lines for voices
+            for y in LANE_Y:
+                pygame.draw.line(background, GRAY, (0, y), (self.width, y), 1)
+            # Draw Central Line (Marker for Beat Alignment)
+            pygame.draw.line(background, WHITE,
+                             (self.center_line_position, 200), (self.center_line_position, self.height), 5)
+        return background
 
     def handle_events(self):
         for event in pygame.event.get():
@@ -152,209 +129,197 @@ class GameUI:
         return True
 
     def handle_keydown(self, event):
-        hit_attempt = False
-        for i in range(self.channels):
-            if event.key == self.keys[i]:
-                new_attempt = Attempt(window=self.window,
-                                      channel=i)
-                hit = False
-                for target in self.targets:
-                    if target.channel == i and abs(target.x - self.center_line_position) < self.hit_accuracy:
-                        if target.hit is False:
-                            self.score += 1
-                            self.combo += 1
-                            self.max_combo = max(self.max_combo, self.combo)
-                        target.hit = True
-                        new_attempt.hit = True
-                        hit = True
-                        break
-                if not hit:
-                    self.combo = 0
-                    self.misses += 1
-                self.attempts.append(new_attempt)
-                hit_attempt = True
-        if not hit_attempt:
-            self.combo = 0
+        if event.key in self.keys:
+            self.engine.key_hit(channel=self.keys.index(event.key))
+        else:
+            self.engine.break_combo()
 
-    def check_inputs(self):
-        # Get new hits from the arduino
-        new_hit = self.hit_collector.get_hit()
-        if new_hit is not None:
-            assert isinstance(new_hit, Hit)
-            # print(f'new hit! channel={new_hit.channel} amplitude={new_hit.amplitude}'
-            #       f'lag={round(time.time() - new_hit.time, 2)}')
-            if new_hit.amplitude > self.hit_threshold:
-                new_attempt = Attempt(window=self.window,
-                                      channel=new_hit.channel)
-                hit = False
-                for target in self.targets:
-                    close_enough = abs(target.x - self.center_line_position) < self.hit_accuracy
-                    if target.channel == new_hit.channel and close_enough:
-                        if target.hit is False:
-                            self.score += 1
-                            self.combo += 1
-                            self.max_combo = max(self.max_combo, self.combo)
-                        target.hit = True
-                        new_attempt.hit = True
-                        hit = True
-                        break
-                if not hit and self.penalize_missed_attempts is True:
-                    self.combo = 0
-                    self.misses += 1
-                self.attempts.append(new_attempt)
+    def draw_lines(self):
+        lines = self.engine.lines
+        xs = self.center_line_position + (lines['beat'] - self.engine.render_beat) * self.beat_width
+        for x, beat_idx in zip(xs.tolist(), lines['beat_idx'].tolist()):
+            self.compositor.mark(pygame.draw.line(self.window, WHITE, (x, 200), (x, self.height),
+                                                  5 if beat_idx == 0 else 1))
+            beat_text = render_text(f"{beat_idx + 1}", 36, WHITE)
+            self.compositor.blit(beat_text, beat_text.get_rect(center=(x, 180)))
 
-    def pattern_to_targets(self, new_pattern: Pattern):
+    def note_blits(self):
         """
-        Turn a pattern into a list of targets
+        Sprites and positions of every target and attempt on screen, targets first so attempts are drawn over them
         """
-        targets = []
-        for idx, key in enumerate(['rh', 'lh', 'rf', 'lf']):
-            for note_value in new_pattern[key]:
-                targets.append(Target(window=self.window,
-                                      offset=note_value * (self.width / self.beats_on_screen),
-                                      channel=idx))
-        return targets
+        blit_sequence = []
+        for ring, sprites, radius in ((self.engine.targets, self.target_sprites, TARGET_RADIUS),
+                                      (self.engine.attempts, self.attempt_sprites, ATTEMPT_RADIUS)):
+            if len(ring) == 0:
+                continue
+            channels = ring['channel']
+            xs = (self.center_line_position + (ring['beat'] - self.engine.render_beat) * self.beat_width)
+            xs = xs.astype(np.int64) - radius
+            ys = LANE_Y_ARRAY[np.clip(channels, -1, len(LANE_Y))] - radius
+            if ring is self.engine.targets:
+                # R on even channels, L on odd ones, and the ring sprite once hit
+                variants = np.where(ring['hit'], 2, channels % 2)
+            else:
+                variants = ring['hit'].astype(np.int64)
+            blit_sequence.extend(zip([sprites[variant] for variant in variants.tolist()],
+                                     zip(xs.tolist(), ys.tolist())))
+        return blit_sequence
 
-    def update_and_draw(self, current_time):
-        self.window.fill(BLACK)
-        # Wait for first hit to start game unless in Debug mode
-        if self.got_first_hit is False and Config.DEBUG_MODE is False:
-            if self.hit_collector.get_hit() is not None:
-                self.got_first_hit = True
-                self.next_beat_time = time.time() + self.beat_interval
-                self.next_beat = 0
-                self.targeted_beat = -1
-                return None
-        else:
-            self.check_inputs()
-            # Draw guide lines for voices
-            pygame.draw.line(self.window, GRAY, (0, 250), (self.width, 250), 1)
-            pygame.draw.line(self.window, GRAY, (0, 320), (self.width, 320), 1)
-            pygame.draw.line(self.window, GRAY, (0, 430), (self.width, 430), 1)
-            pygame.draw.line(self.window, GRAY, (0, 500), (self.width, 500), 1)
-            # Draw Central Line (Marker for Beat Alignment)
-            pygame.draw.line(self.window, WHITE,
-                             (self.center_line_position, 200), (self.center_line_position, self.height), 5)
-            for line in self.lines:
-                line.update(self.speed)
-                self.targeted_beat = line.draw(targeted_beat=self.targeted_beat, beats_per_bar=self.beats_per_bar)
-            self.lines = [line for line in self.lines if line.x >= 0]
-            for target in self.targets:
-                target.update(self.speed)
-                target.draw()
-            missed_targets = [target for target in self.targets if target.x < 0 and target.hit is False]
-            if len(missed_targets) > 0:
-                self.combo = 0
-                self.misses += len(missed_targets)
-            self.targets = [target for target in self.targets if target.x >= 0]
-            for attempt in self.attempts:
-                attempt.update(self.speed)
-                attempt.draw()
-            self.attempts = [attempt for attempt in self.attempts if attempt.x >= 0]
-            # Generate and Update Lines and Targets
-            if current_time >= self.next_beat_time:
-                if self.next_beat == 0:
-                    try:
-                        self.current_pattern = self.exercise.__next__()
-                    except StopIteration:
-                        self.exercise.reset()
-                        self.current_pattern = self.exercise.__next__()
-                    self.targets.extend(self.pattern_to_targets(new_pattern=self.current_pattern))
-                # Update BPM or training patterns at the end of each beat
-                if self.exercise.is_last_beat() is True and self.next_beat == self.beats_per_bar - 1:
-                    self.update_bpm(self.bpm + 5)
-                    self.next_beat_time += 3.0
-                self.lines.append(BeatLine(window=self.window,
-                                           click_sound_tick=self.tick_sound,
-                                           click_sound_tock=self.tock_sound,
-                                           beat_idx=self.next_beat))
-                self.next_beat += 1
-                self.next_beat %= self.beats_per_bar
-                self.next_beat_time += self.beat_interval
-        # Display Score, Misses, and Combo
-        score_text = self.font.render(f"Score: {self.score}", True, WHITE)
-        self.window.blit(score_text, (10, 10))
-        # misses_text = self.font.render(f"Misses: {self.misses}", True, white)
-        # self.window.blit(misses_text, (10, 40))
-        if self.combo == self.max_combo and self.combo > 0:
-            # New combo record
-            combo_text = self.big_font.render(f"Combo: {self.combo} (Max: {self.max_combo})", True, RED)
-            self.window.blit(combo_text, (10, 46))
-        else:
-            combo_text = self.font.render(f"Combo: {self.combo} (Max: {self.max_combo})", True, WHITE)
-            self.window.blit(combo_text, (10, 40))
-        # Display the current BPM
-        bpm_text = self.font.render(f"BPM: {self.bpm}", True, WHITE)
-        text_rect = bpm_text.get_rect()
-        text_rect.right = self.width - 30  # align to right to 150px
-        text_rect.top = 10
-        self.window.blit(bpm_text, text_rect)
-        # beats_per_bar
-        bpb_text = self.font.render(f"Beats Per Bar: {self.beats_per_bar}", True, WHITE)
-        text_rect = bpb_text.get_rect()
-        text_rect.right = self.width - 30  # align to right to 150px
-        text_rect.top = 40
-        self.window.blit(bpb_text, text_rect)
-        # current_beat
-        current_beat_text = self.font.render(f"Current Beat: {int(self.targeted_beat + 1)}", True, WHITE)
-        text_rect = current_beat_text.get_rect()
-        text_rect.right = self.width - 30  # align to right to 150px
-        text_rect.top = 70
-        self.window.blit(current_beat_text, text_rect)
-        # Exercise name
-        bpm_text = self.font.render(f"Exercise: {self.current_pattern['name']}", True, WHITE)
-        text_rect = bpm_text.get_rect(center=(self.width / 2, 130))
-        self.window.blit(bpm_text, text_rect)
+    def update(self, current_time=None):
+        """
+        Advance the game logic and click on every beat line crossed since the last update
+        """
+        profiler = self.profiler
+        if profiler.enabled is True:
+            entities = self.engine.entities
+            profiler.gauge('targets', len(entities.targets))
+            profiler.gauge('attempts', len(entities.attempts))
+            profiler.gauge('lines', len(entities.lines))
+            if self.hit_queue is not None:
+                profiler.gauge('hit_queue', len(self.hit_queue))
+        for beat_idx in self.engine.update(now=current_time):
+            if beat_idx == 0:
+                self.tick_sound.play()
+            else:
+                self.tock_sound.play()
+        # Refresh the recommendation between patterns, every loop of the exercise counts as a play
+        if self.engine.completed_loops != self.completed_loops:
+            self.completed_loops = self.engine.completed_loops
+            self.trainer.start_exercise(self.exercise_name)
+        if self.engine.current_pattern_name != self.pattern_name:
+            self.pattern_name = self.engine.current_pattern_name
+            self.next_exercise = self.trainer.next_exercise()
+
+    def update_and_draw(self, current_time=None):
+        self.update(current_time=current_time)
+        self.draw()
+
+    def draw(self):
+        engine = self.engine
+        # Positions are all derived from the beat of the last update through the tempo map
+        background = self.play_background if engine.got_first_hit is True else self.idle_background
+        if self.compositor.background is not background:
+            self.compositor.set_background(background)
+        self.compositor.begin_frame()
+        profiler = self.profiler
+        if engine.got_first_hit is True:
+            with profiler.phase('draw_objects'):
+                self.draw_lines()
+                self.compositor.blits(self.note_blits())
+        with profiler.phase('hud'):
+            # Display Score, Misses, and Combo, the HUD only re-renders text whose value has changed
+            self.hud_score.set(f"Score: {engine.score}")
+            combo = f"Combo: {engine.combo} (Max: {engine.max_combo})"
+            if engine.combo == engine.max_combo and engine.combo > 0:
+                # New combo record
+                self.hud_combo.set(combo, size=48, color=RED, topleft=(10, 46))
+            else:
+                self.hud_combo.set(combo, size=36, color=WHITE, topleft=(10, 40))
+            # Display the current BPM, beats per bar and beat in the bar
+            self.hud_bpm.set(f"BPM: {engine.bpm:.0f}")
+            self.hud_beats_per_bar.set(f"Beats Per Bar: {engine.beats_per_bar}")
+            self.hud_current_beat.set(f"Current Beat: {int(engine.targeted_beat + 1)}")
+            # Exercise name
+            self.hud_exercise.set(f"Exercise: {engine.current_pattern_name}")
+            if self.next_exercise is not None:
+                self.hud_next_exercise.set(f"Next up: {self.next_exercise}")
+            for widget in self.hud:
+                widget.draw(self.compositor.blit)
+        if self.overlay is not None:
+            with profiler.phase('overlay'):
+                self.overlay.draw(self.compositor.blit)
         # Update the Display
-        pygame.display.flip()
+        with profiler.phase('flip'):
+            self.compositor.end_frame()
+        profiler.end_frame()
 
 
 def run():
     width, height = 1800, 1000
+    pygame.mixer.pre_init(buffer=Config.AUDIO_BUFFER)
     pygame.init()
     pygame.mixer.init()
-    window = pygame.display.set_mode((width, height))
+    if Config.VSYNC is True:
+        # vsync needs a renderer behind the window, which SCALED provides
+        window = pygame.display.set_mode((width, height), pygame.SCALED, vsync=1)
+    else:
+        window = pygame.display.set_mode((width, height))
     pygame.display.set_caption('Monotonous Industrial Blender - Main Menu')
-    hit_collector = ArduinoController(port=Config.COM_PORT, baudrate=Config.BAURDRATE, name='hits')
+    hit_collector = ArduinoController(port=Config.COM_PORT, baudrate=Config.BAURDRATE, name='hits',
+                                      protocol=Config.SERIAL_PROTOCOL, hit_buffer_size=Config.HIT_BUFFER_SIZE,
+                                      overflow_policy=Config.HIT_OVERFLOW_POLICY, stale_after=Config.HIT_STALE_AFTER)
+    sampler = None
+    if Config.PLAY_DRUM_SAMPLES is True:
+        # Pads sound straight from the serial reader thread instead of waiting for the next frame
+        sampler = DrumSampler(sample_fpaths=Config.DRUM_SAMPLE_FPATHS, num_voices=Config.DRUM_SAMPLE_VOICES,
+                              min_amplitude=10.0, buffer_size=Config.AUDIO_BUFFER)
+        hit_collector.add_hit_callback(sampler.on_hit)
     menu = MenuUI(screen=window, exercise_names=ExerciseFactory().list_names())
     menu.splash()
+    # Input and beat logic at a fixed high rate, rendering paced to the target FPS or the display's vsync
+    scheduler = FrameScheduler(logic_rate=Config.LOGIC_RATE, target_fps=Config.TARGET_FPS, vsync=Config.VSYNC)
+    profiler = FrameProfiler(enabled=Config.PROFILE is True or Config.PROFILE_OVERLAY is True,
+                             window=Config.PROFILE_WINDOW, export_fpath=Config.PROFILE_EXPORT_FPATH,
+                             export_interval=Config.PROFILE_EXPORT_INTERVAL)
+    calibration = LatencyCalibration.for_rig() if Config.APPLY_CALIBRATION is True else None
     game = None
-    try:
-        # Main loop
-        menu_mode = True
+    menu_mode = True
+
+    def tick(now):
+        nonlocal game, menu_mode
         running = True
-        while running:
-            current_time = time.time()
-            # Handle Events
+        # Handle Events
+        with profiler.phase('events'):
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
                 if menu_mode:
                     pos = pygame.mouse.get_pos()
                     menu_mode = menu.handle_event(event, pos)
-                elif not menu_mode and event.type == pygame.KEYDOWN:
+                elif game is not None and event.type == pygame.KEYDOWN:
                     game.handle_keydown(event=event)
-            if menu_mode is True:
-                menu.draw()
-            else:
-                if game is None:
-                    game = GameUI(window=window,
-                                  hit_collector=hit_collector,
-                                  exercise_name=menu.exercise_list[menu.selected_exercise],
-                                  bpm=menu.bpm,
-                                  beats_per_bar=menu.beats_per_bar,
-                                  beats_on_screen=8)
-                    if hit_collector.running is False:
-                        raise ValueError(
-                            f"could not connect to Arduino on port={Config.COM_PORT} at baudrate={Config.BAURDRATE}")
-                game.update_and_draw(current_time=current_time)
+        if menu_mode is False:
+            if game is None:
+                game = GameUI(window=window,
+                              hit_collector=hit_collector,
+                              exercise_name=menu.exercise_list[menu.selected_exercise],
+                              bpm=menu.bpm,
+                              beats_per_bar=menu.beats_per_bar,
+                              beats_on_screen=8,
+                              profiler=profiler,
+                              calibration=calibration)
+                if hit_collector.running is False:
+                    raise ValueError(
+                        f"could not connect to Arduino on port={Config.COM_PORT} at baudrate={Config.BAURDRATE}")
+            with profiler.phase('update'):
+                game.update(current_time=now)
+        return running
+
+    def render():
+        if menu_mode is True:
+            menu.draw()
+        elif game is not None:
+            with profiler.phase('render'):
+                game.draw()
+
+    try:
+        # Main loop
+        scheduler.run(logic=tick, render=render)
     except:
+        if game is not None:
+            game.close()
         del game
         hit_collector.disconnect()
         pygame.quit()
         raise
+    if Config.IS_VERBOSE is True:
+        print(f"Frame scheduler: {scheduler.stats()}")
+    if game is not None:
+        game.close()
     del game
     hit_collector.disconnect()
+    if sampler is not None and Config.IS_VERBOSE is True:
+        print(f"Drum sample latency: {sampler.latency_report()}")
     pygame.quit()
     sys.exit()
 
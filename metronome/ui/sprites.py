@@ -0,0 +1,46 @@
+import pygame
+from metronome.ui.colors import *
+from metronome.ui.text_cache import render_text
+
+
+COLORKEY = (255, 0, 255)  # Transparent pixels of every sprite, not used by anything we draw
+TARGET_RADIUS = 12
+ATTEMPT_RADIUS = 6
+
+
+class SpriteAtlas:
+    """
+    Every target and attempt variant rendered once into its own colour-keyed surface.
+    A frame's worth of notes becomes a list of (surface, dest) pairs for a single Surface.blits call.
+    """
+
+    def __init__(self):
+        self.sprites = {}
+        for label in ('R', 'L'):
+            surface = self.new_sprite(TARGET_RADIUS)
+            pygame.draw.circle(surface, LIGHT_BLUE, (TARGET_RADIUS, TARGET_RADIUS), TARGET_RADIUS)
+            surface.blit(render_text(label, 24, BLACK), (TARGET_RADIUS - 6, TARGET_RADIUS - 7))
+            self.sprites[('target', label)] = surface
+        surface = self.new_sprite(TARGET_RADIUS)
+        pygame.draw.circle(surface, LIGHT_BLUE, (TARGET_RADIUS, TARGET_RADIUS), TARGET_RADIUS)
+        pygame.draw.circle(surface, BLACK, (TARGET_RADIUS, TARGET_RADIUS), TARGET_RADIUS - 2)
+        self.sprites[('target', 'hit')] = surface
+        for hit, color in ((True, GREEN), (False, WHITE)):
+            surface = self.new_sprite(ATTEMPT_RADIUS)
+            pygame.draw.circle(surface, color, (ATTEMPT_RADIUS, ATTEMPT_RADIUS), ATTEMPT_RADIUS)
+            self.sprites[('attempt', hit)] = surface
+
+    @staticmethod
+    def new_sprite(radius):
+        surface = pygame.Surface((2 * radius + 1, 2 * radius + 1)).convert()
+        surface.fill(COLORKEY)
+        surface.set_colorkey(COLORKEY, pygame.RLEACCEL)
+        return surface
+
+    def target(self, channel, hit=False):
+        if hit is True:
+            return self.sprites[('target', 'hit')]
+        return self.sprites[('target', 'R' if channel % 2 == 0 else 'L')]
+
+    def attempt(self, hit=False):
+        return self.sprites[('attempt', hit)]
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+import pygame
+
+
+class TextCache:
+    """
+    Fonts loaded once per (name, size) and rendered text surfaces memoized by (text, size, colour), LRU evicted.
+    Use the shared instance through get_font and render_text rather than building one per widget.
+    """
+
+    def __init__(self, max_surfaces: int = 512):
+        self.max_surfaces = max_surfaces
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, size, name=None, sysfont=False):
+        key = (name, size, sysfont)
+        font = self.fonts.get(key)
+        if font is None:
+            if len(self.fonts) == 0:
+                # Fonts do not survive pygame.quit, forget them along with everything they rendered
+                pygame.register_quit(self.clear)
+            font = pygame.font.SysFont(name, size) if sysfont else pygame.font.Font(name, size)
+            self.fonts[key] = font
+        return font
+
+    def render(self, text, size, color, name=None, sysfont=False, antialias=True):
+        key = (text, size, tuple(color), name, sysfont, antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = self.font(size, name=name, sysfont=sysfont).render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.fonts.clear()
+        self.surfaces.clear()
+
+    def stats(self):
+        return {'fonts': len(self.fonts), 'surfaces': len(self.surfaces), 'hits': self.hits, 'misses': self.misses}
+
+
+shared_cache = TextCache()
+
+
+def get_font(size, name=None, sysfont=False):
+    return shared_cache.font(size, name=name, sysfont=sysfont)
+
+
+def render_text(text, size, color, name=None, sysfont=False, antialias=True):
+    return shared_cache.render(text, size, color, name=name, sysfont=sysfont, antialias=antialias)
+
+
+class HudText:
+    """
+    One line of HUD text. The surface is only re-rendered when the text, size or colour changes,
+    and its rect is re-anchored with the same keywords as Surface.get_rect (topleft, right/top, center...).
+    """
+
+    def __init__(self, size=36, color=(255, 255, 255), **anchor):
+        self.size = size
+        self.color = color
+        self.anchor = anchor
+        self.text = None
+        self.surface = None
+        self.rect = None
+        self.renders = 0
+
+    def set(self, text, size=None, color=None, **anchor):
+        """
+        Update the text and optionally its style or anchor, returns True when the surface had to be re-rendered
+        """
+        size = self.size if size is None else size
+        color = self.color if color is None else color
+        anchor = anchor or self.anchor
+        if text == self.text and size == self.size and color == self.color and anchor == self.anchor:
+            return False
+        self.text, self.size, self.color, self.anchor = text, size, color, anchor
+        # Straight to the font, HUD values rarely repeat so they would only churn the shared cache
+        self.surface = get_font(size).render(text, True, color)
+        self.rect = self.surface.get_rect(**self.anchor)
+        self.renders += 1
+        return True
+
+    def draw(self, blit):
+        """
+        Draw through any blit(surface, dest) callable, a Surface's or a Compositor's
+        """
+        if self.surface is not None:
+            return blit(self.surface, self.rect)
+        return None
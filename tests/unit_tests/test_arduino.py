@@ -0,0 +1,242 @@
+import os
+import time
+import random
+import pytest
+from metronome.arduino.arduino_threaded import Hit, ArduinoController
+from metronome.arduino.clock_sync import ClockSync, DEVICE_CLOCK_WRAP
+from metronome.arduino.hits import HitBatch
+from metronome.arduino.protocol import FrameDecoder, encode_hit_frame, parse_ready_msg, FRAME_SIZE
+from metronome.arduino.ring_buffer import HitRingBuffer
+from metronome.arduino.simulator import ArduinoSimulator, generated_hits, hits_from_exercise, hits_from_file
+from metronome.exercise.exercise import ExerciseFactory
+
+
+def test_parse_hit_msg():
+    hit = ArduinoController.parse_hit_msg('h2a57.3', hit_time=1.5)
+    assert isinstance(hit, Hit)
+    assert hit.channel == 2
+    assert hit.amplitude == 57.3
+    assert hit.time == 1.5
+    try:
+        ArduinoController.parse_hit_msg('ready', hit_time=1.5)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_hit_callbacks():
+    controller = ArduinoController(port='unused')
+    received = []
+    controller.add_hit_callback(received.append)
+    controller.add_hit_callback(lambda hit: 1 / 0)
+    hit = controller.dispatch_hit('h1a20.0', 3.0)
+    assert received == [hit]
+    assert controller.dispatch_hit('ready', 3.0) is None
+    controller.remove_hit_callback(received.append)
+    controller.dispatch_hit('h1a20.0', 4.0)
+    assert len(received) == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason="needs pseudo-terminals")
+def test_blocking_reader_batches():
+    master_fd, slave_fd = os.openpty()
+    controller = ArduinoController(port=os.ttyname(slave_fd), reader_mode='blocking', read_timeout=0.05)
+    controller.connect()
+    assert controller.running is True
+    # A line split over two writes is only queued once it is complete
+    os.write(master_fd, b"ready\nh1a2")
+    time.sleep(0.1)
+    os.write(master_fd, b"0.5\nh3a40.0\n")
+    time.sleep(0.1)
+    assert controller.get_message()['msg'] == 'ready'
+    assert controller.get_message() is None
+    hits = controller.drain_hits()
+    assert hits.channels.tolist() == [1, 3]
+    assert hits.amplitudes.tolist() == [20.5, 40.0]
+    assert len(controller.drain_hits()) == 0
+    start = time.perf_counter()
+    controller.disconnect()
+    assert time.perf_counter() - start < 0.5
+    assert controller.thread.is_alive() is False
+    os.close(master_fd)
+    os.close(slave_fd)
+
+
+def test_binary_frames():
+    frames = b''.join(encode_hit_frame(channel=idx % 4, amplitude=idx + 0.25, device_time=1000 * idx)
+                      for idx in range(100))
+    assert len(frames) == 100 * FRAME_SIZE
+    decoder = FrameDecoder()
+    # Split mid-frame, with text leftovers and a corrupted frame in the stream
+    corrupted = bytearray(encode_hit_frame(channel=1, amplitude=5.0, device_time=7))
+    corrupted[3] ^= 0xFF
+    stream = b'h1a20.0\n' + frames[:50 * FRAME_SIZE + 4]
+    batch = decoder.feed(stream, host_time=1.0)
+    assert isinstance(batch, HitBatch)
+    assert len(batch) == 50
+    batch = decoder.feed(frames[50 * FRAME_SIZE + 4:] + bytes(corrupted) + frames[:FRAME_SIZE], host_time=2.0)
+    assert len(batch) == 51
+    assert decoder.bad_frames == 1
+    assert batch.channels.tolist()[:3] == [2, 3, 0]
+    assert batch.amplitudes[0] == 50.25
+    assert batch.device_times[1] == 51000
+    hits = list(batch)
+    assert isinstance(hits[0], Hit)
+    assert hits[0].time == 2.0
+    assert hits[0].device_time == 50000
+
+
+def test_parse_ready_msg():
+    assert parse_ready_msg('ready') == []
+    assert parse_ready_msg('ready bin1') == ['bin1']
+    assert parse_ready_msg('h1a2.0') is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason="needs pseudo-terminals")
+def test_binary_protocol_negotiation():
+    master_fd, slave_fd = os.openpty()
+    controller = ArduinoController(port=os.ttyname(slave_fd), reader_mode='blocking', read_timeout=0.05)
+    controller.connect()
+    os.write(master_fd, b"ready bin1\nh0a10.0\n")
+    time.sleep(0.1)
+    assert controller.active_protocol == 'bin1'
+    assert os.read(master_fd, 64) == b"bin1\n"
+    os.write(master_fd, encode_hit_frame(channel=2, amplitude=60.5, device_time=123))
+    time.sleep(0.1)
+    assert controller.get_message()['msg'] == 'ready bin1'
+    assert controller.get_hit().amplitude == 10.0
+    hit = controller.get_hit()
+    assert hit.channel == 2 and hit.amplitude == 60.5 and hit.device_time == 123
+    controller.disconnect()
+    os.close(master_fd)
+    os.close(slave_fd)
+
+
+def test_ring_buffer_overflow():
+    ring = HitRingBuffer(capacity=4, overflow_policy='drop_oldest')
+    for idx in range(6):
+        ring.push(channel=idx, amplitude=10.0, hit_time=float(idx))
+    assert len(ring) == 4
+    assert ring.dropped == 2
+    assert ring.drain().channels.tolist() == [2, 3, 4, 5]
+    ring = HitRingBuffer(capacity=4, overflow_policy='drop_newest')
+    for idx in range(6):
+        ring.push(channel=idx, amplitude=10.0, hit_time=float(idx))
+    assert ring.drain().channels.tolist() == [0, 1, 2, 3]
+    assert ring.stats() == {'pending': 0, 'pushed': 4, 'dropped': 2, 'stale': 0}
+    # Batches wrap around the end of the ring
+    ring = HitRingBuffer(capacity=4, overflow_policy='drop_oldest')
+    ring.push(channel=9, amplitude=1.0, hit_time=0.0)
+    ring.push(channel=9, amplitude=1.0, hit_time=0.0)
+    ring.drain()
+    ring.push(channel=0, amplitude=1.0, hit_time=0.0)
+    ring.push_batch(HitBatch(channels=[1, 2, 3, 4, 5], amplitudes=[1.0] * 5, times=[1.0] * 5))
+    assert ring.dropped == 2
+    batch = ring.drain()
+    assert batch.channels.tolist() == [2, 3, 4, 5]
+    assert [hit.device_time for hit in batch] == [None] * 4
+
+
+def test_ring_buffer_stale_hits():
+    ring = HitRingBuffer(capacity=16, stale_after=0.25, clock=lambda: 0.0)
+    for idx in range(10):
+        ring.push(channel=0, amplitude=10.0, hit_time=idx * 0.1, device_time=idx)
+    assert ring.pop().device_time == 0
+    batch = ring.drain(now=1.0)
+    assert batch.times.tolist() == [0.8, 0.9]
+    assert ring.stale == 7
+    assert len(ring) == 0
+
+
+class SimulatedDeviceClock:
+    """
+    Arduino micros() running at a drifted rate from an arbitrary offset, wrapping at 32 bits
+    """
+    def __init__(self, offset_us, drift_ppm):
+        self.offset_us = offset_us
+        self.rate = 1.0 + drift_ppm * 1e-6
+
+    def micros(self, host_time):
+        return int(self.offset_us + host_time * 1e6 * self.rate) % DEVICE_CLOCK_WRAP
+
+
+def test_clock_sync_drift_and_jitter():
+    rng = random.Random(1)
+    device = SimulatedDeviceClock(offset_us=DEVICE_CLOCK_WRAP - 160_000_000, drift_ppm=80.0)
+    sync = ClockSync(window=64)
+    for ping_idx in range(120):
+        sent_time = 100.0 + ping_idx * 1.0
+        # Serial and scheduling jitter of up to 1 ms in each direction, plus an occasional very slow reply
+        to_device = rng.uniform(0.0002, 0.001)
+        to_host = rng.uniform(0.0002, 0.001) + (0.05 if ping_idx % 17 == 5 else 0.0)
+        device_time = device.micros(sent_time + to_device)
+        sync.add_ping(device_time, sent_time=sent_time, received_time=sent_time + to_device + to_host)
+    assert sync.ready
+    assert sync.rejected >= 5
+    assert abs(sync.drift_ppm - 80.0) < 20.0
+    assert sync.residual_error < 0.0005
+    # The clock wrapped during the run and hits map back onto the host clock to well under a millisecond
+    assert sync.wraps == 1
+    hit_time = 219.4567
+    assert abs(float(sync.to_host(device.micros(hit_time))[0]) - hit_time) < 0.0005
+
+
+def test_parse_hit_msg_device_time():
+    hit = ArduinoController.parse_hit_msg('h3a12.5t4000000', hit_time=1.0)
+    assert hit.channel == 3
+    assert hit.amplitude == 12.5
+    assert hit.device_time == 4000000
+    assert ArduinoController.parse_hit_msg('h3a12.5', hit_time=1.0).device_time is None
+
+
+def connect_to_simulator(simulator, **kwargs):
+    controller = ArduinoController(port=simulator.start(), read_timeout=0.02, **kwargs)
+    controller.connect()
+    simulator.send_ready()
+    time.sleep(0.1)
+    return controller
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason="needs pseudo-terminals")
+def test_simulator_exercise_playback():
+    simulator = ArduinoSimulator(drift_ppm=150.0, device_clock_offset=12345678, seed=0)
+    controller = connect_to_simulator(simulator, sync_interval=0.05)
+    assert controller.active_protocol == 'bin1'
+    # Let the clock sync settle before playing
+    time.sleep(0.4)
+    assert controller.clock_sync.ready
+    exercise = ExerciseFactory().by_name('Hand-To-Hand (Simplified)')
+    hits = list(hits_from_exercise(exercise, bpm=1200))
+    simulator.play(hits, block=True)
+    time.sleep(0.1)
+    batch = controller.drain_hits()
+    assert len(batch) == len(hits)
+    assert batch.channels.tolist() == [hit.channel for hit in hits]
+    # Corrected times keep the exercise's spacing despite the drift and the batched reads
+    intervals = batch.times[1:] - batch.times[:-1]
+    expected = [b.offset - a.offset for a, b in zip(hits[:-1], hits[1:])]
+    assert max(abs(interval - expected_interval) for interval, expected_interval in zip(intervals, expected)) < 0.002
+    assert controller.clock_sync.residual_error < 0.002
+    controller.disconnect()
+    simulator.stop()
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason="needs pseudo-terminals")
+def test_simulator_load_with_dropped_bytes(tmp_path):
+    simulator = ArduinoSimulator(capabilities=[], jitter=0.0005, drop_rate=0.05, seed=1)
+    controller = connect_to_simulator(simulator, hit_buffer_size=4096)
+    assert controller.active_protocol == 'text'
+    simulator.play(generated_hits(rate=4000.0, duration=0.5), block=True)
+    time.sleep(0.1)
+    batch = controller.drain_hits()
+    # Damaged lines are lost or garbled, but the reader keeps going
+    assert simulator.sent_hits == 2000
+    assert simulator.dropped_bytes > 0
+    assert len(batch) > 1800
+    assert controller.hit_stats()['dropped'] == 0
+    controller.disconnect()
+    simulator.stop()
+    hit_file = tmp_path / 'hits.txt'
+    hit_file.write_text("# offset channel amplitude\n0.0 1 50.0\n\n0.25, 2, 60.5\n")
+    replayed = list(hits_from_file(str(hit_file)))
+    assert [(hit.offset, hit.channel, hit.amplitude) for hit in replayed] == [(0.0, 1, 50.0), (0.25, 2, 60.5)]
@@ -0,0 +1,30 @@
+import os
+import time
+import pygame
+from metronome.arduino.arduino_threaded import Hit
+from metronome.audio.sampler import DrumSampler
+
+
+def init_mixer():
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.mixer.pre_init(buffer=256)
+    pygame.mixer.init()
+
+
+def test_sampler_voice_pool():
+    init_mixer()
+    sampler = DrumSampler(sample_fpaths=['./data/sounds/tick.wav', './data/sounds/tock.wav'], num_voices=2,
+                          min_amplitude=10.0, buffer_size=256)
+    assert len(sampler.samples) == 2
+    # Quiet hits and unknown channels are ignored
+    assert sampler.play(channel=0, amplitude=5.0) is None
+    assert sampler.play(channel=5, amplitude=50.0) is None
+    voices = [sampler.play(channel=idx % 2, amplitude=50.0 + idx) for idx in range(4)]
+    assert all(voice in (0, 1) for voice in voices)
+    sampler.on_hit(Hit(hit_channel=1, hit_amplitude=120.0, hit_time=time.perf_counter()))
+    assert sampler.voices[0].get_volume() <= 1.0
+    report = sampler.latency_report()
+    assert report['count'] == 1
+    assert report['output_ms'] > 0.0
+    assert report['max_ms'] >= report['output_ms']
+    pygame.mixer.quit()
@@ -1,5 +1,16 @@
+import os
 import json
+import numpy as np
+from metronome.exercise.beats import TICKS_PER_BEAT, compile_beat_str
+from metronome.exercise.character import CharacterSkills
 from metronome.exercise.exercise import Pattern, Exercise, ExerciseFactory
+from metronome.exercise.library import ExerciseLibrary, load_library, loaded_libraries
+from metronome.exercise.parser import ExerciseParseError, ExerciseParser
+from metronome.exercise.timeline import Timeline, TimelineCursor
+from metronome.exercise.trainer import SkillTrainer
+from metronome.game.bot import BotPlayer
+from metronome.game.clock import ManualClock
+from metronome.game.engine import GameEngine
 
 
 def test_pattern_init():
@@ -142,3 +153,255 @@ def test_exercise_factory():
     assert ex_f.exercises[1].name == 'Happy Feet'
     assert ex_f.exercises[1].patterns[0].right_foot == [[0.0, 1.0, 2.0, 3.0], []]
     assert ex_f.exercises[1].patterns[0].left_foot == [[], [0.0, 1.0, 2.0, 3.0]]
+
+
+def test_timeline_matches_iterator():
+    ex_f = ExerciseFactory()
+    for exercise in ex_f.exercises:
+        exercise.reset()
+        expected = [bar for bar in exercise]
+        exercise.reset()
+        timeline = Timeline.compile(exercise, beats_per_bar=4)
+        assert len(timeline) == len(expected)
+        for bar_idx, bar in enumerate(expected):
+            compiled_bar = timeline[bar_idx]
+            for key in ('rh', 'lh', 'rf', 'lf'):
+                assert compiled_bar[key] == sorted(bar[key])
+            assert compiled_bar['name'] == bar['name']
+        # Onsets are sorted and offset by whole bars
+        assert all(timeline.onsets[1:] >= timeline.onsets[:-1])
+        assert all(timeline.onsets == timeline.bar_ids * 4 + timeline.beats)
+
+
+def test_timeline_cursor():
+    test_pattern_1 = Pattern.from_tsv(name='pattern 1', left_foot=['xxx,---,xxx,---'], right_hand=['x---,,,'])
+    test_pattern_2 = Pattern.from_tsv(name='pattern 2',
+                                      left_foot=['xxx,-x-,xxx,-x-', 'x---,x-x-,x---,x--x'],
+                                      num_loops=2)
+    timeline = Timeline.compile(Exercise(name='test_exercise', patterns=[test_pattern_1, test_pattern_2]))
+    assert timeline.num_bars == 5
+    assert timeline.pattern_bounds.tolist() == [0, 1, 5]
+    assert timeline.loop_bounds.tolist() == [0, 1, 3, 5]
+    cursor = TimelineCursor(timeline)
+    beats, channels = cursor.next_bar()
+    # The game gets exact triplets, the legacy per-limb lists keep their 2 decimals
+    assert beats.tolist() == [0.0, 0.0, 1 / 3, 2 / 3, 2.0, 7 / 3, 8 / 3]
+    assert (timeline.ticks[timeline.bar_slice(0)] * 3 % TICKS_PER_BEAT == 0).all()
+    assert timeline[0]['lf'] == [0.0, 0.33, 0.67, 2.0, 2.33, 2.67]
+    assert channels.tolist() == [0, 3, 3, 3, 3, 3, 3]
+    assert cursor.pattern_name == 'pattern 1'
+    assert cursor.is_pattern_end() is True
+    assert cursor.is_last_bar() is False
+    for _ in range(4):
+        cursor.next_bar()
+    assert cursor.pattern_name == 'pattern 2'
+    assert cursor.is_last_bar() is True
+    assert cursor.remaining_bars() == 0
+    # Wraps around by default
+    beats, channels = cursor.next_bar()
+    assert cursor.bar_idx == 0
+    cursor = TimelineCursor(timeline, loop=False)
+    for _ in range(5):
+        cursor.next_bar()
+    try:
+        cursor.next_bar()
+        assert False
+    except StopIteration:
+        pass
+
+
+def test_exercise_library_cache(tmp_path):
+    with open('./data/exercises.tsv', 'r') as fp:
+        source = fp.read()
+    fpath = str(tmp_path / 'exercises.tsv')
+    with open(fpath, 'w') as fp:
+        fp.write(source)
+    parsed = ExerciseFactory(csv_fpath=fpath)
+    assert os.path.isfile(os.path.join(fpath + '.cache', 'meta.json'))
+    # Parsed once per process, then loaded from the memory-mapped cache in a new one
+    assert ExerciseFactory(csv_fpath=fpath).library is parsed.library
+    loaded_libraries.clear()
+    cached = ExerciseLibrary.load(fpath)
+    assert cached.exercise_names == parsed.list_names()
+    for exercise_idx, exercise in enumerate(parsed.exercises):
+        rebuilt = cached.exercise(exercise_idx)
+        for pattern, rebuilt_pattern in zip(exercise.patterns, rebuilt.patterns):
+            assert rebuilt_pattern.name == pattern.name and rebuilt_pattern.num_loops == pattern.num_loops
+            for limb in ('right_hand', 'left_hand', 'right_foot', 'left_foot'):
+                assert getattr(rebuilt_pattern, limb) == getattr(pattern, limb)
+    # Touching the file without changing it keeps the cache, changing the content rebuilds it
+    os.utime(fpath, ns=(0, 0))
+    assert ExerciseLibrary.load(fpath).exercise_names == parsed.list_names()
+    with open(fpath, 'w') as fp:
+        fp.write(source.replace('Happy Feet', 'Happier Feet'))
+    assert 'Happier Feet' in load_library(fpath).exercise_names
+    assert ExerciseFactory(csv_fpath=fpath).by_name('happier feet').name == 'Happier Feet'
+    timeline = ExerciseFactory(csv_fpath=fpath).timeline('Happier Feet')
+    assert timeline is ExerciseFactory(csv_fpath=fpath).timeline('Happier Feet')
+    assert ExerciseFactory(csv_fpath=fpath).timeline('Unhappy Feet') is None
+
+
+def test_exercise_catalog():
+    factory = ExerciseFactory()
+    catalog = factory.library.catalog
+    assert catalog.index_of('happy feet') == catalog.index_of('HappyFeet') == factory.list_names().index('Happy Feet')
+    assert catalog.index_of('Unhappy Feet') is None
+    stats = catalog.stats(catalog.index_of('Happy Feet'))
+    assert stats['active_channels'] == ['right_foot', 'left_foot']
+    assert stats['max_subdivision'] == 4
+    assert 'double_bass' in stats['skills'] and 'paradiddles' not in stats['skills']
+    # Filtered listings agree with a scan over the rebuilt exercises
+    for exercise_idx, exercise in enumerate(factory.exercises):
+        bars = [(bar, pattern.num_loops) for pattern in exercise.patterns for bar in range(pattern.num_bars)]
+        notes = sum(sum(len(getattr(pattern, limb)[bar]) for limb in ('right_hand', 'left_hand', 'right_foot',
+                                                                        'left_foot')) * pattern.num_loops
+                    for pattern in exercise.patterns for bar in range(pattern.num_bars))
+        assert abs(catalog.notes_per_bar[exercise_idx] - notes / sum(loops for _, loops in bars)) < 1e-9
+        uses_left_hand = any(any(pattern.left_hand) for pattern in exercise.patterns)
+        assert (exercise_idx in catalog.select(limbs=['left_hand'])) == uses_left_hand
+    assert factory.list_names(skills=['paradiddles']) == ['Easy Beats and Fills', 'Rudiments']
+    assert set(factory.list_names(tags=['Triplets'])) == set(factory.list_names(tags=['triplets'], max_subdivision=16))
+    assert factory.list_names(skills=['double_bass'], limbs=['right_hand']) == ['Double Bass Beats']
+    assert factory.list_names(tags=['no such tag']) == []
+    assert factory.list_names(min_notes_per_bar=16) == ['Rudiments']
+
+
+def test_character_skills():
+    skills = CharacterSkills(interests=['singles', 'doubles', 'speed'])
+    # Untrained skills tie at level 0, the first one listed wins
+    assert skills.get_weakest_skill().name == 'singles'
+    skills.observe([0, 2], hit=True, error_ms=0.0)
+    assert skills.skills[0].level == 1.0 and skills.skills[0].accuracy == 1.0
+    assert skills.get_weakest_skill().name == 'doubles'
+    skills.observe([1], hit=True, error_ms=20.0)
+    assert skills.skills[1].level == 0.5
+    assert skills.get_weakest_skill().name == 'doubles'
+    # Misses in bulk match the same misses one by one
+    skills.observe([0], hit=False, count=10)
+    for _ in range(10):
+        skills.observe([2], hit=False)
+    assert abs(skills.skills[0].level - skills.skills[2].level) < 1e-12
+    assert skills.get_weakest_skill().name == 'singles'
+    # Outdated heap entries never outnumber the skills for long
+    for _ in range(100):
+        skills.observe([0, 1, 2], hit=True, error_ms=-5.0)
+    assert len(skills.heap) <= 4 * 3 + 16
+    # The early 20 ms hit has decayed to a few percent of the average
+    assert -5.0 < skills.skills[1].error < -4.5 and 5.0 < skills.skills[1].abs_error < 5.5
+    # Skills updated without the heap knowing are picked up again
+    skills.skills[2].observe(hit=True, error_ms=0.0, count=100)
+    skills.skills[1].observe(hit=True, error_ms=0.0, count=100)
+    skills.heap = [entry for entry in skills.heap if entry[1] == 0]
+    skills.skills[0].observe(hit=True, error_ms=0.0, count=100)
+    assert skills.get_weakest_skill() is not None
+    assert all(entry[2] == skills.skills[entry[1]].version for entry in skills.heap)
+    # No skills, no weakest one
+    assert CharacterSkills(interests=[]).get_weakest_skill() is None
+
+
+def test_skill_trainer():
+    factory = ExerciseFactory()
+    trainer = SkillTrainer(factory.library)
+    assert 'double_bass' in trainer.skills.skill_names
+    assert all(len(trainer.catalog.select(skills=[skill])) > 0 for skill in trainer.skills.skill_names)
+    # Nothing trained yet: the least played exercise for the first skill
+    first_skill = trainer.weakest_skill().name
+    assert trainer.next_exercise() in factory.list_names(skills=[first_skill])
+    # Playing it well moves the recommendation on to the other exercises of the skill, then to other skills
+    engine = GameEngine(timeline=factory.timeline('Happy Feet'), bpm=120, hit_window=0.1, clock=ManualClock(),
+                        trainer=trainer)
+    trainer.start_exercise('Happy Feet')
+    BotPlayer(timing_error=0.01, seed=0).attach(engine)
+    for _ in range(1200):
+        engine.clock.advance(1.0 / 60.0)
+        engine.update()
+    double_bass = trainer.skills.skills[trainer.skills.skill_index['double_bass']]
+    assert double_bass.samples == engine.score + engine.misses
+    assert 0.5 < double_bass.level < 1.0
+    assert trainer.weakest_skill().name != 'double_bass'
+    recommended = trainer.next_exercise()
+    assert recommended != 'Happy Feet'
+    assert recommended in factory.list_names(skills=[trainer.weakest_skill().name])
+    # Within one skill, exercises take turns by play count
+    skill_exercises = factory.list_names(skills=[trainer.weakest_skill().name])
+    seen = []
+    for _ in range(len(skill_exercises)):
+        seen.append(trainer.next_exercise())
+        trainer.start_exercise(seen[-1])
+    assert sorted(seen) == sorted(skill_exercises)
+    # A trainer without skills, as over a library with no skill tags, has nothing to recommend
+    trainer = SkillTrainer(factory.library, skills=CharacterSkills(interests=[]))
+    assert trainer.weakest_skill() is None and trainer.next_exercise() is None
+    trainer.start_exercise('Happy Feet')
+    trainer.observe(hit=True, error_ms=0.0)
+    assert trainer.next_exercise() is None
+
+
+def test_exercise_parser_errors(tmp_path, capsys):
+    with open('./data/exercises.tsv', 'r') as fp:
+        source = fp.read()
+    # Break the Loops cell of the second exercise and a beat string of the fourth
+    lines = source.split('\n')
+    headers = [idx for idx, line in enumerate(lines) if line.startswith('!!!')]
+    loops_idx = headers[1] + 6
+    assert lines[loops_idx].startswith('Loops\t4\t')
+    lines[loops_idx] = lines[loops_idx].replace('Loops\t4\t', 'Loops\tfour\t', 1)
+    rh_idx = headers[3] + 2
+    assert lines[rh_idx].startswith('RH\tx-x-,')
+    lines[rh_idx] = lines[rh_idx].replace('RH\tx-x-,', 'RH\tx-o-,', 1)
+    fpath = str(tmp_path / 'broken.tsv')
+    with open(fpath, 'w') as fp:
+        fp.write('\n'.join(lines))
+    parser = ExerciseParser(fpath)
+    # Names come straight from the headers, bodies are parsed lazily
+    assert list(parser.names()) == ExerciseFactory().list_names()
+    exercises = parser.exercises()
+    assert next(exercises).name == 'Hand-To-Hand (Simplified)'
+    try:
+        next(exercises)
+        assert False
+    except ExerciseParseError as e:
+        assert (e.fpath, e.line, e.column) == (fpath, loops_idx + 1, 7)
+        assert str(e).startswith(f"{fpath}:{loops_idx + 1}:7: Loops must be a positive integer")
+    parser = ExerciseParser(fpath, skip_errors=True)
+    names = [exercise.name for exercise in parser]
+    assert 'Happy Feet' not in names and 'Easy Beats and Fills' not in names and len(names) == 5
+    assert [(e.line, e.column) for e in parser.errors] == [(loops_idx + 1, 7), (rh_idx + 1, 6)]
+    assert ExerciseLibrary.from_tsv(fpath).exercise_names == names
+    # The skipped exercises are cached with the library and reported again on every warm load
+    capsys.readouterr()
+    cold = ExerciseLibrary.load(fpath)
+    cold_output = capsys.readouterr().out
+    warm = ExerciseLibrary.load(fpath)
+    assert capsys.readouterr().out == cold_output
+    assert cold_output.count('skipping exercise') == 2 and "'Happy Feet'" in cold_output
+    assert warm.exercise_names == names and warm.skipped == cold.skipped
+    assert [name for name, _ in warm.skipped] == parser.skipped
+    # The last pattern keeps every bar up to its last filled column
+    assert ExerciseFactory().by_name('8ths and 16ths').patterns[-1].num_bars == 2
+
+
+def test_exact_beat_strings():
+    compiled = compile_beat_str('x----,x-x-x-x,xx,x--')
+    assert compile_beat_str('x----,x-x-x-x,xx,x--') is compiled
+    # Quintuplets, septuplets and nested 8ths are exact fractions of a beat and whole ticks
+    assert list(zip(compiled.numerators.tolist(), compiled.denominators.tolist())) == [
+        (0, 1), (1, 1), (9, 7), (11, 7), (13, 7), (2, 1), (5, 2), (3, 1)]
+    assert compiled.ticks.tolist() == [0, TICKS_PER_BEAT, 9 * TICKS_PER_BEAT // 7, 11 * TICKS_PER_BEAT // 7,
+                                       13 * TICKS_PER_BEAT // 7, 2 * TICKS_PER_BEAT, 5 * TICKS_PER_BEAT // 2,
+                                       3 * TICKS_PER_BEAT]
+    assert Pattern.beat_str_to_coordinates('x----,x-x-x-x,xx,x--') == list(compiled.coordinates) == [
+        0.0, 1.0, 1.29, 1.57, 1.86, 2.0, 2.5, 3.0]
+    # The same time written at different subdivisions is the same tick
+    assert compile_beat_str('-x,x-x-,-x-').ticks.tolist() == compile_beat_str('--x-,x-x-,--x---').ticks.tolist()
+    # A 5-over-3 loop stays on the grid however many times it repeats
+    pattern = Pattern.from_tsv(name='fives', right_hand=['xxxxx,xxxxx,xxxxx,-'], left_hand=['xxx,xxx,xxx,-'],
+                               num_loops=1000)
+    timeline = Timeline.compile(Exercise(name='fives', patterns=[pattern]))
+    assert timeline.num_notes == 24000
+    assert (timeline.ticks % (TICKS_PER_BEAT // 15) == 0).all()
+    assert set((timeline.onsets % 4 * 15).round(9).tolist()) <= set(float(step) for step in range(60))
+    # Both hands land together on the first 3 beats of every bar, and only there
+    onsets, counts = np.unique(timeline.ticks[timeline.bar_slice(999)], return_counts=True)
+    assert onsets[counts == 2].tolist() == [0, TICKS_PER_BEAT, 2 * TICKS_PER_BEAT]
+    assert ExerciseFactory().library.catalog.max_subdivision.max() == 8
@@ -0,0 +1,537 @@
+import math
+import json
+import numpy as np
+from metronome.exercise.exercise import Pattern, Exercise
+from metronome.exercise.timeline import Timeline
+from metronome.arduino.hits import Hit
+from metronome.game.bot import BotPlayer
+from metronome.game.calibration import Calibrator, LatencyCalibration, fit_channel_offsets
+from metronome.game.clock import ManualClock
+from metronome.game.engine import GameEngine
+from metronome.game.entities import EntityStore
+from metronome.game.recorder import SessionRecorder, SessionLog, JUDGEMENT_KINDS
+from metronome.game.analytics import TimingSummary, find_sessions, summarize_sessions
+from metronome.game.profiler import FrameProfiler, RollingHistogram, NULL_SCOPE
+from metronome.game.scheduler import FrameScheduler
+from metronome.game.tempo import TempoMap, TempoRamp
+
+
+def test_judge_nearest_target():
+    store = EntityStore()
+    # Channels 0 and 1 alternate every quarter beat, channel 2 is dense enough to crowd any window
+    store.spawn_targets(beats=np.arange(16) * 0.25, channels=np.arange(16) % 2)
+    store.spawn_targets(beats=4.0 + np.arange(400) * 0.001, channels=np.full(400, 2))
+    row_of = {beat: row for row, beat in enumerate(store.targets['beat'].tolist())}
+    # Closest target on the right channel wins
+    assert store.judge(channel=0, beat=1.04, window=0.1) == row_of[1.0]
+    assert store.targets['hit'][row_of[1.0]]
+    # Already judged targets are skipped, and out-of-window hits miss
+    assert store.judge(channel=0, beat=1.04, window=0.1) == -1
+    assert store.judge(channel=1, beat=1.04, window=0.1) == -1
+    assert store.judge(channel=1, beat=1.2, window=0.1) == row_of[1.25]
+    assert store.judge(channel=3, beat=1.2, window=0.1) == -1
+    assert store.judge(channel=7, beat=1.2, window=0.1) == -1
+    # The next unjudged one on the channel, past a judged one
+    assert store.judge(channel=2, beat=4.1, window=0.01) == row_of[4.1]
+    assert store.judge(channel=2, beat=4.1, window=0.01) in (row_of[4.099], row_of[4.101])
+    assert len(store.channel_targets[2]) == 400 and len(store.channel_targets[0]) == 8
+
+
+def test_judge_expire():
+    store = EntityStore(capacity=64)
+    for bar in range(100):
+        store.spawn_targets(beats=bar + np.arange(10) * 0.1, channels=np.zeros(10))
+    store.judge(channel=0, beat=0.0, window=0.05)
+    assert store.cull(before_beat=50.0) == 499
+    assert len(store.targets) == 500 and len(store.channel_targets[0]) == 500
+    assert store.judge(channel=0, beat=49.0, window=0.05) == -1
+    assert store.judge(channel=0, beat=50.01, window=0.05) == store.targets.search(50.0)
+    # Rows still line up with the channel index after the rings have been compacted and grown
+    for bar in range(100, 200):
+        store.cull(before_beat=bar - 2.0)
+        store.spawn_targets(beats=bar + np.arange(10) * 0.1, channels=np.arange(10) % 4)
+    row = store.judge(channel=3, beat=199.31, window=0.05)
+    assert row == store.targets.search(199.3) and store.targets.columns['channel'][row] == 3
+
+
+def test_tempo_map():
+    tempo = TempoMap(bpm=60, start_time=10.0)
+    assert tempo.beat_at(10.0) == 0.0
+    assert tempo.beat_at(12.0) == 2.0
+    assert tempo.beat_at(9.0) == -1.0
+    tempo.set_bpm(bpm=120, at_time=14.0)
+    # Beat positions before the change are untouched and the map stays continuous
+    assert tempo.beat_at(13.0) == 3.0
+    assert tempo.beat_at(14.0) == 4.0
+    assert tempo.beat_at(15.0) == 6.0
+    assert tempo.time_at(6.0) == 15.0
+    assert tempo.time_at(2.0) == 12.0
+    assert tempo.bpm_at(13.9) == 60
+    assert tempo.bpm_at(14.1) == 120
+    # A change in the past drops the later segments
+    tempo.set_bpm(bpm=30, at_time=12.0)
+    assert tempo.beat_at(14.0) == 3.0
+    assert tempo.bpm_at(20.0) == 30
+
+
+def test_tempo_ramps():
+    tempo = TempoMap(bpm=60, start_time=10.0)
+    assert tempo.append(4.0, 120) == 14.0
+    assert tempo.append(4.0, 240) == 14.0
+    assert tempo.append(8.0, 60) == 15.0
+    assert tempo.time_at(6.0) == 14.5 and tempo.beat_at(14.5) == 6.0
+    assert tempo.bpm_at_beat(7.9) == 240 and tempo.bpm_at_beat(8.0) == 60
+    for beat, bpm in ((7.0, 60), (9.0, -1)):
+        try:
+            tempo.append(beat, bpm)
+            assert False
+        except ValueError:
+            pass
+    assert TempoRamp(curve='step', step=5).loop_segments(100, 16) == [(16, 105)]
+    assert TempoRamp(curve='pattern', step=5).loop_segments(100, 16, [4, 8]) == [(4, 105), (8, 110), (16, 115)]
+    linear = TempoRamp(curve='linear', step=8).loop_segments(100, 8)
+    assert linear[0] == (1.0, 101.0) and linear[-1] == (8.0, 108.0) and len(linear) == 8
+    exponential = TempoRamp(curve='exponential', ratio=2.0, max_bpm=150).loop_segments(100, 4)
+    assert exponential[0][1] == 100 * 2 ** 0.25 and exponential[-1] == (4.0, 150)
+    assert TempoRamp(rest_bars=2).rest_beats(bpm=90, beats_per_bar=4) == 8
+    assert TempoRamp(rest_seconds=3.0).rest_beats(bpm=80, beats_per_bar=4) == 4.0
+    try:
+        TempoRamp(curve='sawtooth')
+        assert False
+    except ValueError:
+        pass
+
+
+def test_engine_tempo_ramp():
+    # Linear ramp over 12 beat loops, 1 bar of rest
+    engine, clock = make_engine(wait_for_first_hit=False, ramp=TempoRamp(curve='linear', step=12, rest_bars=1))
+    bot = BotPlayer().attach(engine)
+    simulate(engine, clock, duration=30.0)
+    assert engine.completed_loops >= 2
+    assert engine.misses == 0 and engine.score == bot.played
+    tempo = engine.tempo
+    # Every beat of a loop is 1 BPM faster, the rest and the next loop's first beat hold the tempo
+    loop_start = 1.0 + engine.lead_beats
+    assert tempo.bpm_at_beat(loop_start + 0.5) == 120
+    assert tempo.bpm_at_beat(loop_start + 1.5) == 121
+    assert tempo.bpm_at_beat(loop_start + 12.0) == 132
+    assert tempo.bpm_at_beat(loop_start + 16.5) == 132
+    assert tempo.bpm_at_beat(loop_start + 17.5) == 133
+    # Beat and time stay exact inverses along the whole compiled map
+    beats = np.arange(0.0, tempo.beats[-1], 0.25)
+    assert max(abs(tempo.beat_at(tempo.time_at(beat)) - beat) for beat in beats) < 1e-9
+    assert all(later > earlier for earlier, later in zip(tempo.times, tempo.times[1:]))
+    # The second loop's targets, 4 beats of rest after the first loop's 12, are spawned on whole beats
+    assert np.all(engine.targets['beat'] % 0.5 == 0.0)
+
+
+def test_entity_store():
+    store = EntityStore(capacity=8)
+    # Bars of 4 notes on alternating channels, culled as they go by: the arrays are reused, then grown for a burst
+    for bar in range(10):
+        store.spawn_targets(beats=bar * 4.0 + np.arange(4.0), channels=np.arange(4) % 2)
+        assert store.judge(channel=0, beat=bar * 4.0 + 0.05, window=0.1) >= 0
+        assert store.cull(before_beat=bar * 4.0) == (3 if bar > 0 else 0)
+    assert store.targets.capacity == 8
+    assert store.targets['id'].tolist() == [36, 37, 38, 39]
+    store.spawn_targets(beats=40.0 + np.arange(16) / 4.0, channels=np.zeros(16))
+    assert store.targets.capacity == 32
+    assert len(store.targets) == 20
+    # Nearest unjudged target on the channel, strictly within the window
+    assert store.judge(channel=1, beat=37.0, window=0.1) == store.targets.search(37.0)
+    assert store.judge(channel=1, beat=37.0, window=0.1) == -1
+    assert store.judge(channel=0, beat=40.95, window=0.1) == store.targets.search(41.0)
+    assert store.judge(channel=0, beat=40.5, window=0.25) == store.targets.search(40.5)
+    assert store.judge(channel=0, beat=40.125, window=0.125) == -1
+    # Attempts from late hits are inserted in beat order
+    for beat in (1.0, 3.0, 2.0):
+        store.spawn_attempt(beat=beat, channel=0, hit=False)
+    assert store.attempts['beat'].tolist() == [1.0, 2.0, 3.0]
+    # Lines are clicked once each, in order, however many are crossed at once
+    for beat_idx in range(6):
+        store.spawn_line(beat=float(beat_idx), beat_idx=beat_idx % 4)
+    assert store.click(current_beat=0.5) == [0]
+    assert store.click(current_beat=0.9) == []
+    assert store.click(current_beat=3.0) == [1, 2, 3]
+    store.cull(before_beat=2.5)
+    assert store.click(current_beat=10.0) == [0, 1]
+    # Channels past num_channels get their own index when their first target shows up
+    store = EntityStore(num_channels=4)
+    store.spawn_targets(beats=np.array([1.0, 2.0]), channels=np.array([4, 5], dtype=np.int8))
+    assert len(store.channel_targets) == 6
+    assert store.judge(channel=4, beat=1.0, window=0.1) == 0 and store.judge(channel=5, beat=2.0, window=0.1) == 1
+    assert store.judge(channel=6, beat=2.0, window=0.1) == -1
+    try:
+        store.spawn_targets(beats=np.array([3.0]), channels=np.array([-1]))
+        assert False
+    except ValueError:
+        pass
+    assert len(store.targets) == 2
+
+
+def make_engine(bpm=120, **kwargs):
+    exercise = Exercise(name='test exercise', patterns=[
+        Pattern(name='quarters', right_hand=[[0.0, 1.0, 2.0, 3.0]], left_foot=[[0.0, 2.0]], num_loops=2),
+        Pattern(name='eighths', left_hand=[[0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5]])])
+    clock = ManualClock()
+    engine = GameEngine(timeline=Timeline.compile(exercise), bpm=bpm, hit_window=0.1, clock=clock, **kwargs)
+    return engine, clock
+
+
+def simulate(engine, clock, duration, frame_time=1.0 / 60.0):
+    clicks = []
+    for _ in range(int(duration / frame_time)):
+        clock.advance(frame_time)
+        clicks.extend(engine.update())
+    return clicks
+
+
+def test_engine_headless_perfect_bot():
+    engine, clock = make_engine()
+    BotPlayer().attach(engine)
+    # The bot's count-in hit starts the game, then two bars of 6 notes and one of 8 make up a loop
+    clicks = simulate(engine, clock, duration=20.0)
+    assert engine.got_first_hit is True
+    assert engine.completed_loops >= 1
+    assert engine.misses == 0
+    assert engine.score >= 20
+    assert engine.max_combo == engine.score
+    assert engine.bpm == 120 + 5 * engine.completed_loops
+    assert clicks[:5] == [0, 1, 2, 3, 0]
+
+
+def test_engine_more_channels():
+    engine, clock = make_engine(num_channels=8)
+    # The same notes spread over channels 0, 2, 4 and 6, a bot playing them all has nothing to miss
+    engine.timeline.channels = engine.timeline.channels * 2
+    assert len(engine.entities.channel_targets) == 8
+    BotPlayer().attach(engine)
+    simulate(engine, clock, duration=20.0)
+    assert engine.misses == 0
+    assert engine.score >= 20
+    assert engine.max_combo == engine.score
+
+
+def test_engine_headless_misses():
+    engine, clock = make_engine(wait_for_first_hit=False)
+    simulate(engine, clock, duration=10.0)
+    # Nobody played, every target that scrolled off counts as a miss
+    assert engine.score == 0
+    assert engine.misses > 0
+    assert engine.combo == 0
+    engine, clock = make_engine(wait_for_first_hit=False)
+    bot = BotPlayer(miss_rate=0.5, seed=1).attach(engine)
+    simulate(engine, clock, duration=20.0)
+    assert engine.score == bot.played
+    assert engine.misses > 0
+    assert engine.max_combo < engine.score
+    # Keyboard misses always count
+    misses = engine.misses
+    assert engine.key_hit(channel=3) is False
+    assert engine.misses == misses + 1
+
+
+class ListInput:
+    def __init__(self):
+        self.hits = []
+
+    def drain_hits(self):
+        hits, self.hits = self.hits, []
+        return hits
+
+
+def test_fit_channel_offsets():
+    rng = np.random.default_rng(0)
+    latencies = [0.020, 0.035, 0.050, 0.065]
+    stimulus_times = np.arange(200) * 0.5
+    hit_times, hit_channels = [], []
+    for idx, stimulus_time in enumerate(stimulus_times):
+        channel = idx % 4
+        hit_times.append(stimulus_time + latencies[channel] + rng.normal(0.0, 0.004))
+        hit_channels.append(channel)
+        if idx % 10 == 0:
+            # A wild tap, and a double tap that must not count twice
+            hit_times.extend([stimulus_time + 0.2, stimulus_time + latencies[channel] + 0.1])
+            hit_channels.extend([channel, channel])
+    offsets, report = fit_channel_offsets(stimulus_times, hit_times, hit_channels)
+    assert np.allclose(offsets, latencies, atol=0.002)
+    assert all(fit['inliers'] <= 50 for fit in report)
+    assert all(fit['std_ms'] < 6.0 for fit in report)
+    # Too few taps leave the channel unfitted
+    offsets, report = fit_channel_offsets(stimulus_times, hit_times[:3], hit_channels[:3])
+    assert np.all(np.isnan(offsets)) and 'offset_ms' not in report[0]
+
+
+def test_calibrator():
+    clock, input_source = ManualClock(), ListInput()
+    calibrator = Calibrator('audio', input_source=input_source, clock=clock, period=0.5, num_stimuli=16,
+                            lead_in=1.0).start()
+    assert [calibrator.channel_of(idx) for idx in range(0, 16, 4)] == [0, 1, 2, 3]
+    presented = []
+    while not calibrator.is_done():
+        clock.advance(1.0 / 120.0)
+        for stimulus_idx in calibrator.update():
+            # The view gets to it a little late, and the player answers 30 ms after that
+            calibrator.presented_at(stimulus_idx, clock.now() + 0.005)
+            presented.append(stimulus_idx)
+            input_source.hits.append(Hit(hit_channel=calibrator.channel_of(stimulus_idx), hit_amplitude=80.0,
+                                         hit_time=clock.now() + 0.035))
+    calibrator.update()
+    assert presented == list(range(16))
+    offsets, report = calibrator.fit()
+    assert np.allclose(offsets, 0.030, atol=1e-9)
+
+
+def test_latency_calibration(tmp_path):
+    calibration = LatencyCalibration.for_rig('rig/one', calibration_dir=str(tmp_path))
+    assert calibration.input_offsets(4) == [0.0] * 4 and calibration.visual_lead == 0.0
+    calibration.update('audio', [0.02, 0.03, 0.04, 0.05], [{'hits': 16, 'inliers': 16}] * 4)
+    calibration.update('visual', [0.06, np.nan, 0.08, 0.09], [{'hits': 16, 'inliers': 16}] * 4)
+    # The channel without enough taps keeps its previous offset
+    calibration.update('audio', [np.nan, 0.01, np.nan, np.nan], [{'hits': 2, 'inliers': 2}] * 4)
+    assert calibration.audio_offsets == [0.02, 0.01, 0.04, 0.05]
+    assert calibration.visual_offsets == [0.06, 0.0, 0.08, 0.09]
+    fpath = calibration.save(calibration_dir=str(tmp_path))
+    loaded = LatencyCalibration.for_rig('rig/one', calibration_dir=str(tmp_path))
+    assert loaded.load(fpath).audio_offsets == loaded.audio_offsets == calibration.audio_offsets
+    assert loaded.input_offsets(6) == [0.02, 0.01, 0.04, 0.05, 0.0, 0.0]
+    assert abs(loaded.visual_lead - (0.0575 - 0.03)) < 1e-12
+    try:
+        calibration.update('haptic', [0.0], [{}])
+        assert False
+    except ValueError:
+        pass
+
+
+def test_engine_calibration():
+    latency = [0.060, 0.070, 0.080, 0.090]
+    # 60 ms or more late is out of a 50 ms window, every note is missed by an uncompensated rig
+    engine, clock = make_engine(wait_for_first_hit=False)
+    BotPlayer(latency=latency).attach(engine)
+    simulate(engine, clock, duration=10.0)
+    assert engine.score == 0 and engine.misses > 0
+    calibration = LatencyCalibration(audio_offsets=latency, visual_offsets=[offset + 0.02 for offset in latency])
+    engine, clock = make_engine(wait_for_first_hit=False, calibration=calibration)
+    BotPlayer(latency=latency).attach(engine)
+    simulate(engine, clock, duration=10.0)
+    assert engine.misses == 0 and engine.score > 0
+    # Rendering runs ahead by how much later the display is than the speakers
+    assert abs(engine.render_beat - engine.tempo.beat_at(clock.now() + 0.02)) < 1e-9
+    assert engine.render_beat > engine.current_beat
+
+
+def test_session_recorder(tmp_path):
+    engine, clock = make_engine(wait_for_first_hit=False)
+    bot = BotPlayer(miss_rate=0.5, seed=1).attach(engine)
+    recorder = SessionRecorder.for_engine(engine, str(tmp_path), 'test exercise', flush_rows=16)
+    simulate(engine, clock, duration=20.0)
+    engine.key_hit(channel=3)
+    recorder.close()
+    log = SessionLog(recorder.session_dir)
+    assert log.header['exercise'] == 'test exercise'
+    assert log.header['beats_per_bar'] == 4
+    assert log.header['rows']['judgements'] == len(log)
+    # Every target once, with consecutive ids, and every hit the bot played
+    targets = log['targets']
+    assert np.array_equal(targets['id'], np.arange(engine.targets.next_id))
+    assert len(log['hits']['time']) == bot.played
+    judgements = log['judgements']
+    kinds = np.bincount(judgements['kind'], minlength=len(JUDGEMENT_KINDS))
+    assert dict(zip(JUDGEMENT_KINDS, kinds.tolist())) == {'hit': engine.score, 'miss': 1, 'ignored': 0,
+                                                          'expired': engine.misses - 1}
+    hits = judgements['kind'] == JUDGEMENT_KINDS.index('hit')
+    assert np.all(np.abs(judgements['error'][hits]) < 1e-6)
+    assert np.array_equal(targets['channel'][judgements['target_id'][hits]], judgements['channel'][hits])
+    assert np.all(np.isnan(judgements['error'][~hits]))
+    # Tempo changes are logged as soon as their loop is compiled, ahead of the clock
+    tempo = log['tempo']
+    assert tempo['bpm'].tolist() == [120 + 5 * idx for idx in range(len(tempo['bpm']))]
+    assert np.count_nonzero(tempo['time'] <= clock.now()) == engine.completed_loops + 1
+
+
+def test_session_analytics(tmp_path):
+    for student, timing_error in (('ann', 0.0), ('bob', 0.02), ('bob', 0.02)):
+        engine, clock = make_engine(wait_for_first_hit=False)
+        BotPlayer(timing_error=timing_error, miss_rate=0.2, seed=len(student)).attach(engine)
+        recorder = SessionRecorder.for_engine(engine, str(tmp_path / student), 'test exercise', student=student)
+        simulate(engine, clock, duration=20.0)
+        recorder.close()
+    session_dirs = find_sessions(str(tmp_path))
+    assert len(session_dirs) == 3
+    students = summarize_sessions(session_dirs)
+    assert sorted(students) == ['ann', 'bob']
+    ann, bob = students['ann'].report(), students['bob'].report()
+    assert bob['sessions'] == 2
+    # The perfect bot lands every hit on the 1 ms bin around zero
+    assert ann['consistency']['std_ms'] < 1e-3
+    assert abs(ann['consistency']['p50_ms']) <= 1.0
+    assert 10.0 < bob['consistency']['std_ms'] < 30.0
+    assert bob['consistency']['p5_ms'] < 0.0 < bob['consistency']['p95_ms']
+    # Targets, hits and expiries add up over limbs and patterns
+    log = SessionLog(session_dirs[0])
+    single = TimingSummary.from_session(log).report()
+    kinds = np.bincount(log['judgements']['kind'], minlength=len(JUDGEMENT_KINDS))
+    assert sum(limb['hits'] for limb in single['channels'].values()) == kinds[0]
+    assert sum(limb['expired'] for limb in single['channels'].values()) == kinds[3]
+    assert sorted(single['patterns']) == ['eighths', 'quarters']
+    assert sum(pattern['hits'] + pattern['expired'] for pattern in single['patterns'].values()) == kinds[0] + kinds[3]
+    assert single['channels']['right_foot']['hits'] == 0
+    assert single['tempo']['bpm'][0] == 122.5
+    # A process pool merges to the same summaries
+    pooled = summarize_sessions(session_dirs, processes=1, chunksize=1)
+    assert np.array_equal(pooled['bob'].histogram, students['bob'].histogram)
+    assert pooled['bob'].report()['consistency'] == bob['consistency']
+
+
+class SpinningClock(ManualClock):
+    """
+    Manual clock where every read costs 10 us, so spin waits make progress
+    """
+
+    def now(self):
+        self.time += 1e-5
+        return self.time
+
+
+def test_rolling_histogram():
+    histogram = RollingHistogram(window=100)
+    for value in range(1, 1001):
+        histogram.record(value * 1e-5)
+    # Only the last 100 samples, 9.01 ms to 10 ms, are left in the counts
+    assert len(histogram) == 100 and sum(histogram.counts) == 100 and histogram.samples == 1000
+    assert histogram.max() == 1000 * 1e-5
+    assert abs(histogram.mean() - np.mean(np.arange(901, 1001) * 1e-5)) < 1e-12
+    p50, p95, p99 = histogram.percentiles()
+    # To within a bin, 20 a decade
+    for percentile, value in ((p50, 9.5e-3), (p95, 9.95e-3), (p99, 9.99e-3)):
+        assert abs(np.log10(percentile / value)) < 1.0 / 20.0
+    edges = histogram.bin_edges()
+    assert len(edges) == histogram.num_bins + 1 and edges[0] == 1e-6 and abs(edges[-1] / 1.0 - 1.0) < 0.2
+
+
+def test_frame_profiler(tmp_path):
+    now = [0.0]
+    profiler = FrameProfiler(window=64, export_fpath=str(tmp_path / 'profile.csv'), export_interval=1.0,
+                             timer=lambda: now[0])
+    for frame in range(120):
+        with profiler.phase('update'):
+            now[0] += 0.002
+        with profiler.phase('draw'):
+            now[0] += 0.004 if frame % 10 else 0.030
+        profiler.gauge('targets', frame % 7)
+        now[0] += 0.010
+        profiler.end_frame()
+    report = profiler.report()
+    assert report['frames'] == 120
+    assert list(report['phases']) == ['update', 'draw', 'frame_interval']
+    assert abs(report['phases']['update']['p50'] - 2.0) < 0.2
+    assert abs(report['phases']['draw']['max'] - 30.0) < 1e-9 and report['phases']['draw']['p99'] > 20.0
+    assert report['gauges']['targets']['max'] == 6 and report['gauges']['targets']['last'] == 119 % 7
+    # Exported every second of the 2 s the frames took, one row per phase and gauge each time
+    rows = (tmp_path / 'profile.csv').read_text().splitlines()
+    assert rows[0].startswith('time,frames,kind,name') and len(rows) == 1 + profiler.exports * 4
+    assert profiler.exports == 2
+    profiler.export(fpath=str(tmp_path / 'profile.json'))
+    with open(tmp_path / 'profile.json') as fp:
+        exported = json.load(fp)
+    assert sum(exported['histograms']['draw']['counts']) == 64
+    assert exported['gauges']['targets']['last'] == report['gauges']['targets']['last']
+    # Disabled, nothing is timed or counted
+    profiler = FrameProfiler(enabled=False)
+    assert profiler.phase('update') is NULL_SCOPE
+    with profiler.phase('update'):
+        profiler.gauge('targets', 1)
+        profiler.end_frame()
+    assert profiler.report() == {'frames': 0, 'phases': {}, 'gauges': {}}
+
+
+def test_engine_profiler():
+    profiler = FrameProfiler()
+    engine, clock = make_engine(profiler=profiler)
+    BotPlayer().attach(engine)
+    simulate(engine, clock, duration=5.0)
+    assert set(profiler.histograms) == {'inputs', 'objects'}
+    assert len(profiler.histograms['inputs']) > 200
+
+
+def test_frame_scheduler():
+    clock = SpinningClock()
+    scheduler = FrameScheduler(logic_rate=1000.0, target_fps=100.0, clock=clock,
+                               sleep=clock.advance)
+    logic_times, frame_times = [], []
+
+    def logic(now):
+        logic_times.append(now)
+        return now < 1.0
+
+    scheduler.run(logic=logic, render=lambda: frame_times.append(clock.time))
+    assert 990 <= len(logic_times) <= 1010
+    assert 99 <= len(frame_times) <= 102
+    # Every tick lands within the spin resolution of its deadline, most of the wait was slept
+    assert all(abs(tick - idx * 0.001) < 1e-4 for idx, tick in enumerate(logic_times))
+    stats = scheduler.stats()
+    assert stats['missed_logic'] == 0 and stats['missed_frames'] == 0
+    assert stats['sleep_fraction'] > 0.3
+    # A stall longer than a period is reported once and the schedule realigns instead of bursting
+    clock.advance(0.05)
+    scheduler.step(logic=lambda now: None, render=lambda: None)
+    scheduler.step(logic=lambda now: None, render=lambda: None)
+    assert scheduler.stats()['missed_logic'] == 1
+    assert scheduler.stats()['missed_frames'] == 1
+    assert scheduler.next_logic_time > clock.time
+    # Slow wakeups early on cannot push the spin window past half a logic period: the loop keeps sleeping, so it
+    # keeps measuring, and the window shrinks back once they have aged out
+    clock = SpinningClock()
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.advance(seconds + (0.0015 if len(sleeps) <= 16 else 0.00005))
+
+    scheduler = FrameScheduler(logic_rate=1000.0, target_fps=100.0, clock=clock, sleep=sleep)
+    scheduler.run(logic=lambda now: now < 1.0, render=lambda: None)
+    assert scheduler.spin_threshold < 2e-4
+    assert scheduler.stats()['sleep_fraction'] > 0.3
+
+
+def run_vsync(refresh_rate, draw_time=0.001):
+    clock = SpinningClock()
+    scheduler = FrameScheduler(logic_rate=1000.0, vsync=True, clock=clock, sleep=clock.advance,
+                               refresh_rate=refresh_rate)
+    logic_times, flip_times = [], []
+
+    def logic(now):
+        logic_times.append(now)
+        return now < 1.0
+
+    def render():
+        # Drawing, then the flip blocks until the next 60 Hz refresh
+        clock.advance(draw_time)
+        clock.time = (math.floor(clock.time * 60.0) + 1) / 60.0
+        flip_times.append(clock.time)
+
+    scheduler.run(logic=logic, render=render)
+    return scheduler, np.array(logic_times), np.array(flip_times)
+
+
+def test_frame_scheduler_vsync():
+    # The blocking flips no longer set the logic rate, only the first flip, which finds the refresh, holds it up
+    scheduler, logic_times, flip_times = run_vsync(refresh_rate=60.0)
+    assert 975 <= len(logic_times) <= 1010
+    assert 59 <= len(flip_times) <= 61
+    stats = scheduler.stats()
+    assert stats['missed_logic'] == 1 and stats['missed_frames'] == 0
+    # After that, ticks held up by a flip are taken late, within the margin the frame is started ahead of the refresh
+    assert np.all(np.diff(logic_times[logic_times > flip_times[0]]) < scheduler.vsync_margin + 0.0015)
+    # A refresh is never skipped
+    assert np.allclose(np.diff(flip_times), 1.0 / 60.0)
+    # Without the refresh rate, the first frames are flipped back to back to measure it
+    scheduler, logic_times, flip_times = run_vsync(refresh_rate=None)
+    assert abs(scheduler.refresh_period - 1.0 / 60.0) < 1e-9
+    assert 950 <= len(logic_times) <= 1010
+    assert scheduler.stats()['missed_logic'] <= 3 and scheduler.stats()['missed_frames'] == 0
+    assert np.allclose(np.diff(flip_times), 1.0 / 60.0)
+    # Drawing for longer than the margin overruns a few refreshes, until the margin has grown past it
+    scheduler, logic_times, flip_times = run_vsync(refresh_rate=60.0, draw_time=0.004)
+    assert 1 <= scheduler.stats()['missed_frames'] <= 5 and scheduler.vsync_margin > 0.004
+    assert np.allclose(np.diff(flip_times[-30:]), 1.0 / 60.0)
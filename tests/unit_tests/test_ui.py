@@ -0,0 +1,178 @@
+import os
+import numpy as np
+import pygame
+import pytest
+from metronome.arduino.hits import Hit
+from metronome.game.bot import BotPlayer
+from metronome.game.calibration import LatencyCalibration
+from metronome.game.clock import ManualClock
+from metronome.game.profiler import FrameProfiler
+from config import Config
+from metronome.ui.calibration import CalibrationUI
+from metronome.ui.colors import *
+from metronome.ui.scrolling import GameUI
+from metronome.ui.sprites import SpriteAtlas, TARGET_RADIUS
+from metronome.ui.text_cache import HudText, TextCache, render_text
+
+
+class IdleInput:
+    running = True
+
+    def drain_hits(self):
+        return []
+
+
+class AnsweringInput:
+    """
+    Taps every stimulus a calibration view reports as presented, latency seconds later
+    """
+    running = True
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calibration_ui = None
+        self.answered = set()
+
+    def drain_hits(self):
+        calibrator = self.calibration_ui.calibrator
+        hits = []
+        for stimulus_idx in np.flatnonzero(~np.isnan(calibrator.presented)).tolist():
+            if (calibrator.mode, stimulus_idx) not in self.answered:
+                self.answered.add((calibrator.mode, stimulus_idx))
+                hits.append(Hit(hit_channel=calibrator.channel_of(stimulus_idx), hit_amplitude=80.0,
+                                hit_time=calibrator.presented[stimulus_idx] + self.latency[calibrator.mode]))
+        return hits
+
+
+def init_display(size=(1800, 1000)):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.init()
+    pygame.mixer.init()
+    return pygame.display.set_mode(size)
+
+
+@pytest.fixture
+def make_game(monkeypatch, tmp_path):
+    """
+    GameUI factory whose session logs, if any, go to tmp_path. Every game made is closed after the test.
+    """
+    monkeypatch.setattr(Config, 'SESSION_DIR', str(tmp_path / 'sessions'))
+    games = []
+
+    def make(window, full_flip, profiler=None):
+        game = GameUI(window=window, hit_collector=IdleInput(), exercise_name='Hand-To-Hand (Simplified)', bpm=120,
+                      beats_on_screen=8, profiler=profiler, calibration=None)
+        games.append(game)
+        game.compositor.full_flip = full_flip
+        clock = ManualClock()
+        game.engine.clock = clock
+        BotPlayer(timing_error=0.01, seed=0).attach(game.engine)
+        return game, clock
+
+    yield make
+    for game in games:
+        game.close()
+
+
+def test_dirty_rects_match_full_redraw(make_game):
+    window = init_display()
+    dirty_game, dirty_clock = make_game(window, full_flip=False)
+    full_game, full_clock = make_game(pygame.Surface(window.get_size()), full_flip=True)
+    for frame in range(240):
+        for game, clock in ((dirty_game, dirty_clock), (full_game, full_clock)):
+            clock.advance(1.0 / 60.0)
+            game.update_and_draw()
+        if frame % 20 == 0:
+            # Restoring the background under last frame's objects leaves exactly what a full redraw would
+            assert pygame.image.tostring(window, 'RGB') == pygame.image.tostring(full_game.window, 'RGB')
+    assert dirty_game.engine.score > 0
+    stats = dirty_game.compositor.stats()
+    assert stats['full_frames'] < stats['frames'] // 2
+    assert stats['mean_pushed_fraction'] < 0.5
+    pygame.quit()
+
+
+def test_text_cache():
+    init_display(size=(200, 100))
+    cache = TextCache(max_surfaces=2)
+    assert cache.font(24) is cache.font(24)
+    first = cache.render("R", 24, (0, 0, 0))
+    assert cache.render("R", 24, (0, 0, 0)) is first
+    cache.render("L", 24, (0, 0, 0))
+    cache.render("1", 36, (255, 255, 255))
+    # "R" was the least recently used surface
+    assert cache.render("R", 24, (0, 0, 0)) is not first
+    assert cache.stats() == {'fonts': 2, 'surfaces': 2, 'hits': 1, 'misses': 4}
+    hud = HudText(size=24, topright=(190, 10))
+    assert hud.set("Score: 0") is True
+    assert hud.set("Score: 0") is False
+    assert hud.rect.right == 190
+    assert hud.set("Score: 0", color=(255, 40, 40), topleft=(10, 10)) is True
+    assert hud.rect.left == 10
+    assert hud.renders == 2
+    pygame.quit()
+
+
+def test_sprites_match_direct_draw():
+    window = init_display(size=(100, 100))
+    atlas = SpriteAtlas()
+    for channel, hit in ((0, False), (1, False), (2, True)):
+        direct = pygame.Surface((100, 100)).convert()
+        direct.fill(GRAY)
+        pygame.draw.circle(direct, LIGHT_BLUE, (50, 50), 12)
+        if hit is True:
+            pygame.draw.circle(direct, BLACK, (50, 50), 10)
+        else:
+            direct.blit(render_text("R" if channel % 2 == 0 else "L", 24, BLACK), (44, 43))
+        window.fill(GRAY)
+        window.blits([(atlas.target(channel, hit), (50 - TARGET_RADIUS, 50 - TARGET_RADIUS))])
+        # Antialiased label edges may round differently by a level depending on the blend path
+        difference = np.abs(pygame.surfarray.array3d(window).astype(int) - pygame.surfarray.array3d(direct))
+        assert difference.max() <= 2
+    pygame.quit()
+
+
+def test_calibration_ui():
+    window = init_display()
+    clock = ManualClock()
+    input_source = AnsweringInput(latency={'audio': 0.03, 'visual': 0.05})
+    calibration_ui = CalibrationUI(window=window, hit_collector=input_source,
+                                   calibration=LatencyCalibration(rig='test'), clock=clock, num_stimuli=16,
+                                   lead_in=0.5, period=0.25)
+    input_source.calibration_ui = calibration_ui
+    frames = 0
+    while calibration_ui.finished is False and frames < 1000:
+        clock.advance(1.0 / 60.0)
+        calibration_ui.update()
+        calibration_ui.draw()
+        frames += 1
+    assert calibration_ui.finished is True
+    calibration = calibration_ui.calibration
+    assert np.allclose(calibration.audio_offsets, 0.03) and np.allclose(calibration.visual_offsets, 0.05)
+    assert abs(calibration.visual_lead - 0.02) < 1e-9
+    pygame.quit()
+
+
+def test_profiler_overlay(make_game, monkeypatch, tmp_path):
+    window = init_display()
+    monkeypatch.setattr(Config, 'PROFILE_OVERLAY', True)
+    monkeypatch.setattr(Config, 'RECORD_SESSIONS', True)
+    game, clock = make_game(window, full_flip=False, profiler=FrameProfiler())
+    assert game.overlay is not None
+    for _ in range(120):
+        clock.advance(1.0 / 60.0)
+        game.update_and_draw()
+    report = game.profiler.report()
+    assert report['frames'] == 120
+    assert {'inputs', 'objects', 'draw_objects', 'hud', 'overlay', 'flip', 'frame_interval'} <= set(report['phases'])
+    assert report['gauges']['targets']['max'] > 0 and report['gauges']['lines']['last'] > 0
+    # A line per phase and gauge plus the frame count, drawn in the bottom-left corner
+    game.overlay.refresh()
+    line_height = game.overlay.font.get_linesize()
+    assert game.overlay.rect.height == line_height * (1 + len(report['phases']) + len(report['gauges']))
+    assert game.overlay.rect.bottomleft == (10, window.get_height() - 10)
+    # Recording was turned on for this game only, its session goes under tmp_path
+    game.close()
+    assert os.path.dirname(game.recorder.session_dir) == str(tmp_path / 'sessions')
+    pygame.quit()